@@ -0,0 +1,123 @@
+"""Benchmark thông lượng đăng ký/đăng nhập theo profile SQLite (xem source/server/db_profile.py).
+
+Chạy từ thư mục gốc repo:
+    python -m source.benchmarks.bench_auth_db                      # so sánh mọi profile
+    python -m source.benchmarks.bench_auth_db --profile tuned --mode db --threads 16
+
+Chế độ:
+  http : POST /register rồi /login qua Flask test client (gồm cả thời gian hash mật khẩu)
+  db   : chỉ phần DB của register/login (insert User + truy vấn theo username), hash tính sẵn
+
+Mỗi profile chạy trong một process riêng với file DB tạm, vì socketio/db là global.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def run_profile(profile, mode, threads, users):
+    """Chạy workload cho một profile, trả về dict kết quả"""
+    from werkzeug.security import generate_password_hash
+    from source.server import create_app
+    from source.server.extensions import db
+    from source.server.models import User
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench_db_')
+    app = create_app({
+        'TESTING': True,
+        'DB_PROFILE': profile,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    })
+    password_hash = generate_password_hash('secret1')
+
+    errors = []
+    ok = [0]
+    lock = threading.Lock()
+
+    def http_worker(idx):
+        client = app.test_client()
+        for i in range(idx, users, threads):
+            name = f"bench_{i}"
+            r1 = client.post('/register', json={'username': name, 'password': 'secret1'})
+            r2 = client.post('/login', json={'username': name, 'password': 'secret1'})
+            good = r1.get_json().get('success') and r2.get_json().get('success')
+            with lock:
+                if good:
+                    ok[0] += 1
+                else:
+                    errors.append(r1.get_json().get('message') or r2.get_json().get('message'))
+
+    def db_worker(idx):
+        for i in range(idx, users, threads):
+            with app.app_context():
+                try:
+                    db.session.add(User(username=f"bench_{i}", password_hash=password_hash))
+                    db.session.commit()
+                    User.query.filter_by(username=f"bench_{i}").first()
+                    with lock:
+                        ok[0] += 1
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        errors.append(f"{type(e).__name__}: {str(e)[:80]}")
+
+    worker = http_worker if mode == 'http' else db_worker
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'profile': profile,
+        'mode': mode,
+        'threads': threads,
+        'users': users,
+        'ok': ok[0],
+        'errors': len(errors),
+        'locked_errors': sum(1 for e in errors if 'locked' in (e or '')),
+        'seconds': round(elapsed, 3),
+        'ops_per_sec': round(ok[0] / elapsed, 1) if elapsed else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', default='all', help="default | tuned | all")
+    parser.add_argument('--mode', default='db', choices=['db', 'http'])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--users', type=int, default=400)
+    parser.add_argument('--json', action='store_true', help="In kết quả dạng JSON (một dòng)")
+    args = parser.parse_args()
+
+    if args.profile != 'all':
+        result = run_profile(args.profile, args.mode, args.threads, args.users)
+        print(json.dumps(result) if args.json else result)
+        return
+
+    from source.server.db_profile import DB_PROFILES
+    results = []
+    for profile in DB_PROFILES:
+        cmd = [sys.executable, '-m', 'source.benchmarks.bench_auth_db', '--profile', profile,
+               '--mode', args.mode, '--threads', str(args.threads), '--users', str(args.users), '--json']
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{'profile':<10}{'mode':<6}{'ok':>7}{'errors':>8}{'locked':>8}{'sec':>9}{'ops/s':>10}")
+    for r in results:
+        print(f"{r['profile']:<10}{r['mode']:<6}{r['ok']:>7}{r['errors']:>8}{r['locked_errors']:>8}"
+              f"{r['seconds']:>9}{r['ops_per_sec']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""Micro-benchmark các đường nóng của game_logic với dữ liệu tổng hợp.
+
+Mỗi benchmark chạy với kích thước 10 .. 100k (số phòng hoặc số câu hỏi), đo
+thời gian/lần gọi (lấy min của nhiều lần lặp để giảm nhiễu). Kết quả có thể
+lưu thành baseline JSON và so sánh với baseline đã lưu: chậm hơn quá
+--threshold thì bị đánh dấu và exit code khác 0.
+
+Chạy từ thư mục gốc repo:
+    python -m source.benchmarks.bench_game_logic
+    python -m source.benchmarks.bench_game_logic --save baseline.json
+    python -m source.benchmarks.bench_game_logic --compare baseline.json --threshold 0.25
+    python -m source.benchmarks.bench_game_logic --only check_answer,get_room_list --sizes 10,1000
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmark chỉ đo engine trong memory: không ghi lịch sử câu trả lời cũ xuống DB
+# (phải đặt trước khi import source.server.answer_log)
+os.environ.setdefault('ANSWER_LOG_SPILL', '0')
+
+# Mỗi lần lặp chạy đủ số lần gọi để tốn ít nhất chừng này giây
+MIN_REPEAT_SECONDS = 0.05
+REPEATS = 5
+
+
+def write_questions_csv(path, count):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'prompt', 'answer', 'media', 'type', 'category', 'difficulty'])
+        for i in range(1, count + 1):
+            writer.writerow([i, f'Câu hỏi {i}', f'Đáp án số {i}', '', 'text',
+                             ('động vật', 'địa danh', 'từ vựng')[i % 3], ('dễ', 'khó')[i % 2]])
+
+
+class Fixture:
+    """Dựng dữ liệu tổng hợp trong các biến toàn cục của game_logic và dọn lại sau khi đo"""
+
+    def __init__(self, tmp_dir):
+        import source.server.game_logic as game_logic
+        from source.server.question_bank import QuestionBank
+
+        self.gl = game_logic
+        self.tmp_dir = tmp_dir
+        self._banks = {}
+        self._original_bank = game_logic.question_bank
+        self._QuestionBank = QuestionBank
+
+    def bank(self, size):
+        """QuestionBank với size câu hỏi (cache theo size) và gán làm ngân hàng của game_logic"""
+        bank = self._banks.get(size)
+        if bank is None:
+            path = os.path.join(self.tmp_dir, f'questions_{size}.csv')
+            write_questions_csv(path, size)
+            bank = self._QuestionBank(path)
+            bank.reload()
+            self._banks[size] = bank
+        self.gl.question_bank = bank
+        return bank
+
+    def rooms(self, count, players_per_room=2):
+        """Tạo count phòng, mỗi phòng players_per_room người chơi"""
+        gl = self.gl
+        rooms = []
+        for i in range(count):
+            room_id = f'bench_{i}'
+            room = gl.GameRoom(room_id)
+            gl.game_rooms[room_id] = room
+            for j in range(players_per_room):
+                room.add_player(f'sid_{i}_{j}', f'player_{j}')
+            rooms.append(room)
+        gl.get_room_list()
+        gl.drain_room_list_changes()
+        return rooms
+
+    def started_room(self, bank_size):
+        self.bank(bank_size)
+        room = self.rooms(1)[0]
+        room.start_game(seed=1)
+        return room
+
+    def cleanup(self):
+        gl = self.gl
+        for room_id in list(gl.game_rooms):
+            gl._drop_room(room_id)
+        gl.drain_room_list_changes()
+        gl.question_bank = self._original_bank
+
+
+# --- Các benchmark: nhận (fixture, size), trả về hàm không tham số để đo ---
+
+def bench_check_answer(fx, size):
+    """check_answer với câu sai có dấu/khoảng trắng (ngân hàng size câu hỏi)"""
+    room = fx.started_room(size)
+    return lambda: room.check_answer('sid_0_1', '  Đáp  ÁN sai ')
+
+
+def bench_next_round(fx, size):
+    """next_round (chọn câu hỏi + dựng dữ liệu vòng) với ngân hàng size câu hỏi"""
+    room = fx.started_room(size)
+
+    def op():
+        if room.current_round >= room.max_rounds - 1:
+            room.current_round = 0
+        room.next_round()
+    return op
+
+
+def bench_reset_question_pool(fx, size):
+    """_reset_question_pool (rút câu hỏi cho cả ván) với ngân hàng size câu hỏi"""
+    room = fx.started_room(size)
+    return room._reset_question_pool
+
+
+def bench_get_room_list(fx, size):
+    """get_room_list sau khi một phòng đổi trạng thái (size phòng)"""
+    rooms = fx.rooms(size)
+    gl = fx.gl
+    state = {'i': 0}
+
+    def op():
+        room = rooms[state['i'] % len(rooms)]
+        state['i'] += 1
+        room.add_player('bench_extra', 'extra')
+        room.remove_player('bench_extra')
+        gl.get_room_list()
+    return op
+
+
+def bench_get_room_list_cached(fx, size):
+    """get_room_list khi danh sách không đổi (size phòng)"""
+    fx.rooms(size)
+    return fx.gl.get_room_list
+
+
+def bench_remove_player_from_room(fx, size):
+    """Thêm rồi remove_player_from_room một người chơi (size phòng)"""
+    rooms = fx.rooms(size)
+    gl = fx.gl
+    state = {'i': 0}
+
+    def op():
+        room = rooms[state['i'] % len(rooms)]
+        state['i'] += 1
+        room.add_player('bench_leaver', 'leaver')
+        gl.remove_player_from_room('bench_leaver')
+    return op
+
+
+def bench_load_questions_from_file(fx, size):
+    """load_questions_from_file (parse lại CSV size câu hỏi)"""
+    fx.bank(size)
+    return fx.gl.load_questions_from_file
+
+
+BENCHMARKS = {
+    'check_answer': bench_check_answer,
+    'next_round': bench_next_round,
+    'reset_question_pool': bench_reset_question_pool,
+    'get_room_list': bench_get_room_list,
+    'get_room_list_cached': bench_get_room_list_cached,
+    'remove_player_from_room': bench_remove_player_from_room,
+    'load_questions_from_file': bench_load_questions_from_file,
+}
+
+
+def measure(op):
+    """Thời gian/lần gọi (ns): min và median của REPEATS lần lặp"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_REPEAT_SECONDS or number >= 1 << 20:
+            break
+        number *= 4
+    samples = [elapsed / number]
+    for _ in range(REPEATS - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        samples.append((time.perf_counter() - start) / number)
+    return {'ns_per_op': round(min(samples) * 1e9, 1), 'median_ns': round(statistics.median(samples) * 1e9, 1),
+            'calls': number}
+
+
+def run(names, sizes):
+    from source.server import create_app
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench_gl_') as tmp_dir:
+        # App thật (DB tạm) để các phần phụ như write-behind metadata phòng chạy như khi phục vụ
+        # LOG_LEVEL WARNING: log của game_logic không làm sai kết quả đo; không snapshot phòng xuống đĩa
+        create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+                    'LOG_LEVEL': 'WARNING', 'ROOM_SNAPSHOT_DIR': ''})
+        fx = Fixture(tmp_dir)
+        for name in names:
+            for size in sizes:
+                try:
+                    op = BENCHMARKS[name](fx, size)
+                    results[f'{name}[{size}]'] = measure(op)
+                finally:
+                    fx.cleanup()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """So sánh với baseline, trả về list (tên, baseline ns, hiện tại ns, tỉ lệ, bị chậm)"""
+    rows = []
+    for key, current in results.items():
+        base = baseline.get('results', {}).get(key)
+        if not base:
+            continue
+        ratio = current['ns_per_op'] / base['ns_per_op'] if base['ns_per_op'] else 1.0
+        rows.append((key, base['ns_per_op'], current['ns_per_op'], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def format_ns(ns):
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f} µs"
+    return f"{ns:.0f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,1000,100000', help="Số phòng/câu hỏi, cách nhau bởi dấu phẩy")
+    parser.add_argument('--only', default=None, help=f"Chỉ chạy các benchmark: {','.join(BENCHMARKS)}")
+    parser.add_argument('--save', metavar='PATH', help="Lưu kết quả thành baseline JSON")
+    parser.add_argument('--compare', metavar='PATH', help="So sánh với baseline JSON đã lưu")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Đánh dấu chậm đi khi chậm hơn baseline quá tỉ lệ này (0.25 = 25%%)")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Không có benchmark: {', '.join(unknown)}")
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    results = run(names, sizes)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S')
+        },
+        'results': results
+    }
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1, ensure_ascii=False)
+
+    rows = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.threshold)
+        report['comparison'] = {
+            'baseline_revision': baseline.get('meta', {}).get('revision'),
+            'slower': [key for key, _, _, _, slow in rows if slow]
+        }
+
+    if args.json:
+        print(json.dumps(report))
+    elif rows is None:
+        print(f"{'benchmark':<36}{'min/op':>12}{'median/op':>12}")
+        for key, r in results.items():
+            print(f"{key:<36}{format_ns(r['ns_per_op']):>12}{format_ns(r['median_ns']):>12}")
+    else:
+        print(f"so với baseline {report['comparison']['baseline_revision']} (ngưỡng +{args.threshold:.0%})")
+        print(f"{'benchmark':<36}{'baseline':>12}{'hiện tại':>12}{'tỉ lệ':>8}")
+        for key, base, current, ratio, slow in rows:
+            print(f"{key:<36}{format_ns(base):>12}{format_ns(current):>12}{ratio:>7.2f}x"
+                  f"{'  CHẬM HƠN' if slow else ''}")
+
+    if rows and any(slow for *_, slow in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""Load test end-to-end: mô phỏng N người chơi qua toàn bộ luồng của server.
+
+Mỗi người chơi là một greenlet với Flask test client + Socket.IO test client
+(chạy offline trong cùng process, không cần mạng):
+  /register, /login -> chủ phòng /create_room, mọi người join_room
+  -> chủ phòng start_game -> submit_answer và send_chat_message xen kẽ
+  -> leave_room hoặc ngắt kết nối
+
+Báo cáo số event/giây, độ trễ p50/p99 theo loại event (thời gian server xử lý
+xong một emit/request) và bộ nhớ của game_logic.game_rooms theo từng giai đoạn.
+
+Chạy từ thư mục gốc repo:
+    python -m source.benchmarks.bench_load
+    python -m source.benchmarks.bench_load --players 2000 --room-size 8 --json > load.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def rooms_size(game_rooms):
+    """Ước lượng bộ nhớ (byte) của các phòng trong game_rooms
+
+    Đi qua slots của GameRoom, người chơi và lịch sử câu trả lời; bỏ qua
+    snapshot ngân hàng câu hỏi và câu hỏi hiện tại (dùng chung giữa các phòng).
+    """
+    shared = {'questions', 'current_question'}
+    seen = set()
+
+    def size(obj):
+        if id(obj) in seen or obj is None or isinstance(obj, (bool, int, float)) and -5 <= obj <= 256:
+            return 0
+        seen.add(id(obj))
+        total = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            total += sum(size(k) + size(v) for k, v in obj.items())
+        elif isinstance(obj, (list, tuple, set, frozenset)) or type(obj).__name__ == 'deque':
+            total += sum(size(item) for item in obj)
+        elif hasattr(obj, '__slots__'):
+            total += sum(size(getattr(obj, name, None)) for name in type(obj).__slots__ if name not in shared)
+        return total
+
+    return sum(size(room_id) + size(room) for room_id, room in game_rooms.items())
+
+
+def run(args):
+    """Chạy toàn bộ kịch bản, trả về dict kết quả; xóa thư mục DB tạm khi xong"""
+    tmp_dir = tempfile.mkdtemp(prefix='bench_load_')
+    try:
+        return _run(args, tmp_dir)
+    finally:
+        from source.server.persistence import room_store
+        from source.server.answer_log import answer_spill
+        from source.server.leaderboard import leaderboard
+        # Ghi nốt bộ đệm trước khi xóa DB để flush lúc tắt không còn gì phải ghi
+        for store in (room_store, answer_spill, leaderboard):
+            store.flush(offload=False)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _run(args, tmp_dir):
+    import eventlet
+    from source.server import create_app, socketio
+    import source.server.game_logic as game_logic
+
+    rng = random.Random(args.seed)
+    # LOG_LEVEL WARNING: log từng sự kiện không làm sai kết quả đo; không snapshot phòng xuống đĩa
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+        'PASSWORD_HASH_METHOD': args.hash_method,
+        'RATE_LIMIT_ENABLED': args.rate_limit,
+        'LOG_LEVEL': 'WARNING',
+        'ROOM_SNAPSHOT_DIR': ''
+    })
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    memory = []
+
+    def timed(name, fn, *a, **kw):
+        start = time.perf_counter()
+        try:
+            return fn(*a, **kw)
+        except Exception:
+            errors[name] += 1
+        finally:
+            latencies[name].append((time.perf_counter() - start) * 1000)
+
+    def snapshot_memory(phase):
+        memory.append({
+            'phase': phase,
+            'rooms': len(game_logic.game_rooms),
+            'players': sum(len(r.players) for r in game_logic.game_rooms.values()),
+            'rooms_bytes': rooms_size(game_logic.game_rooms),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        })
+
+    rooms = [f"load_{i}" for i in range((args.players + args.room_size - 1) // args.room_size)]
+    players = []  # (index, room_id, is_host)
+    for i in range(args.players):
+        players.append((i, rooms[i // args.room_size], i % args.room_size == 0))
+
+    sessions = {}
+
+    def connect(player):
+        i, room_id, is_host = player
+        client = app.test_client()
+        name = f"load_{i}"
+        timed('register', client.post, '/register', json={'username': name, 'password': 'secret1'})
+        r = timed('login', client.post, '/login', json={'username': name, 'password': 'secret1'})
+        if r is None or not r.get_json().get('success'):
+            errors['login'] += 1
+            return
+        if is_host:
+            timed('create_room', client.post, '/create_room', json={'room_id': room_id})
+        sessions[i] = (client, socketio.test_client(app, flask_test_client=client))
+
+    def join(player):
+        i, room_id, _ = player
+        if i in sessions:
+            timed('join_room', sessions[i][1].emit, 'join_room', {'room_id': room_id})
+
+    def play(player):
+        i, room_id, is_host = player
+        if i not in sessions:
+            return
+        sock = sessions[i][1]
+        player_rng = random.Random(args.seed * 100003 + i)
+        actions = ['submit_answer'] * args.answers + ['send_chat_message'] * args.chats
+        player_rng.shuffle(actions)
+        for action in actions:
+            if action == 'submit_answer':
+                room = game_logic.get_room(room_id)
+                question = room.current_question if room else None
+                if question and player_rng.random() < args.correct_rate:
+                    answer = question['answer']
+                else:
+                    answer = f"sai {player_rng.random()}"
+                timed('submit_answer', sock.emit, 'submit_answer', {'room_id': room_id, 'answer': answer})
+            else:
+                timed('send_chat_message', sock.emit, 'send_chat_message',
+                      {'room_id': room_id, 'message': f"chat {i}"})
+            # Nhường event loop để các người chơi xen kẽ như client thật
+            eventlet.sleep(0)
+            sock.get_received()
+
+    def leave(player):
+        i, room_id, _ = player
+        if i not in sessions:
+            return
+        sock = sessions[i][1]
+        if rng.random() < 0.5:
+            timed('leave_room', sock.emit, 'leave_room', {'room_id': room_id})
+        timed('disconnect', sock.disconnect)
+
+    pool = eventlet.GreenPool(args.concurrency)
+    snapshot_memory('start')
+
+    phase_times = {}
+    start = time.perf_counter()
+    list(pool.imap(connect, players))
+    phase_times['connect'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    list(pool.imap(join, players))
+    phase_times['join'] = time.perf_counter() - start
+    snapshot_memory('joined')
+
+    start = time.perf_counter()
+    for player in players:
+        i, room_id, is_host = player
+        if is_host and i in sessions:
+            timed('start_game', sessions[i][1].emit, 'start_game', {'room_id': room_id})
+    phase_times['start_game'] = time.perf_counter() - start
+    snapshot_memory('started')
+
+    start = time.perf_counter()
+    list(pool.imap(play, players))
+    phase_times['play'] = time.perf_counter() - start
+    snapshot_memory('played')
+
+    start = time.perf_counter()
+    rng.shuffle(players)
+    list(pool.imap(leave, players))
+    phase_times['leave'] = time.perf_counter() - start
+    snapshot_memory('left')
+
+    events = {name: {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+        'max_ms': round(max(values), 3),
+        'errors': errors.get(name, 0)
+    } for name, values in sorted(latencies.items())}
+    play_events = events.get('submit_answer', {}).get('count', 0) + events.get('send_chat_message', {}).get('count', 0)
+    result = {
+        'players': args.players,
+        'room_size': args.room_size,
+        'rooms': len(rooms),
+        'play_events_per_sec': round(play_events / phase_times['play'], 1) if phase_times['play'] else 0.0,
+        'phase_seconds': {k: round(v, 3) for k, v in phase_times.items()},
+        'events': events,
+        'memory': memory,
+        'errors': sum(errors.values())
+    }
+    return result
+
+
+def print_result(args, result):
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"players: {args.players}, rooms: {result['rooms']} x {args.room_size}, "
+              f"play: {result['play_events_per_sec']} events/s")
+        print("phase seconds: " + ", ".join(f"{k} {v}" for k, v in result['phase_seconds'].items()))
+        print(f"{'event':<20}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+        for name, e in result['events'].items():
+            print(f"{name:<20}{e['count']:>8}{e['p50_ms']:>10}{e['p99_ms']:>10}{e['max_ms']:>10}{e['errors']:>8}")
+        print(f"{'phase':<10}{'rooms':>8}{'players':>9}{'rooms KB':>10}{'max RSS MB':>12}")
+        for m in result['memory']:
+            print(f"{m['phase']:<10}{m['rooms']:>8}{m['players']:>9}{m['rooms_bytes'] // 1024:>10}"
+                  f"{m['max_rss_kb'] // 1024:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--room-size', type=int, default=4, help="Số người chơi mỗi phòng (gồm chủ phòng)")
+    parser.add_argument('--answers', type=int, default=20, help="Số submit_answer mỗi người chơi")
+    parser.add_argument('--chats', type=int, default=5, help="Số send_chat_message mỗi người chơi")
+    parser.add_argument('--correct-rate', type=float, default=0.1, help="Tỉ lệ câu trả lời đúng")
+    parser.add_argument('--concurrency', type=int, default=200, help="Số greenlet chạy đồng thời")
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:1000',
+                        help="PASSWORD_HASH_METHOD cho lần chạy (mặc định rẻ để đo phần game)")
+    parser.add_argument('--rate-limit', action='store_true', help="Giữ rate limit của server (mặc định tắt)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    # Log của server ghi ra stderr nên stdout chỉ còn kết quả (dùng được với --json)
+    result = run(args)
+
+    print_result(args, result)
+    sys.exit(1 if result['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark độ trễ game trong lúc có "bão" đăng nhập (xem source/server/hashing.py).
+
+Một người chơi gửi send_chat_message đều đặn trong phòng game (đo độ trễ từ lúc
+lẽ ra được gửi tới lúc nhận lại chat_message), trong khi nhiều greenlet đồng
+thời POST /login. So sánh hash mật khẩu trực tiếp trên event loop với hash
+trong thread pool.
+
+Chạy từ thư mục gốc repo:
+    python -m source.benchmarks.bench_login_storm
+    python -m source.benchmarks.bench_login_storm --logins 64 --method pbkdf2:sha256:600000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=48, help="Số lượt /login đồng thời trong mỗi lần bão")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--method', default=None, help="PASSWORD_HASH_METHOD (mặc định theo server)")
+    parser.add_argument('--interval', type=float, default=0.02, help="Chu kỳ gửi chat của người chơi (giây)")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    import eventlet
+    from source.server import create_app, socketio
+    from source.server.hashing import password_hasher
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench_storm_')
+    # Probe gửi chat nhanh hơn ngân sách chat thông thường nên tắt rate limit
+    config = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+              'RATE_LIMIT_ENABLED': False}
+    if args.method:
+        config['PASSWORD_HASH_METHOD'] = args.method
+    app = create_app(config)
+
+    # Chuẩn bị: người chơi + tài khoản cho bão đăng nhập
+    player = app.test_client()
+    player.post('/register', json={'username': 'storm_player', 'password': 'secret1'})
+    player.post('/login', json={'username': 'storm_player', 'password': 'secret1'})
+    for i in range(args.logins):
+        app.test_client().post('/register', json={'username': f'storm_{i}', 'password': 'secret1'})
+    player.post('/create_room', json={'room_id': 'storm_room'})
+    sock = socketio.test_client(app, flask_test_client=player)
+    sock.emit('join_room', {'room_id': 'storm_room'})
+    sock.get_received()
+
+    def login(i):
+        app.test_client().post('/login', json={'username': f'storm_{i}', 'password': 'secret1'})
+
+    def measure(offload, with_storm):
+        password_hasher.offload = offload
+        latencies = []
+        done = [False]
+
+        def probe():
+            while not done[0]:
+                expected = time.perf_counter() + args.interval
+                socketio.sleep(args.interval)
+                sock.emit('send_chat_message', {'room_id': 'storm_room', 'message': 'ping'})
+                sock.get_received()
+                latencies.append((time.perf_counter() - expected) * 1000)
+
+        probe_thread = eventlet.spawn(probe)
+        start = time.perf_counter()
+        if with_storm:
+            pool = eventlet.GreenPool(args.concurrency)
+            list(pool.imap(login, range(args.logins)))
+        else:
+            socketio.sleep(1.0)
+        elapsed = time.perf_counter() - start
+        done[0] = True
+        probe_thread.wait()
+        return {
+            'offload': offload,
+            'storm': with_storm,
+            'logins_per_sec': round(args.logins / elapsed, 1) if with_storm else 0.0,
+            'samples': len(latencies),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(max(latencies or [0.0]), 2)
+        }
+
+    results = [measure(True, False), measure(False, True), measure(True, True)]
+    sock.disconnect()
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"hash method: {password_hasher.method}, logins: {args.logins}, concurrency: {args.concurrency}")
+    print(f"{'scenario':<22}{'logins/s':>10}{'samples':>9}{'p50 ms':>9}{'p99 ms':>10}{'max ms':>10}")
+    for r in results:
+        name = 'idle' if not r['storm'] else ('storm, offload' if r['offload'] else 'storm, inline')
+        print(f"{name:<22}{r['logins_per_sec']:>10}{r['samples']:>9}{r['p50_ms']:>9}{r['p99_ms']:>10}{r['max_ms']:>10}")
+
+
+if __name__ == '__main__':
+    main()
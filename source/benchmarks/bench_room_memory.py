@@ -0,0 +1,77 @@
+"""Benchmark bộ nhớ cho trạng thái phòng/người chơi trong memory (xem GameRoom trong game_logic.py).
+
+Tạo N phòng rỗng kiểu HTTP /create_room (chỉ có host_name, đăng ký vào
+game_rooms và danh sách phòng của sảnh chờ), đo bằng tracemalloc, rồi thêm
+--players người chơi vào mỗi phòng và đo tiếp. Báo cáo byte/phòng và byte/người chơi.
+
+Chạy từ thư mục gốc repo:
+    python -m source.benchmarks.bench_room_memory
+    python -m source.benchmarks.bench_room_memory --sizes 1000,10000 --players 8 --json
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+
+def measure(rooms, players_per_room):
+    """Tạo rooms phòng và players_per_room người chơi mỗi phòng, trả về dict kết quả"""
+    import source.server.game_logic as game_logic
+
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+
+    for i in range(rooms):
+        room_id = f"bench_room_{i}"
+        room = game_logic.GameRoom(room_id, host_id=None, host_name=f"host_{i}")
+        game_logic.game_rooms[room_id] = room
+        game_logic._touch_room(room)
+    gc.collect()
+    after_rooms = tracemalloc.get_traced_memory()[0]
+
+    for i in range(rooms):
+        room = game_logic.game_rooms[f"bench_room_{i}"]
+        for j in range(players_per_room):
+            room.add_player(f"sid_{i}_{j}", f"player_{j}")
+    gc.collect()
+    after_players = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    for i in range(rooms):
+        game_logic._drop_room(f"bench_room_{i}")
+    game_logic.drain_room_list_changes()
+
+    total_players = rooms * players_per_room
+    return {
+        'rooms': rooms,
+        'players_per_room': players_per_room,
+        'bytes_per_room': round((after_rooms - base) / rooms, 1),
+        'bytes_per_player': round((after_players - after_rooms) / total_players, 1) if total_players else 0.0,
+        'total_mb': round((after_players - base) / (1024 * 1024), 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000', help="Số phòng, cách nhau bởi dấu phẩy")
+    parser.add_argument('--players', type=int, default=4, help="Số người chơi thêm vào mỗi phòng")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    # Import trước khi đo để không tính phần nạp module/ngân hàng câu hỏi
+    import source.server.game_logic  # noqa: F401
+
+    results = [measure(int(size), args.players) for size in args.sizes.split(',')]
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"{'rooms':>8}{'players/room':>14}{'bytes/room':>12}{'bytes/player':>14}{'total MB':>10}")
+    for r in results:
+        print(f"{r['rooms']:>8}{r['players_per_room']:>14}{r['bytes_per_room']:>12}"
+              f"{r['bytes_per_player']:>14}{r['total_mb']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,11 @@ from flask import Flask
 # Import các extensions
 from source.server.extensions import db, socketio
 
-def create_app():
-    """Application Factory"""
+def create_app(test_config=None):
+    """Application Factory
+
+    test_config: dict ghi đè cấu hình mặc định (ví dụ SQLALCHEMY_DATABASE_URI cho benchmark)
+    """
     
     # --- Cấu hình đường dẫn ---
     base_dir = os.path.abspath(os.path.dirname(__file__))
@@ -32,19 +35,53 @@ def create_app():
     # --- Phục vụ media files từ statics folder ---
     @app.route('/statics/<path:filepath>')
     def serve_statics(filepath):
-        """Phục vụ ảnh, video từ statics folder"""
-        statics_dir = os.path.join(base_dir, '..', '..', 'statics')
-        return send_from_directory(statics_dir, filepath)
+        """Phục vụ ảnh, video từ statics folder (Range, ETag, Cache-Control)"""
+        from .media import STATICS_DIR, send_media
+        return send_media(STATICS_DIR, filepath)
 
     # --- Cấu hình App ---
     app.config['SECRET_KEY'] = 'your-very-secret-key-12345'
     db_path = os.path.join(base_dir, '..', '..', 'users.db')
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Giới hạn kích thước upload (MB), request lớn hơn nhận 413
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 50)) * 1024 * 1024
+    # Bật khi chạy sau nginx/apache để server gửi file media (X-Sendfile)
+    app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+    # Chạy nhiều worker: xem source/server/room_directory.py
+    app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    if test_config:
+        app.config.update(test_config)
+
+    # --- Log có cấp độ, ghi bất đồng bộ (LOG_LEVEL, LOG_SAMPLE_RATE) ---
+    from .logs import log_config
+    log_config.init_app(app)
+
+    # --- Profile engine SQLite (WAL, busy timeout, pool...) ---
+    from .db_profile import configure_db_profile, apply_sqlite_pragmas
+    configure_db_profile(app)
 
     # --- Gán App vào Extensions ---
     db.init_app(app)
-    socketio.init_app(app)
+    apply_sqlite_pragmas(app, db)
+    # Message queue (ví dụ redis://...) để emit tới được client ở mọi worker khi chạy nhiều worker
+    socketio.init_app(app, message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
+
+    # --- Hash mật khẩu trong thread pool (cấu hình method/giới hạn hàng đợi) ---
+    from .hashing import password_hasher
+    password_hasher.init_app(app)
+
+    # --- Giới hạn tần suất submit_answer/send_chat_message theo SID và user ---
+    from .rate_limit import rate_limiter
+    rate_limiter.init_app(app)
+
+    # --- Danh bạ phòng dùng chung khi chạy nhiều worker (mặc định: một worker) ---
+    from .room_directory import room_directory
+    room_directory.init_app(app)
+
+    # --- Bộ hẹn giờ chuyển vòng cần app context để chạy callback ---
+    from .scheduler import round_scheduler
+    round_scheduler.init_app(app)
 
     # --- Đăng ký Blueprint (của Nam) ---
     from .routes import http_bp
@@ -59,10 +96,42 @@ def create_app():
         # Import models tại đây để đảm bảo db được khởi tạo
         from . import models 
         db.create_all()
-        
-        # KHÔNG tải phòng cũ từ database - chỉ tạo phòng mới khi người chơi tạo
-        # Phòng sẽ được lưu vào DB và có thể rejoin khi đang chơi
-        # from . import game_logic
-        # game_logic.load_rooms_from_db()
+        models.ensure_indexes()
+
+        # KHÔNG tải phòng cũ từ bảng GameRoom (chỉ có metadata): trạng thái đầy đủ
+        # của phòng được khôi phục từ room_snapshot bên dưới. Chỉ xóa các dòng phòng
+        # trống quá hạn còn sót lại (ví dụ process bị kill trước khi kịp xóa)
+        from .game_logic import purge_stale_rooms_from_db
+        purge_stale_rooms_from_db()
+
+    # --- Ghi metadata phòng xuống DB theo lô (write-behind) ---
+    from .persistence import room_store
+    room_store.init_app(app)
+    # Câu trả lời cũ bị đẩy khỏi lịch sử trong memory của phòng cũng ghi theo lô
+    from .answer_log import answer_spill
+    answer_spill.init_app(app)
+    # Kết quả ván cho bảng xếp hạng cũng ghi theo lô, ngoài event loop
+    from .leaderboard import leaderboard
+    leaderboard.init_app(app)
+
+    # --- Khôi phục phòng (kể cả ván đang chơi) từ snapshot + journal của lần chạy trước ---
+    from .room_snapshot import room_snapshots
+    events.resume_restored_rooms(room_snapshots.init_app(app))
+
+    # --- Tính trước hash nội dung của media (URL /m/<hash>, ETag) ngoài event loop ---
+    from .media import warm_library
+    warm_library()
+
+    # --- Dọn phòng trống quá hạn trong background (ngoài đường đọc danh sách phòng) ---
+    from . import game_logic
+    game_logic.start_room_sweeper(app)
+
+    # --- Số liệu vận hành (/metrics): gauge phòng/người chơi và fan-out của emit ---
+    from .metrics import metrics
+    metrics.init_app(app)
+
+    # --- Profiling event loop (PROFILE_ENABLED hoặc POST /admin/profile, không cần restart) ---
+    from .profiler import hub_profiler
+    hub_profiler.init_app(app)
 
     return app
@@ -0,0 +1,146 @@
+import logging
+import os
+import sys
+from collections import deque
+
+from source.server.extensions import db
+from source.server.metrics import metrics
+from source.server.persistence import WriteBehind
+
+log = logging.getLogger(__name__)
+
+# Số câu trả lời tối đa giữ trong memory cho mỗi phòng
+ANSWER_LOG_CAPACITY = int(os.environ.get('ANSWER_LOG_CAPACITY', 256))
+# '0' để bỏ hẳn các câu trả lời cũ thay vì ghi xuống bảng AnswerRecord
+ANSWER_LOG_SPILL = os.environ.get('ANSWER_LOG_SPILL', '1') != '0'
+# Cắt câu trả lời quá dài (khớp độ dài cột AnswerRecord.answer)
+MAX_ANSWER_LENGTH = 200
+
+
+class AnswerEntry:
+    """Một câu trả lời trong phòng (dùng __slots__, không có __dict__ riêng)"""
+
+    __slots__ = ('game', 'round', 'player_id', 'player_name', 'answer', 'timestamp', 'correct', 'note')
+
+    def __init__(self, game, round_no, player_id, player_name, answer, timestamp, correct=False, note=None):
+        self.game = game
+        self.round = round_no
+        self.player_id = player_id
+        self.player_name = player_name
+        self.answer = answer
+        self.timestamp = timestamp
+        self.correct = correct
+        self.note = note
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class AnswerLog:
+    """Lịch sử câu trả lời của một phòng: bộ đệm vòng giới hạn trong memory.
+
+    Khi đầy, câu trả lời cũ nhất được chuyển sang answer_spill (ghi xuống
+    bảng AnswerRecord theo lô) nên bộ nhớ mỗi phòng không vượt capacity bản ghi.
+    for_round() gộp phần đã ghi xuống DB với phần còn trong memory.
+    """
+
+    __slots__ = ('room_id', 'created_at', 'game', 'capacity', '_entries')
+
+    def __init__(self, room_id, created_at, capacity=None):
+        self.room_id = room_id
+        self.created_at = created_at  # Phân biệt các phòng khác nhau dùng lại cùng room_id
+        self.game = 0
+        self.capacity = capacity or ANSWER_LOG_CAPACITY
+        self._entries = None  # deque tạo ở câu trả lời đầu tiên (phòng ở sảnh chờ không cần)
+
+    def __len__(self):
+        return len(self._entries) if self._entries else 0
+
+    def __iter__(self):
+        return iter(self._entries or ())
+
+    def new_game(self):
+        """Bắt đầu ván mới: số vòng được đếm lại từ 1 nên các bản ghi phân biệt theo game"""
+        self.game += 1
+
+    def append(self, round_no, player_id, player_name, answer, timestamp, correct=False, note=None):
+        """Ghi một câu trả lời, trả về AnswerEntry (có thể sửa correct/note sau đó)"""
+        entries = self._entries
+        if entries is None:
+            entries = self._entries = deque(maxlen=self.capacity)
+        elif len(entries) == self.capacity:
+            oldest = entries[0]
+            if ANSWER_LOG_SPILL:
+                answer_spill.add(self.room_id, self.created_at, oldest)
+        entry = AnswerEntry(self.game, round_no, player_id, sys.intern(player_name),
+                            answer[:MAX_ANSWER_LENGTH], timestamp, correct, note)
+        entries.append(entry)
+        return entry
+
+    def for_round(self, round_no, game=None):
+        """Các câu trả lời của một vòng (mặc định ván hiện tại), theo thứ tự thời gian, dạng dict"""
+        game = self.game if game is None else game
+        spilled = answer_spill.query(self.room_id, self.created_at, game, round_no)
+        recent = [e.to_dict() for e in self if e.game == game and e.round == round_no]
+        return spilled + recent
+
+
+class AnswerSpill(WriteBehind):
+    """Ghi sau (write-behind) các câu trả lời bị đẩy ra khỏi AnswerLog.
+
+    add() chỉ thêm vào list trong memory; các bản ghi được insert một lượt
+    (trong thread pool, xem persistence.WriteBehind) mỗi FLUSH_INTERVAL giây,
+    khi đạt FLUSH_THRESHOLD bản ghi, hoặc khi tắt server.
+    """
+
+    # Chu kỳ flush định kỳ (giây)
+    FLUSH_INTERVAL = 2.0
+    # Số bản ghi trong bộ đệm để kích hoạt flush sớm
+    FLUSH_THRESHOLD = 500
+    LOG_TAG = 'ANSWER_LOG'
+
+    def add(self, room_id, room_created, entry):
+        row = entry.to_dict()
+        row['room_id'] = room_id
+        row['room_created'] = room_created
+        self._pending.append(row)
+        self._maybe_flush_soon()
+
+    @metrics.timed('answer_spill_flush')
+    def flush(self, offload=True):
+        return super().flush(offload)
+
+    def _new_buffer(self):
+        return []  # list dict cột của AnswerRecord
+
+    def _merge_back(self, batch):
+        # Giữ thứ tự: lô lỗi đứng trước các bản ghi mới hơn
+        self._pending[:0] = batch
+
+    def _write(self, batch):
+        from source.server.models import AnswerRecord
+
+        db.session.execute(db.insert(AnswerRecord), batch)
+        db.session.commit()
+
+    def query(self, room_id, room_created, game, round_no):
+        """Các câu trả lời đã ghi xuống DB của một vòng (flush bộ đệm trước, cần app context)"""
+        from source.server.models import AnswerRecord
+
+        if any(row['room_id'] == room_id for row in self._pending):
+            self.flush()
+        rows = AnswerRecord.query.filter_by(room_id=room_id, room_created=room_created, game=game, round=round_no) \
+            .order_by(AnswerRecord.id).all()
+        return [{
+            'game': r.game,
+            'round': r.round,
+            'player_id': r.player_id,
+            'player_name': r.player_name,
+            'answer': r.answer,
+            'timestamp': r.timestamp,
+            'correct': r.correct,
+            'note': r.note
+        } for r in rows]
+
+
+answer_spill = AnswerSpill()
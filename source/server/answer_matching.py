@@ -0,0 +1,80 @@
+import os
+import re
+import unicodedata
+
+# Khoảng cách chỉnh sửa tối đa khi so khớp gần đúng (0 = tắt, chỉ so khớp chính xác)
+FUZZY_MAX_DISTANCE = int(os.environ.get('ANSWER_FUZZY_DISTANCE', 0))
+# Không so khớp gần đúng với đáp án ngắn hơn số ký tự này (tránh "meo" ~ "beo")
+FUZZY_MIN_LENGTH = 4
+
+# Ký tự phân tách các đáp án thay thế trong cột 'aliases' của CSV
+ALIAS_SEPARATOR = '|'
+
+_NON_WORD = re.compile(r'[\W_]+')
+# 'đ' không tách được bằng NFD nên cần map riêng
+_EXTRA_FOLD = str.maketrans({'đ': 'd'})
+
+
+def normalize_answer(text):
+    """Chuẩn hóa câu trả lời để so khớp: "  Thái   độ! " -> "thai do"
+
+    NFC rồi casefold, NFD và bỏ dấu (combining marks), đ -> d,
+    dấu câu thành khoảng trắng, gộp khoảng trắng.
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFC', text).casefold()
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = text.translate(_EXTRA_FOLD)
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def answer_keys(answer, aliases=None):
+    """Tập các dạng chuẩn hóa được chấp nhận của đáp án (tính một lần khi nạp câu hỏi)"""
+    keys = {normalize_answer(answer)}
+    if aliases:
+        keys.update(normalize_answer(a) for a in aliases.split(ALIAS_SEPARATOR))
+    keys.discard('')
+    return frozenset(keys)
+
+
+def _within_distance(a, b, max_distance):
+    """Levenshtein(a, b) <= max_distance, chỉ tính dải quanh đường chéo và dừng sớm"""
+    if abs(len(a) - len(b)) > max_distance:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [max_distance + 1] * len(b)
+        lo = max(1, i - max_distance)
+        hi = min(len(b), i + max_distance)
+        for j in range(lo, hi + 1):
+            cost = 0 if ca == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+        if min(current[lo - 1:hi + 1]) > max_distance:
+            return False
+        previous = current
+    return previous[len(b)] <= max_distance
+
+
+def matches_answer(question, guess, max_distance=None):
+    """Câu trả lời guess có khớp đáp án của question không
+
+    So khớp chính xác là một lần tra set (O(1) sau khi chuẩn hóa guess);
+    so khớp gần đúng chỉ chạy khi max_distance > 0 (mặc định FUZZY_MAX_DISTANCE).
+    """
+    keys = question.get('answer_keys')
+    if keys is None:
+        keys = answer_keys(question.get('answer', ''), question.get('aliases'))
+    guess_key = normalize_answer(guess)
+    if not guess_key:
+        return False
+    if guess_key in keys:
+        return True
+
+    if max_distance is None:
+        max_distance = FUZZY_MAX_DISTANCE
+    if max_distance <= 0:
+        return False
+    return any(len(key) >= FUZZY_MIN_LENGTH and _within_distance(guess_key, key, max_distance)
+               for key in keys)
@@ -1,5 +1,10 @@
+import logging
+
 from source.server.extensions import db
 from source.server.models import User
+from source.server.hashing import PasswordHasherBusy
+
+log = logging.getLogger(__name__)
 
 def validate_username(username):
     """Kiểm tra username hợp lệ: 3-20 ký tự, chỉ chữ số, chữ cái, underscore"""
@@ -35,6 +40,9 @@ def register_user(username, password):
         existing_user = User.query.filter_by(username=username).first()
         if existing_user: 
             return (False, "Tên đăng nhập đã tồn tại.") 
+        # Trả connection về pool trước khi hash (hash chờ trong thread pool,
+        # giữ connection lúc đó sẽ làm cạn pool khi nhiều người đăng ký cùng lúc)
+        db.session.rollback()
         
         # Create new user
         new_user = User(username=username)
@@ -43,12 +51,14 @@ def register_user(username, password):
         db.session.add(new_user)
         db.session.commit() 
         return (True, "Đăng ký thành công!")
+    except PasswordHasherBusy:
+        return (False, "Máy chủ đang bận, vui lòng thử lại sau.")
     except Exception as e:
         try:
             db.session.rollback()
         except:
             pass
-        print(f"[Auth] Register error: {type(e).__name__}: {str(e)}")
+        log.error("[Auth] Register error: %s: %s", type(e).__name__, e)
         return (False, f"Lỗi máy chủ: {str(e)}")
         
 def login_user(username, password):
@@ -56,15 +66,23 @@ def login_user(username, password):
     Kiểm tra đăng nhập.
     Trả về đối tượng User nếu hợp lệ.
     Trả về None nếu không hợp lệ.
+    Ném PasswordHasherBusy nếu hàng đợi hash mật khẩu đang đầy.
     """
     if not username or not password:
         return None
     
     try:
         user = User.query.filter_by(username=username).first()
-        if user and user.check_password(password):
+        if user is None:
+            return None
+        # Tách user khỏi session và trả connection về pool trước khi kiểm tra hash
+        db.session.expunge(user)
+        db.session.rollback()
+        if user.check_password(password):
             return user
+    except PasswordHasherBusy:
+        raise
     except Exception as e:
-        print(f"[Auth] Login error: {type(e).__name__}: {str(e)}")
+        log.error("[Auth] Login error: %s: %s", type(e).__name__, e)
     
     return None
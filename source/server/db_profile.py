@@ -0,0 +1,67 @@
+import logging
+import os
+
+from sqlalchemy import event
+
+log = logging.getLogger(__name__)
+
+# Các profile cấu hình engine SQLite. Chọn bằng biến môi trường DB_PROFILE
+# hoặc app.config['DB_PROFILE'] (mặc định: 'tuned').
+#  - pragmas: chạy trên mỗi connection mới của SQLite
+#  - engine_options: truyền vào SQLALCHEMY_ENGINE_OPTIONS
+DB_PROFILES = {
+    # Giống cấu hình ban đầu: rollback journal, không busy timeout
+    'default': {
+        'pragmas': {},
+        'engine_options': {}
+    },
+    # WAL cho phép đọc song song với ghi; NORMAL chỉ fsync ở checkpoint;
+    # busy_timeout để chờ thay vì báo "database is locked" ngay lập tức
+    'tuned': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,  # ms
+            'mmap_size': 64 * 1024 * 1024,  # bytes
+            'temp_store': 'MEMORY'
+        },
+        'engine_options': {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_timeout': 10,
+            'pool_pre_ping': True,
+            'connect_args': {'timeout': 5, 'check_same_thread': False}
+        }
+    }
+}
+
+
+def configure_db_profile(app):
+    """Gán SQLALCHEMY_ENGINE_OPTIONS theo profile (gọi TRƯỚC db.init_app)"""
+    name = app.config.get('DB_PROFILE') or os.environ.get('DB_PROFILE', 'tuned')
+    if name not in DB_PROFILES:
+        log.warning("[DB] Profile '%s' không tồn tại, dùng 'default'", name)
+        name = 'default'
+    app.config['DB_PROFILE'] = name
+    options = dict(DB_PROFILES[name]['engine_options'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def apply_sqlite_pragmas(app, db):
+    """Đăng ký PRAGMA của profile cho mỗi connection của engine (gọi SAU db.init_app)"""
+    pragmas = DB_PROFILES[app.config['DB_PROFILE']]['pragmas']
+    if not pragmas:
+        return
+
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+
+        @event.listens_for(engine, 'connect')
+        def _set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for key, value in pragmas.items():
+                cursor.execute(f"PRAGMA {key}={value}")
+            cursor.close()
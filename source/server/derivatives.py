@@ -0,0 +1,182 @@
+"""Tạo bản media tối ưu cho web (derivative) cho ảnh/video câu hỏi.
+
+- Ảnh: bản 'web' (cạnh dài tối đa IMAGE_MAX_SIDE, JPEG) và 'thumb' (THUMB_MAX_SIDE)
+  — cần Pillow
+- Video: bản 'web' remux MP4 với +faststart (moov atom ở đầu để phát ngay);
+  nếu file lớn hơn VIDEO_TRANSCODE_BYTES thì transcode H.264 tối đa 720p — cần ffmpeg
+
+Thiếu Pillow/ffmpeg thì bỏ qua, câu hỏi vẫn dùng file gốc. Kết quả ghi vào
+statics/derived/ và manifest.json; describe_media() chọn bản nhẹ nhất phù hợp.
+
+Xử lý lại toàn bộ thư viện media (chạy từ thư mục gốc repo):
+    python -m source.server.derivatives
+"""
+import json
+import logging
+import os
+import shutil
+import subprocess
+
+from source.server.media import STATICS_DIR, content_hash
+
+log = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow là tùy chọn
+    Image = None
+
+DERIVED_DIR = os.path.join(STATICS_DIR, 'derived')
+MANIFEST_PATH = os.path.join(DERIVED_DIR, 'manifest.json')
+
+IMAGE_MAX_SIDE = 1280
+THUMB_MAX_SIDE = 320
+JPEG_QUALITY = 82
+VIDEO_TRANSCODE_BYTES = 8 * 1024 * 1024
+VIDEO_MAX_HEIGHT = 720
+
+# "folder/filename" -> {"web": {"file": đường dẫn tương đối trong statics, "size": bytes}, "thumb": ...}
+_manifest = None
+
+
+def _load_manifest():
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def _save_manifest():
+    os.makedirs(DERIVED_DIR, exist_ok=True)
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def get_variants(folder, filename):
+    """Các bản derivative đã tạo cho file media, {} nếu chưa có"""
+    return _load_manifest().get(f"{folder}/{filename}", {})
+
+
+def lightest_path(folder, filename):
+    """Đường dẫn bản nhẹ nhất dùng được để hiển thị trong vòng chơi (web hoặc gốc)"""
+    original = os.path.join(STATICS_DIR, folder, filename)
+    web = get_variants(folder, filename).get('web')
+    if web:
+        web_path = os.path.join(STATICS_DIR, web['file'])
+        if os.path.isfile(web_path) and (not os.path.isfile(original) or web['size'] < os.path.getsize(original)):
+            return web_path
+    return original
+
+
+def _resize(src, dst, max_side):
+    with Image.open(src) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_side, max_side))
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        img.save(dst, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+
+def _make_image_variants(src, stem):
+    if Image is None:
+        return {}
+    out_dir = os.path.join(DERIVED_DIR, 'images')
+    os.makedirs(out_dir, exist_ok=True)
+    variants = {}
+    for name, max_side in (('web', IMAGE_MAX_SIDE), ('thumb', THUMB_MAX_SIDE)):
+        dst = os.path.join(out_dir, f"{stem}.{name}.jpg")
+        _resize(src, dst, max_side)
+        variants[name] = dst
+    return variants
+
+
+def _make_video_variants(src, stem):
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return {}
+    out_dir = os.path.join(DERIVED_DIR, 'videos')
+    os.makedirs(out_dir, exist_ok=True)
+    dst = os.path.join(out_dir, f"{stem}.web.mp4")
+    if os.path.getsize(src) > VIDEO_TRANSCODE_BYTES:
+        codec_args = ['-vf', f"scale=-2:'min({VIDEO_MAX_HEIGHT},ih)'", '-c:v', 'libx264', '-preset', 'veryfast',
+                      '-crf', '28', '-c:a', 'aac', '-b:a', '96k']
+    else:
+        codec_args = ['-c', 'copy']
+    subprocess.run([ffmpeg, '-y', '-v', 'error', '-i', src, *codec_args, '-movflags', '+faststart', dst],
+                   check=True, timeout=600)
+    return {'web': dst}
+
+
+def build_variants(folder, filename):
+    """Tạo các bản derivative cho một file (chạy đồng bộ, tốn CPU), trả về dict variant -> path
+
+    Không đụng tới manifest, nên an toàn khi chạy trong thread pool.
+    """
+    src = os.path.join(STATICS_DIR, folder, filename)
+    stem = filename  # giữ cả đuôi để "a.jpg" và "a.png" không trùng tên derivative
+    if folder == 'videos':
+        return _make_video_variants(src, stem)
+    return _make_image_variants(src, stem)
+
+
+def record_variants(folder, filename, variants):
+    """Ghi kết quả build_variants() vào manifest"""
+    if not variants:
+        return
+    manifest = _load_manifest()
+    manifest[f"{folder}/{filename}"] = {
+        name: {'file': os.path.relpath(path, STATICS_DIR), 'size': os.path.getsize(path)}
+        for name, path in variants.items()
+    }
+    _save_manifest()
+
+
+def process_upload_async(folder, filename):
+    """Tạo derivative cho file vừa upload trong thread pool, không chặn request/event loop"""
+    from eventlet import tpool
+    from source.server.extensions import socketio
+
+    def _job():
+        try:
+            variants = tpool.execute(build_variants, folder, filename)
+            record_variants(folder, filename, variants)
+            # Hash nội dung cho URL /m/<hash> tính sẵn ở đây, không phải lúc next_round
+            for path in (os.path.join(STATICS_DIR, folder, filename), *variants.values()):
+                content_hash(path)
+            log.info("[DERIVATIVES] %s/%s: %s", folder, filename, sorted(variants) or 'không có công cụ xử lý')
+        except Exception as e:
+            log.error("[DERIVATIVES] Lỗi xử lý %s/%s: %s: %s", folder, filename, type(e).__name__, e)
+
+    socketio.start_background_task(_job)
+
+
+def process_library():
+    """Xử lý lại toàn bộ ảnh/video trong statics (chế độ batch offline)"""
+    for folder in ('images', 'videos'):
+        folder_dir = os.path.join(STATICS_DIR, folder)
+        if not os.path.isdir(folder_dir):
+            continue
+        for filename in sorted(os.listdir(folder_dir)):
+            if not os.path.isfile(os.path.join(folder_dir, filename)):
+                continue
+            try:
+                variants = build_variants(folder, filename)
+                record_variants(folder, filename, variants)
+                sizes = {name: os.path.getsize(path) for name, path in variants.items()}
+                print(f"{folder}/{filename}: {os.path.getsize(os.path.join(folder_dir, filename))} -> {sizes}")
+            except Exception as e:
+                print(f"{folder}/{filename}: lỗi {type(e).__name__}: {str(e)}")
+    if Image is None:
+        print("Pillow chưa được cài: bỏ qua ảnh (pip install Pillow)")
+    if shutil.which('ffmpeg') is None:
+        print("Không tìm thấy ffmpeg: bỏ qua video")
+
+
+if __name__ == '__main__':
+    process_library()
@@ -1,35 +1,138 @@
+import logging
+
 from flask import session, request
 from flask_socketio import emit, join_room, leave_room, send
 
 from source.server.extensions import socketio # Import từ extensions
 import source.server.game_logic as game_logic
+from source.server.scheduler import round_scheduler
+from source.server.lobby import lobby_broadcaster, LOBBY_ROOM
+from source.server.rate_limit import rate_limiter
+from source.server.leaderboard import leaderboard
+from source.server.room_directory import room_directory
+from source.server.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+# Số giây chờ sau khi có người trả lời đúng đầu tiên trước khi chuyển vòng
+ROUND_TRANSITION_DELAY = 5
+# Sau warm restart, người chơi không kết nối lại trong chừng này giây bị xóa khỏi phòng
+RESUME_GRACE = 60
+
+# --- Chuyển vòng (chạy bởi round_scheduler, không chặn handler) ---
+
+def _emit_round(room, round_data):
+    """Gửi dữ liệu vòng mới (hoặc kết thúc game) và hẹn giờ timeout cho vòng đó"""
+    if round_data.get('status') == 'game_over':
+        round_scheduler.cancel(room.room_id)
+        socketio.emit('game_over', round_data, to=room.room_id)
+        # Lưu kết quả vào bảng xếp hạng (bỏ qua ván kết thúc khi chưa chơi vòng nào)
+        if room.current_round > 0:
+            leaderboard.record_game(room.room_id, round_data['scoreboard'])
+        return
+    socketio.emit('new_round', round_data, to=room.room_id)
+    # Gợi ý client tải trước media của vòng sau trong lúc chơi vòng này
+    prefetch = room.peek_next_media()
+    if prefetch:
+        socketio.emit('prefetch_media', prefetch, to=room.room_id)
+    round_scheduler.schedule(room.room_id, room.round_time_limit,
+                             _on_round_timeout, room.room_id, room.current_round)
+
+def _advance_round(room_id, round_no):
+    """Chuyển sang vòng tiếp theo, chỉ khi phòng vẫn đang ở vòng round_no"""
+    room = game_logic.get_room(room_id)
+    if not room or not room.game_started or room.current_round != round_no:
+        return
+    if not room.players:
+        return
+    _emit_round(room, room.next_round())
+
+def _on_round_timeout(room_id, round_no):
+    """Hết giờ mà chưa ai trả lời đúng -> chuyển vòng"""
+    room = game_logic.get_room(room_id)
+    if not room or not room.game_started or room.current_round != round_no:
+        return
+    socketio.emit('chat_message', {
+        'sender': 'Hệ thống',
+        'message': f'⏰ Hết giờ vòng {round_no}!'
+    }, to=room_id)
+    _advance_round(room_id, round_no)
+
+# --- Tiếp tục các phòng sau warm restart (room_snapshot) ---
+
+def resume_restored_rooms(rooms):
+    """Hẹn lại giờ vòng cho các ván đang chơi và dọn người chơi không kết nối lại
+
+    Client tự kết nối lại và gửi join_room; nhánh reconnect gửi lại vòng hiện tại.
+    """
+    if not rooms:
+        return
+    for room in rooms:
+        if not room.game_started:
+            continue
+        if room.current_question is None or room.answered_this_round:
+            # Restart lúc đang chờ chuyển vòng (đã có người trả lời đúng) hoặc câu hỏi
+            # hiện tại không còn trong ngân hàng: chuyển sang vòng sau
+            round_scheduler.schedule(room.room_id, ROUND_TRANSITION_DELAY,
+                                     _advance_round, room.room_id, room.current_round)
+        else:
+            round_scheduler.schedule(room.room_id, room.round_time_limit,
+                                     _on_round_timeout, room.room_id, room.current_round)
+    player_sids = [sid for room in rooms for sid in room.players]
+    socketio.start_background_task(_drop_unreconnected_players, player_sids)
+    lobby_broadcaster.mark_dirty()
+
+def _drop_unreconnected_players(player_sids):
+    """Xóa người chơi còn giữ SID từ trước khi restart (chưa kết nối lại) sau RESUME_GRACE giây"""
+    socketio.sleep(RESUME_GRACE)
+    removed = 0
+    for player_sid in player_sids:
+        room_id, updated_players, player_name = game_logic.remove_player_from_room(player_sid)
+        if not room_id:
+            continue
+        removed += 1
+        room = game_logic.get_room(room_id)
+        socketio.emit('player_left', {
+            'message': f'{player_name} đã rời phòng.',
+            'players': updated_players,
+            'host_id': room.host_id if room else None
+        }, to=room_id)
+    if removed:
+        log.info("[RESUME] Đã xóa %d người chơi không kết nối lại sau restart", removed)
+        lobby_broadcaster.mark_dirty()
 
 # --- Các trình xử lý sự kiện SocketIO (Real-time) ---
 
 @socketio.on('connect')
-def handle_connect():
-    """Khi người dùng kết nối WebSocket"""
+@metrics.handler('connect')
+def handle_connect(auth=None):
+    """Khi người dùng kết nối WebSocket
+
+    auth: dữ liệu auth client gửi kèm (không dùng); khai báo để Flask-SocketIO
+    không phải gọi lại handler không có tham số (bị đếm thành lỗi trong /metrics)
+    """
     if 'username' not in session:
         emit('error', {'message': 'Bạn chưa đăng nhập.'})
         return False # Từ chối kết nối
-    print(f"Client connected: {session['username']} (SID: {request.sid})")
+    log.debug("Client connected: %s (SID: %s)", session['username'], request.sid)
     emit('connected', {'message': 'Kết nối thành công!'})
 
 @socketio.on('disconnect')
+@metrics.handler('disconnect')
 def handle_disconnect():
     """Khi người dùng ngắt kết nối"""
     username = session.get('username', 'Guest')
     player_sid = request.sid
-    print(f"{username} đã ngắt kết nối (SID: {player_sid})")
+    log.debug("%s đã ngắt kết nối (SID: %s)", username, player_sid)
+    rate_limiter.forget_sid(player_sid)
     
     # Lưu thông tin phòng TRƯỚC khi remove player
     room_id_before = None
     was_host = False
-    for room in game_logic.game_rooms.values():
-        if player_sid in room.players:
-            room_id_before = room.room_id
-            was_host = (player_sid == room.host_id)
-            break
+    room = game_logic.get_room_of_player(player_sid)
+    if room and player_sid in room.players:
+        room_id_before = room.room_id
+        was_host = (player_sid == room.host_id)
     
     room_id, updated_players, player_name = game_logic.remove_player_from_room(player_sid)
     
@@ -48,50 +151,54 @@ def handle_disconnect():
                 'new_host_name': room.host_name,
                 'message': f'{room.host_name} là chủ phòng mới'
             }, to=room_id)
-            print(f"[DISCONNECT] Host thay đổi trong phòng {room_id}, host mới: {room.host_name}")
+            log.info("[DISCONNECT] Host thay đổi trong phòng %s, host mới: %s", room_id, room.host_name)
         
-        # Broadcast cập nhật danh sách phòng tới tất cả
-        socketio.emit('room_list_updated', game_logic.get_room_list())
-        print(f"[DISCONNECT] Đã broadcast room_list_updated sau khi {player_name} disconnect từ {room_id}")
+        # Báo sảnh chờ danh sách phòng đã đổi (gộp và gửi diff)
+        lobby_broadcaster.mark_dirty()
 
 @socketio.on('request_room_list')
+@metrics.handler('request_room_list')
 def on_request_room_list():
     """Khi người dùng ở sảnh chờ yêu cầu danh sách phòng"""
-    rooms = game_logic.get_room_list()
-    print(f"[REQUEST_ROOM_LIST] {session.get('username', 'Guest')} yêu cầu danh sách phòng. Có {len(rooms)} phòng")
-    for room in rooms:
-        print(f"  - Phòng: {room['id']}, Chủ: {room['host']}, Người: {room['count']}")
-    emit('room_list_updated', rooms)
+    # Vào kênh sảnh chờ để nhận các diff danh sách phòng sau này
+    join_room(LOBBY_ROOM)
+    snapshot = lobby_broadcaster.snapshot()
+    log.debug("[REQUEST_ROOM_LIST] %s yêu cầu danh sách phòng. Có %d phòng (v%s)",
+              session.get('username', 'Guest'), len(snapshot['rooms']), snapshot['version'])
+    emit('room_list_updated', snapshot)
 
 
 def _find_player_sid_by_name(room, username):
     """Helper: trả về SID nếu người chơi với username đã có trong room"""
-    for sid, pdata in room.players.items():
-        if pdata.get('name') == username:
-            return sid
-    return None
+    return game_logic.find_player_sid_by_name(room.room_id, username)
 
 @socketio.on('create_room')
+@metrics.handler('create_room')
 def on_create_room(data):
     """Khi người dùng tạo phòng mới"""
-    room_id = data['room_id']
+    room_id = game_logic.normalize_room_id(data.get('room_id'))
     username = session['username']
-    
+    if room_id is None:
+        emit('error', {'message': 'room_id không hợp lệ.'})
+        return
+
     room = game_logic.create_new_room(room_id, request.sid, username)
     
     if room:
+        leave_room(LOBBY_ROOM)
         join_room(room_id)
-        print(f"User {username} created and joined room {room_id}")
+        log.info("User %s created and joined room %s", username, room_id)
         emit('room_created', {'room_id': room_id})
         # Cập nhật danh sách phòng cho mọi người ở sảnh
-        emit('room_list_updated', game_logic.get_room_list(), skip_sid=request.sid)
+        lobby_broadcaster.mark_dirty()
     else:
         emit('error', {'message': f'Phòng "{room_id}" đã tồn tại.'})
 
 @socketio.on('join_room')
+@metrics.handler('join_room')
 def on_join_room(data):
     """Khi người dùng tham gia một phòng có sẵn"""
-    room_id = data['room_id']
+    room_id = game_logic.normalize_room_id(data.get('room_id'))
     username = session['username']
     room = game_logic.get_room(room_id)
 
@@ -99,13 +206,11 @@ def on_join_room(data):
         # Xử lý reconnect
         existing_sid = _find_player_sid_by_name(room, username)
         if existing_sid:
-            pdata = room.players.pop(existing_sid)
-            room.players[request.sid] = pdata
-            if room.host_id == existing_sid:
-                room.host_id = request.sid
+            room.rebind_player(existing_sid, request.sid)
 
+            leave_room(LOBBY_ROOM)
             join_room(room_id)
-            print(f"User {username} reconnected to room {room_id} (old SID {existing_sid} -> new SID {request.sid})")
+            log.info("User %s reconnected to room %s (old SID %s -> new SID %s)", username, room_id, existing_sid, request.sid)
             emit('joined_room', {'room_id': room_id})
             emit('player_joined', {
                 'message': f'{username} đã (re)kết nối.',
@@ -113,8 +218,11 @@ def on_join_room(data):
                 'host_id': room.host_id,
                 'my_id': request.sid
             }, to=room_id)
-            # Broadcast cập nhật danh sách phòng
-            socketio.emit('room_list_updated', game_logic.get_room_list())
+            # Đang giữa vòng (tải lại trang, mất kết nối, server restart): gửi lại vòng hiện tại
+            if room.game_started and room.current_question:
+                emit('new_round', room.round_data())
+            # Báo sảnh chờ danh sách phòng đã đổi
+            lobby_broadcaster.mark_dirty()
             # Lưu vào database
             game_logic.save_room_to_db(room_id)
             return
@@ -125,10 +233,11 @@ def on_join_room(data):
             return
 
         # Join mới
+        leave_room(LOBBY_ROOM)
         join_room(room_id)
         room.add_player(request.sid, username)
 
-        print(f"User {username} joined room {room_id}")
+        log.debug("User %s joined room %s", username, room_id)
 
         emit('joined_room', {'room_id': room_id})
         emit('player_joined', {
@@ -138,25 +247,33 @@ def on_join_room(data):
             'my_id': request.sid
         }, to=room_id)
 
-        # Broadcast cập nhật danh sách phòng tới tất cả
-        socketio.emit('room_list_updated', game_logic.get_room_list())
+        # Báo sảnh chờ danh sách phòng đã đổi
+        lobby_broadcaster.mark_dirty()
         # Lưu vào database
         game_logic.save_room_to_db(room_id)
+    elif room_directory.owner_url(room_id):
+        # Phòng thuộc worker khác: trang /game/<room_id> sẽ chuyển tới worker đó rồi join ở đó
+        emit('joined_room', {'room_id': room_id})
     else:
         emit('error', {'message': 'Phòng không tồn tại.'})
 
 @socketio.on('send_chat_message')
+@metrics.handler('send_chat_message')
+@rate_limiter.limit('send_chat_message')
 def on_chat_message(data):
     """Xử lý chat chung trong phòng"""
-    room_id = data['room_id']
+    room_id = game_logic.normalize_room_id(data.get('room_id'))
     message = data['message']
     username = session.get('username', 'Guest')
+    if room_id is None:
+        return  # to=None sẽ gửi cho mọi client
     emit('chat_message', {'sender': username, 'message': message}, to=room_id)
 
 @socketio.on('start_game')
+@metrics.handler('start_game')
 def on_start_game(data):
     """Khi chủ phòng bấm bắt đầu game"""
-    room_id = data['room_id']
+    room_id = game_logic.normalize_room_id(data.get('room_id'))
     room = game_logic.get_room(room_id)
     
     if not room:
@@ -171,17 +288,21 @@ def on_start_game(data):
         emit('error', {'message': 'Cần ít nhất 2 người để bắt đầu.'})
         return
 
-    # Bắt đầu game và lấy dữ liệu vòng 1
-    round_data = room.start_game()
+    # Bắt đầu game và lấy dữ liệu vòng 1 (chủ phòng có thể chọn chủ đề/độ khó)
+    round_data = room.start_game(category=data.get('category'), difficulty=data.get('difficulty'))
     if round_data:
-        print(f"Game started in room {room_id}")
-        socketio.emit('new_round', round_data, to=room_id)
-        socketio.emit('room_list_updated', game_logic.get_room_list(), skip_sid=request.sid)
+        log.info("Game started in room %s", room_id)
+        _emit_round(room, round_data)
+        lobby_broadcaster.mark_dirty()
+    elif not room.game_started:
+        emit('error', {'message': 'Không có câu hỏi nào khớp chủ đề/độ khó đã chọn.'})
         
 @socketio.on('submit_answer')
+@metrics.handler('submit_answer')
+@rate_limiter.limit('submit_answer')
 def on_submit_answer(data):
     """Khi người chơi gửi câu trả lời"""
-    room_id = data['room_id']
+    room_id = game_logic.normalize_room_id(data.get('room_id'))
     answer = data['answer']
     room = game_logic.get_room(room_id)
     
@@ -193,16 +314,14 @@ def on_submit_answer(data):
         username = session.get('username')
         existing_sid = _find_player_sid_by_name(room, username) if username else None
         if existing_sid:
-            pdata = room.players.pop(existing_sid)
-            room.players[request.sid] = pdata
-            if room.host_id == existing_sid:
-                room.host_id = request.sid
+            room.rebind_player(existing_sid, request.sid)
         else:
             emit('error', {'message': 'Bạn không có trong phòng.'})
             return
 
     result = room.check_answer(request.sid, answer)
-    player_name = room.players.get(request.sid, {}).get('name', 'Unknown')
+    player = room.players.get(request.sid)
+    player_name = player.name if player else 'Unknown'
 
     # Gửi thông báo kết quả
     if result['status'] == 'correct_first':
@@ -211,13 +330,9 @@ def on_submit_answer(data):
             'scores': result['scores']
         }, to=room_id)
         
-        # Tự động chuyển vòng mới
-        socketio.sleep(5) # set sau 5s sẽ tự động chuyển sang câu hỏi tiếp theo (có thể thay đổi thời gian nếu muốn, sau khi người chơi trả lời đúng)
-        next_round_data = room.next_round()
-        if next_round_data.get('status') == 'game_over':
-            emit('game_over', next_round_data, to=room_id)
-        else:
-            emit('new_round', next_round_data, to=room_id)
+        # Hẹn chuyển vòng mới sau ROUND_TRANSITION_DELAY giây (thay thế timeout của vòng)
+        round_scheduler.schedule(room_id, ROUND_TRANSITION_DELAY,
+                                 _advance_round, room_id, room.current_round)
             
     elif result['status'] == 'correct':
         # Thông báo khi người khác cũng trả lời đúng (không cần chat)
@@ -228,9 +343,10 @@ def on_submit_answer(data):
         pass
 
 @socketio.on('leave_room')
+@metrics.handler('leave_room')
 def on_leave_room(data):
     """Khi người dùng muốn rời phòng (quay lại lobby)"""
-    room_id = data.get('room_id')
+    room_id = game_logic.normalize_room_id(data.get('room_id'))
     username = session.get('username', 'Guest')
     
     room = game_logic.get_room(room_id)
@@ -240,17 +356,15 @@ def on_leave_room(data):
     
     # Xóa người chơi khỏi phòng
     if request.sid in room.players:
-        player_name = room.players[request.sid]['name']
-        del room.players[request.sid]
+        player_name = room.players[request.sid].name
+        room.remove_player(request.sid)
         
         # Nếu là host mà còn người khác, chuyển host
         if request.sid == room.host_id and room.players:
-            new_host_id = next(iter(room.players.keys()))
-            room.host_id = new_host_id
-            new_host_name = room.players[new_host_id]['name']
-            room.host_name = new_host_name  # Cập nhật host_name
+            new_host_id = room.assign_next_host()
+            new_host_name = room.host_name
             
-            print(f"[LEAVE_ROOM] Host '{player_name}' rời khỏi phòng '{room_id}', host mới: '{new_host_name}'")
+            log.info("[LEAVE_ROOM] Host '%s' rời khỏi phòng '%s', host mới: '%s'", player_name, room_id, new_host_name)
             
             # Thông báo cho những người còn lại về host mới
             emit('host_changed', {
@@ -259,14 +373,11 @@ def on_leave_room(data):
                 'message': f'{new_host_name} là chủ phòng mới'
             }, to=room_id)
         else:
-            print(f"[LEAVE_ROOM] '{player_name}' rời khỏi phòng '{room_id}'")
+            log.debug("[LEAVE_ROOM] '%s' rời khỏi phòng '%s'", player_name, room_id)
         
         # Update database
         game_logic.save_room_to_db(room_id)
         
-        # Broadcast cập nhật danh sách phòng tới tất cả (bao gồm người vừa rời)
-        socketio.emit('room_list_updated', game_logic.get_room_list())
-        print(f"[LEAVE_ROOM] Đã broadcast room_list_updated")
     else:
         emit('error', {'message': 'Bạn không có trong phòng.'})
         
@@ -283,6 +394,5 @@ def on_leave_room(data):
         'host_id': room.host_id if room.players else None
     }, to=room_id)
     
-    # Broadcast danh sách phòng cập nhật tới tất cả user
-    socketio.emit('room_list_updated', game_logic.get_room_list())
-    print(f"[LEAVE_ROOM] Đã broadcast room_list_updated")
\ No newline at end of file
+    # Báo sảnh chờ danh sách phòng đã đổi (gộp và gửi diff)
+    lobby_broadcaster.mark_dirty()
\ No newline at end of file
@@ -1,6 +1,25 @@
+from eventlet import patcher, tpool
 from flask_socketio import SocketIO
 from flask_sqlalchemy import SQLAlchemy
 
 # Khởi tạo nhưng chưa gán vào app
 db = SQLAlchemy()
 socketio = SocketIO(async_mode='eventlet')
+
+# _thread gốc (không bị monkey patch) để biết đang chạy trên OS thread nào;
+# module được import trên OS thread chạy event loop (hub)
+_real_thread = patcher.original('_thread')
+_HUB_THREAD_IDENT = _real_thread.get_ident()
+
+
+def on_hub():
+    """True nếu đang chạy trên OS thread của event loop eventlet"""
+    return _real_thread.get_ident() == _HUB_THREAD_IDENT
+
+
+def run_off_hub(fn, *args):
+    """Gọi fn(*args) không chặn event loop: trong thread pool (tpool) nếu đang ở hub,
+    trực tiếp nếu đã ở OS thread khác (ví dụ benchmark dùng threading)"""
+    if on_hub():
+        return tpool.execute(fn, *args)
+    return fn(*args)
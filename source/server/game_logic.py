@@ -1,83 +1,46 @@
+import logging
 import random
+import sys
 import time
 import os
-import csv
+
+from source.server.answer_log import AnswerLog
+from source.server.answer_matching import matches_answer
+from source.server.extensions import socketio
+from source.server.media import describe_media
+from source.server.metrics import metrics
+from source.server.question_bank import QuestionBank
+from source.server.room_directory import room_directory
+from source.server.scheduler import round_scheduler
+
+log = logging.getLogger(__name__)
 
 # đường dẫn tới file questions_output.csv
 _THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 _QUESTIONS_CSV = os.path.abspath(os.path.join(_THIS_DIR, '..', '..', 'statics', 'questions_output.csv'))
 
-# Đọc câu hỏi từ CSV
-QUESTIONS = []
+# Ngân hàng câu hỏi đọc từ CSV (giữ snapshot bất biến, append O(1))
+question_bank = QuestionBank(_QUESTIONS_CSV)
 
 def load_questions_from_file():
-    global QUESTIONS
-    try:
-        if os.path.exists(_QUESTIONS_CSV):
-            # Mở file với encoding utf-8-sig để loại bỏ BOM nếu có
-            with open(_QUESTIONS_CSV, 'r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                QUESTIONS = []
-                for row in reader:
-                    # Strip whitespace từ keys và values
-                    cleaned_row = {k.strip(): v.strip() if isinstance(v, str) else v for k, v in row.items()}
-                    # Chuyển đổi id sang số nguyên
-                    cleaned_row['id'] = int(cleaned_row['id'])
-                    QUESTIONS.append(cleaned_row)
-        else:
-            QUESTIONS = []
-    except Exception as e:
-        print(f"Error loading questions: {e}")
-        import traceback
-        traceback.print_exc()
-        QUESTIONS = []
+    """Đọc lại toàn bộ file CSV (chỉ gọi khi cần reload tường minh)"""
+    return question_bank.reload()
 
 
-def add_question_to_file(media_filename, answer, prompt, media_type='image'):
+def add_question_to_file(media_filename, answer, prompt, media_type='image', category=None, difficulty=None):
     """Thêm một câu hỏi mới vào file questions_output.csv (append).
 
     media_filename: tên file đã lưu vào statics/{images,videos}, hoặc None cho text-only
     answer: văn bản đáp án
     prompt: câu hỏi văn bản
     media_type: loại media ('image', 'video', hoặc 'text')
+    category, difficulty: giá trị lọc tùy chọn (chỉ ghi khi file CSV có cột tương ứng)
     """
     try:
-        global QUESTIONS
-        
-        # Tìm ID mới (max ID + 1)
-        max_id = 0
-        if QUESTIONS:
-            max_id = max(int(q['id']) for q in QUESTIONS if 'id' in q)
-        new_id = max_id + 1
-
-        # Tạo dòng mới
-        new_question = {
-            "id": new_id,
-            "prompt": prompt,
-            "answer": answer,
-            "media": media_filename if media_filename else "",
-            "type": media_type
-        }
-        
-        # Ghi thêm vào file CSV (append mode)
-        os.makedirs(os.path.dirname(_QUESTIONS_CSV), exist_ok=True)
-        file_exists = os.path.exists(_QUESTIONS_CSV) and os.path.getsize(_QUESTIONS_CSV) > 0
-        
-        with open(_QUESTIONS_CSV, 'a', newline='', encoding='utf-8') as f:
-            fieldnames = ['id', 'prompt', 'answer', 'media', 'type']
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            
-            # Nếu file mới tạo, viết header
-            if not file_exists:
-                writer.writeheader()
-            
-            writer.writerow(new_question)
-
-        # Cập nhật QUESTIONS trong bộ nhớ
-        QUESTIONS.append(new_question)
+        question_bank.add(media_filename, answer, prompt, media_type, category, difficulty)
         return True
     except Exception as e:
-        print(f"Error adding question: {e}")
+        log.error("Error adding question: %s", e)
         return False
 
 # Load questions khi import module
@@ -87,26 +50,78 @@ load_questions_from_file()
 # Key: room_id, Value: thông tin phòng
 game_rooms = {}
 
+# Chỉ mục ngược để tra cứu O(1) thay vì duyệt toàn bộ game_rooms
+# Key: SID, Value: room_id của phòng người chơi đang ở
+player_room_index = {}
+# Key: (room_id, username), Value: SID hiện tại của người chơi đó trong phòng
+player_name_index = {}
+
+# Danh sách phòng dựng sẵn cho sảnh chờ, cập nhật mỗi khi trạng thái phòng đổi
+# Key: room_id, Value: {"id", "host", "count"} (chỉ các phòng được hiển thị)
+_room_list_entries = {}
+_room_list_cache = None  # list dựng sẵn từ _room_list_entries, None khi cần dựng lại
+_room_list_changes = set()  # room_id đã đổi từ lần drain_room_list_changes() trước
+_empty_rooms = set()  # room_id của các phòng không còn người chơi (cho sweeper)
+# room_id có trạng thái đổi từ lần drain_dirty_rooms() trước (cho room_snapshot);
+# chỉ theo dõi khi track_dirty_rooms bật để set không lớn dần khi tắt snapshot
+_dirty_rooms = set()
+track_dirty_rooms = False
+
+# Phòng trống quá số giây này sẽ bị sweeper xóa
+STALE_ROOM_SECONDS = 300
+# Chu kỳ chạy sweeper (giây)
+SWEEP_INTERVAL = 30
+
+class Player:
+    """Trạng thái một người chơi trong phòng (dùng __slots__ thay cho dict)"""
+
+    __slots__ = ('name', 'score')
+
+    def __init__(self, name, score=0):
+        self.name = name
+        self.score = score
+
+    def to_dict(self):
+        return {"name": self.name, "score": self.score}
+
+
 class GameRoom:
-    """Đại diện cho một phòng chơi"""
+    """Đại diện cho một phòng chơi
+
+    Dùng __slots__ và chỉ tạo các cấu trúc của ván chơi (set người đã trả lời
+    đúng, pool câu hỏi, bộ đệm lịch sử) khi cần, vì phần lớn phòng tạo qua
+    HTTP chỉ nằm ở sảnh chờ.
+    """
+
+    __slots__ = ('room_id', 'host_id', 'host_name', 'players', 'game_started', 'last_activity',
+                 'current_round', 'max_rounds', 'round_time_limit', 'current_question', 'questions',
+                 'answered_this_round', 'answer_history', 'remaining_question_indices',
+                 'question_filters', 'question_seed', 'question_rng')
+
     def __init__(self, room_id, host_id=None, host_name=None):
-        self.room_id = room_id
+        self.room_id = sys.intern(room_id)
         self.host_id = host_id
-        self.host_name = host_name  # Lưu host_name ngay cả khi host_id là None (cho HTTP create)
-        # Nếu host_id truyền None -> tạo phòng rỗng (chỉ metadata), người chơi sẽ được thêm khi họ join
-        if host_id is not None:
-            self.players = {host_id: {"name": host_name, "score": 0}}
-        else:
-            self.players = {}
+        # Lưu host_name ngay cả khi host_id là None (cho HTTP create)
+        self.host_name = sys.intern(host_name) if host_name else host_name
+        self.players = {}
         self.game_started = False
         self.last_activity = time.time()  # Track thời gian cuối cùng có người trong phòng
         self.current_round = 0
         self.max_rounds = 10
+        self.round_time_limit = 60  # Số giây tối đa cho một vòng nếu không ai trả lời đúng
         self.current_question = None
-        self.answered_this_round = set() # Lưu SID của người đã trả lời đúng
-        self.answer_history = []  # Lưu các câu trả lời (đúng/sai) trong phòng
-        # Pool các chỉ số câu hỏi chưa được dùng trong phòng này. Khi rỗng, sẽ refill (shuffle) lại.
-        self.remaining_question_indices = []
+        self.questions = None  # Snapshot ngân hàng câu hỏi cố định cho cả ván (chụp khi start_game)
+        self.answered_this_round = None  # set SID của người đã trả lời đúng (tạo ở mỗi vòng)
+        # Lưu các câu trả lời (đúng/sai) trong phòng: bộ đệm vòng giới hạn, phần cũ ghi xuống DB
+        self.answer_history = AnswerLog(room_id, time.time())
+        # Pool các chỉ số câu hỏi chưa được dùng trong phòng này (tạo khi bắt đầu ván). Khi rỗng, sẽ refill lại.
+        self.remaining_question_indices = None
+        self.question_filters = None  # (category, difficulty) chọn khi bắt đầu ván, None = không lọc
+        self.question_seed = None  # Seed rút câu hỏi của ván (lưu lại để replay)
+        self.question_rng = None
+        # Nếu host_id truyền None -> tạo phòng rỗng (chỉ metadata), người chơi sẽ được thêm khi họ join
+        if host_id is not None:
+            self.add_player(host_id, host_name)
 
     def add_player(self, player_id, player_name):
         """Thêm người chơi mới vào phòng"""
@@ -115,58 +130,105 @@ class GameRoom:
             self.host_id = player_id
 
         if player_id not in self.players:
-            self.players[player_id] = {"name": player_name, "score": 0}
+            player_name = sys.intern(player_name)
+            self.players[player_id] = Player(player_name)
+            player_room_index[player_id] = self.room_id
+            player_name_index[(self.room_id, player_name)] = player_id
+            self.last_activity = time.time()
+            _touch_room(self)
             return True
         return False
 
     def remove_player(self, player_id):
         """Xóa người chơi khi họ ngắt kết nối"""
         if player_id in self.players:
-            del self.players[player_id]
+            pdata = self.players.pop(player_id)
+            _unindex_player(self.room_id, player_id, pdata.name)
+            self.last_activity = time.time()
+            _touch_room(self)
+
+    def rebind_player(self, old_id, new_id):
+        """Chuyển dữ liệu người chơi sang SID mới khi họ reconnect"""
+        pdata = self.players.pop(old_id)
+        _unindex_player(self.room_id, old_id, pdata.name)
+        self.players[new_id] = pdata
+        player_room_index[new_id] = self.room_id
+        player_name_index[(self.room_id, pdata.name)] = new_id
+        if self.host_id == old_id:
+            self.host_id = new_id
+        _touch_room(self)
+        return pdata
+
+    def assign_next_host(self):
+        """Chỉ định người chơi còn lại đầu tiên làm chủ phòng mới"""
+        new_host_id = next(iter(self.players))
+        self.host_id = new_host_id
+        self.host_name = self.players[new_host_id].name
+        _touch_room(self)
+        return new_host_id
 
     def get_player_list(self):
         """Lấy danh sách người chơi và điểm số"""
-        return [p for p in self.players.values()]
+        return [p.to_dict() for p in self.players.values()]
     
-    def start_game(self):
-        """Bắt đầu game, reset điểm và bắt đầu vòng 1"""
-        print(f"Starting game in room {self.room_id} with {len(self.players)} players")
+    def start_game(self, seed=None, category=None, difficulty=None):
+        """Bắt đầu game, reset điểm và bắt đầu vòng 1
+
+        seed: seed rút câu hỏi (None = ngẫu nhiên, seed được lưu vào question_seed để replay)
+        category, difficulty: chỉ rút câu hỏi có cột tương ứng khớp (None = không lọc)
+        Trả về None (game không bắt đầu) nếu đã bắt đầu hoặc không có câu hỏi nào khớp bộ lọc.
+        """
+        log.debug("Starting game in room %s with %d players", self.room_id, len(self.players))
         if not self.game_started:
+            # Chuẩn bị pool câu hỏi cho phòng này (reload/upload giữa ván không ảnh hưởng)
+            questions = question_bank.snapshot
+            if not len(questions.candidate_indices(category, difficulty)):
+                log.warning("No questions match category=%r difficulty=%r (room %s)",
+                            category, difficulty, self.room_id)
+                return None
             self.game_started = True
             self.current_round = 0
             for player in self.players.values():
-                player["score"] = 0
-            # Chuẩn bị pool câu hỏi cho phòng này
+                player.score = 0
+            self.answer_history.new_game()
+            self.questions = questions
+            self.question_filters = (category, difficulty) if category or difficulty else None
+            self.question_seed = seed if seed is not None else random.randrange(2 ** 32)
+            self.question_rng = None
             self._reset_question_pool()
+            _touch_room(self)
             next_round_data = self.next_round()
-            print(f"Next round data: {next_round_data}")
             return next_round_data
-        print("Game already started")
+        log.debug("Game already started in room %s", self.room_id)
         return None
 
     def _reset_question_pool(self):
-        """Tạo lại và xáo danh sách chỉ số câu hỏi cho phòng này.
+        """Chọn trước chỉ số câu hỏi cho các vòng của ván: O(max_rounds), không dựng list cả ngân hàng.
 
-        Khi QUESTIONS thay đổi, gọi lại load_questions_from_file() và phương thức này
-        sẽ refill pool cho tất cả phòng mới khi bắt đầu game.
+        Dùng snapshot self.questions của ván hiện tại; câu hỏi mới thêm vào ngân hàng
+        chỉ có hiệu lực từ ván sau. Lọc theo question_filters (category, difficulty)
+        và rút bằng question_rng nên cùng seed cho cùng thứ tự câu hỏi.
         """
         try:
-            total = len(QUESTIONS)
-            # Tạo list các chỉ số và xáo
-            self.remaining_question_indices = list(range(total))
-            random.shuffle(self.remaining_question_indices)
+            candidates = self.questions.candidate_indices(*(self.question_filters or ()))
+            if self.question_rng is None:
+                self.question_rng = random.Random(self.question_seed)
+            count = min(len(candidates), self.max_rounds)
+            # random.sample trên range/list chỉ tốn O(count); next_round pop từ cuối
+            self.remaining_question_indices = self.question_rng.sample(candidates, count)
         except Exception:
             self.remaining_question_indices = []
 
     def next_round(self):
         """Chuẩn bị cho vòng chơi tiếp theo"""
-        print(f"Starting next round. Current round: {self.current_round}, Max rounds: {self.max_rounds}")
         if self.current_round >= self.max_rounds:
             return self.end_game()
 
         # Đảm bảo có câu hỏi để chọn
-        if not QUESTIONS:
-            print("Warning: No questions available")
+        if self.questions is None:
+            self.questions = question_bank.snapshot
+        if not len(self.questions):
+            log.warning("No questions available (room %s)", self.room_id)
             return self.end_game()
 
         self.current_round += 1
@@ -186,24 +248,24 @@ class GameRoom:
 
         # Nếu vẫn không có chỉ số thì kết thúc game
         if q_index is None:
-            print("Warning: No question index available after refill")
+            log.warning("No question index available after refill (room %s)", self.room_id)
             return self.end_game()
 
-        self.current_question = QUESTIONS[q_index]
+        self.current_question = self.questions[q_index]
         self.answered_this_round = set()
-
-        print(f"Selected question (index {q_index}): {self.current_question}")
-
-        # Xác định url và type
-        filename = self.current_question.get('media')
-        media_type = self.current_question.get('type', 'image')
-        
-        if filename:
-            # Build URL dựa trên media type
-            if media_type == 'video':
-                media_url = f"/statics/videos/{filename}"
-            else:
-                media_url = f"/statics/images/{filename}"
+        _mark_dirty(self.room_id)
+
+        # Chỉ log chỉ số câu hỏi: không đưa đáp án vào log
+        log.debug("Room %s round %d/%d: question index %d", self.room_id, self.current_round, self.max_rounds, q_index)
+        return self.round_data()
+
+    def round_data(self):
+        """Dữ liệu vòng hiện tại gửi cho client (không có đáp án)"""
+        # Xác định url và type (URL theo hash nội dung, client cache lâu dài)
+        media = describe_media(self.current_question.get('type', 'image'), self.current_question.get('media'))
+        if media:
+            media_url = media['media_url']
+            media_type = media['media_type']
         else:
             media_url = None
             media_type = 'text'
@@ -218,111 +280,306 @@ class GameRoom:
             "players": self.get_player_list()
         }
 
+    def peek_next_media(self):
+        """Gợi ý tải trước media của vòng sau: {"round", "media_url", "media_type", "size"}
+
+        Chỉ chứa thông tin media (URL theo hash, không có tên file, câu hỏi hay đáp án).
+        Trả về None nếu không còn vòng sau hoặc câu hỏi sau không có media.
+        """
+        if not self.game_started or self.questions is None or self.current_round >= self.max_rounds:
+            return None
+        # next_round lấy chỉ số cuối pool; refill sớm nếu pool rỗng để biết trước câu sau
+        if not self.remaining_question_indices:
+            self._reset_question_pool()
+        if not self.remaining_question_indices:
+            return None
+
+        question = self.questions[self.remaining_question_indices[-1]]
+        media = describe_media(question.get('type', 'image'), question.get('media'))
+        if not media or media['size'] is None:
+            return None
+        return {"round": self.current_round + 1, **media}
+
     def check_answer(self, player_id, answer):
         """Kiểm tra câu trả lời của người chơi"""
         if not self.current_question:
             return {"status": "error", "message": "Game chưa bắt đầu"}
 
-        # Chuẩn hóa câu trả lời (viết thường, bỏ dấu cách)
-        clean_answer = answer.strip().lower()
-        correct_answer = self.current_question['answer'].lower()
+        # So khớp với các dạng chuẩn hóa đã tính sẵn khi nạp câu hỏi (bỏ dấu, hoa/thường, khoảng trắng)
+        is_correct = matches_answer(self.current_question, answer)
         timestamp = time.time()
+        player = self.players.get(player_id)
+        player_name = player.name if player else 'Unknown'
 
-        # Lưu bản ghi câu trả lời (tạm thời). Sẽ cập nhật field 'correct' sau khi so sánh
-        record = {
-            'round': self.current_round,
-            'player_id': player_id,
-            'player_name': self.players.get(player_id, {}).get('name', 'Unknown'),
-            'answer': answer,
-            'timestamp': timestamp,
-            'correct': False
-        }
-
-        if clean_answer == correct_answer:
+        if is_correct:
             # Nếu người này chưa trả lời đúng vòng này
             if player_id not in self.answered_this_round:
-                self.players[player_id]["score"] += 1
+                player.score += 1
                 self.answered_this_round.add(player_id)
-                # Đánh dấu record đúng và lưu
-                record['correct'] = True
-                self.answer_history.append(record)
+                _mark_dirty(self.room_id)
+                self.answer_history.append(self.current_round, player_id, player_name, answer, timestamp,
+                                           correct=True)
 
                 # Nếu là người đầu tiên trả lời đúng
                 if len(self.answered_this_round) == 1:
                     return {
                         "status": "correct_first",
-                        "player_name": self.players[player_id]["name"],
+                        "player_name": player.name,
                         "scores": self.get_player_list()
                     }
                 else:
                     # Trả lời đúng nhưng không phải đầu tiên
-                    return {"status": "correct", "player_name": self.players[player_id]["name"]}
+                    return {"status": "correct", "player_name": player.name}
             else:
                 # Người này đã trả lời đúng trước đó
-                record['correct'] = False
-                record['note'] = 'already_answered'
-                self.answer_history.append(record)
+                self.answer_history.append(self.current_round, player_id, player_name, answer, timestamp,
+                                           note='already_answered')
                 return {"status": "already_answered"}
         else:
             # Lưu câu trả lời sai vào lịch sử
-            self.answer_history.append(record)
-            return {"status": "incorrect", "player_name": self.players[player_id]["name"]}
+            self.answer_history.append(self.current_round, player_id, player_name, answer, timestamp)
+            return {"status": "incorrect", "player_name": player.name}
 
     def end_game(self):
         """Kết thúc game và trả về bảng xếp hạng"""
         self.game_started = False
         self.current_question = None
+        _touch_room(self)
         scoreboard = sorted(self.get_player_list(), key=lambda x: x['score'], reverse=True)
         return {"status": "game_over", "scoreboard": scoreboard}
 
+    def to_state(self):
+        """Trạng thái phòng dạng tuple chỉ gồm kiểu cơ bản (cho room_snapshot)
+
+        Câu hỏi lưu theo id (không theo chỉ số snapshot) để khôi phục được sau khi
+        ngân hàng câu hỏi được nạp lại. Không gồm lịch sử câu trả lời trong memory.
+        """
+        questions = self.questions
+        remaining = None
+        if self.remaining_question_indices is not None:
+            remaining = [questions[i]['id'] for i in self.remaining_question_indices]
+        return (
+            self.room_id, self.host_id, self.host_name,
+            [(sid, p.name, p.score) for sid, p in self.players.items()],
+            self.game_started, self.last_activity, self.current_round, self.max_rounds, self.round_time_limit,
+            self.current_question['id'] if self.current_question else None,
+            self.question_filters, self.question_seed, remaining,
+            list(self.answered_this_round) if self.answered_this_round is not None else None,
+            self.answer_history.game, self.answer_history.created_at
+        )
+
+    @classmethod
+    def from_state(cls, state, questions):
+        """Dựng lại phòng từ to_state() với snapshot ngân hàng câu hỏi questions (chưa đăng ký vào game_rooms)"""
+        (room_id, host_id, host_name, players, game_started, last_activity, current_round, max_rounds,
+         round_time_limit, current_id, question_filters, question_seed, remaining, answered,
+         answer_game, answer_created) = state
+        room = cls(room_id, None, host_name)
+        room.host_id = host_id
+        for sid, name, score in players:
+            room.players[sid] = Player(sys.intern(name), score)
+        room.game_started = game_started
+        room.last_activity = last_activity
+        room.current_round = current_round
+        room.max_rounds = max_rounds
+        room.round_time_limit = round_time_limit
+        room.question_filters = question_filters
+        room.question_seed = question_seed
+        if game_started or remaining is not None:
+            room.questions = questions
+            if current_id is not None:
+                room.current_question = questions.get_by_id(current_id)
+            if remaining is not None:
+                # Câu hỏi đã bị xóa khỏi ngân hàng thì bỏ qua
+                indices = (questions.index_of(qid) for qid in remaining)
+                room.remaining_question_indices = [i for i in indices if i is not None]
+        if answered is not None:
+            room.answered_this_round = set(answered)
+        room.answer_history = AnswerLog(room_id, answer_created)
+        room.answer_history.game = answer_game
+        return room
+
 # --- Các hàm quản lý phòng ---
 
-def get_room_list():
-    """Lấy danh sách các phòng đang chờ (chưa started) hoặc phòng đang chơi nhưng còn người chơi"""
-    global game_rooms
-    rooms = []
-    current_time = time.time()
-    rooms_to_delete = []
-    
-    for room_id, r in game_rooms.items():
-        # Xóa phòng trống quá 300 giây (5 phút)
-        if len(r.players) == 0 and (current_time - r.last_activity) > 300:
-            rooms_to_delete.append(room_id)
-            delete_room_from_db(room_id)
-            continue
-        
-        # Hiển thị:
-        # 1. Phòng chưa started (chờ người tham gia)
-        # 2. Phòng đã started nhưng còn có người chơi (để rejoin)
-        # Bỏ qua: phòng đã started và trống
-        if r.game_started and len(r.players) == 0:
-            continue
-            
-        count = len(r.players)
-        # Lấy host_name từ room object (được set khi tạo room)
-        # Nếu không có, fallback tới players dict hoặc '---'
-        host_name = r.host_name  # Lưu từ khi tạo room
-        if not host_name:
-            if hasattr(r, 'host_id') and r.host_id in r.players:
-                host_name = r.players[r.host_id]['name']
-            else:
-                host_name = '---'
+def _unindex_player(room_id, player_id, player_name):
+    """Gỡ người chơi khỏi các chỉ mục ngược (chỉ khi chỉ mục còn trỏ tới phòng này)"""
+    if player_room_index.get(player_id) == room_id:
+        del player_room_index[player_id]
+    if player_name_index.get((room_id, player_name)) == player_id:
+        del player_name_index[(room_id, player_name)]
+
+def _build_room_entry(room):
+    """Dựng mục danh sách phòng cho sảnh chờ, None nếu phòng không được hiển thị"""
+    # Hiển thị:
+    # 1. Phòng chưa started (chờ người tham gia)
+    # 2. Phòng đã started nhưng còn có người chơi (để rejoin)
+    # Bỏ qua: phòng đã started và trống
+    if room.game_started and len(room.players) == 0:
+        return None
 
-        rooms.append({"id": r.room_id, "host": host_name, "count": count})
-    
-    # Xóa phòng trống quá lâu
-    for room_id in rooms_to_delete:
-        del game_rooms[room_id]
+    # Lấy host_name từ room object (được set khi tạo room)
+    # Nếu không có, fallback tới players dict hoặc '---'
+    host_name = room.host_name
+    if not host_name:
+        if room.host_id in room.players:
+            host_name = room.players[room.host_id].name
+        else:
+            host_name = '---'
+    return {"id": room.room_id, "host": host_name, "count": len(room.players)}
+
+def _touch_room(room):
+    """Cập nhật mục của phòng trong danh sách phòng dựng sẵn (gọi khi trạng thái phòng đổi)"""
+    global _room_list_cache
+    room_id = room.room_id
+    if game_rooms.get(room_id) is not room:
+        return
+    _mark_dirty(room_id)
+
+    if room.players:
+        _empty_rooms.discard(room_id)
+    else:
+        _empty_rooms.add(room_id)
 
-    return rooms
+    entry = _build_room_entry(room)
+    old_entry = _room_list_entries.get(room_id)
+    if entry == old_entry:
+        return
+    if entry is None:
+        del _room_list_entries[room_id]
+    else:
+        _room_list_entries[room_id] = entry
+    _room_list_cache = None
+    _room_list_changes.add(room_id)
+
+def _mark_dirty(room_id):
+    if track_dirty_rooms:
+        _dirty_rooms.add(room_id)
+
+def _drop_room(room_id):
+    """Xóa phòng khỏi memory cùng các mục chỉ mục ngược còn sót lại"""
+    global _room_list_cache
+    room = game_rooms.pop(room_id, None)
+    round_scheduler.cancel(room_id)
+    _mark_dirty(room_id)
+    if room:
+        room_directory.release(room_id)
+    _empty_rooms.discard(room_id)
+    if _room_list_entries.pop(room_id, None) is not None:
+        _room_list_cache = None
+        _room_list_changes.add(room_id)
+    if room:
+        for player_id, pdata in room.players.items():
+            _unindex_player(room_id, player_id, pdata.name)
+    return room
+
+def get_room_of_player(player_id):
+    """Trả về phòng mà SID đang ở (O(1)), hoặc None"""
+    room_id = player_room_index.get(player_id)
+    if room_id is None:
+        return None
+    return game_rooms.get(room_id)
+
+def find_player_sid_by_name(room_id, username):
+    """Trả về SID nếu người chơi với username đã có trong phòng (O(1)), hoặc None"""
+    return player_name_index.get((room_id, username))
+
+def get_room_list():
+    """Lấy danh sách các phòng đang chờ (chưa started) hoặc phòng đang chơi nhưng còn người chơi
+
+    Trả về list dựng sẵn (không được sửa), chỉ dựng lại khi có phòng thay đổi.
+    """
+    global _room_list_cache
+    if _room_list_cache is None:
+        _room_list_cache = list(_room_list_entries.values())
+    return _room_list_cache
+
+def get_room_list_entry(room_id):
+    """Lấy mục danh sách phòng của một phòng, None nếu phòng không được hiển thị"""
+    return _room_list_entries.get(room_id)
+
+def drain_room_list_changes():
+    """Trả về tập room_id có mục danh sách phòng thay đổi kể từ lần gọi trước"""
+    global _room_list_changes
+    changes = _room_list_changes
+    _room_list_changes = set()
+    return changes
+
+def drain_dirty_rooms():
+    """Trả về tập room_id có trạng thái đổi (hoặc đã bị xóa) kể từ lần gọi trước"""
+    global _dirty_rooms
+    dirty = _dirty_rooms
+    _dirty_rooms = set()
+    return dirty
+
+def restore_rooms(states):
+    """Nạp lại các phòng từ room_snapshot (warm restart), trả về list GameRoom đã nạp
+
+    Người chơi giữ SID cũ cho tới khi kết nối lại (join_room tìm theo username
+    và rebind_player sang SID mới).
+    """
+    questions = question_bank.snapshot
+    restored = []
+    for state in states:
+        room = GameRoom.from_state(state, questions)
+        room_id = room.room_id
+        if room_id in game_rooms or not room_directory.claim(room_id):
+            continue
+        game_rooms[room_id] = room
+        for player_id, pdata in room.players.items():
+            player_room_index[player_id] = room_id
+            player_name_index[(room_id, pdata.name)] = player_id
+        _touch_room(room)
+        restored.append(room)
+    return restored
+
+def sweep_stale_rooms():
+    """Xóa các phòng trống quá STALE_ROOM_SECONDS giây, trả về list room_id đã xóa"""
+    current_time = time.time()
+    stale = [room_id for room_id in _empty_rooms
+             if current_time - game_rooms[room_id].last_activity > STALE_ROOM_SECONDS]
+    for room_id in stale:
+        delete_room_from_db(room_id)
+        _drop_room(room_id)
+    if stale:
+        log.info("[ROOM_SWEEP] Đã xóa %d phòng trống quá %ss", len(stale), STALE_ROOM_SECONDS)
+    return stale
+
+def start_room_sweeper(app):
+    """Chạy sweep_stale_rooms() định kỳ trong background (thay cho việc xóa trong get_room_list)"""
+    def _loop():
+        while True:
+            socketio.sleep(SWEEP_INTERVAL)
+            try:
+                with app.app_context():
+                    if sweep_stale_rooms():
+                        from source.server.lobby import lobby_broadcaster
+                        lobby_broadcaster.mark_dirty()
+            except Exception as e:
+                log.exception("[ROOM_SWEEP] Lỗi: %s: %s", type(e).__name__, e)
+    socketio.start_background_task(_loop)
+
+def normalize_room_id(room_id):
+    """room_id do client gửi (chuỗi, số...) thành str đã bỏ khoảng trắng, None nếu rỗng"""
+    if room_id is None:
+        return None
+    room_id = str(room_id).strip()
+    return room_id or None
 
 def create_new_room(room_id, host_id, host_name):
-    """Tạo một phòng mới"""
+    """Tạo một phòng mới (None nếu room_id rỗng hoặc đã tồn tại)"""
     # host_id/host_name có thể là None nếu tạo phòng qua HTTP (chưa có socket SID)
+    room_id = normalize_room_id(room_id)
+    if room_id is None or room_id in game_rooms:
+        return None
+    # Khi chạy nhiều worker: room_id phải chưa thuộc worker khác
+    if not room_directory.claim(room_id):
+        return None
+    # claim có thể nhường event loop (danh bạ SQLite): handler khác có thể vừa tạo phòng này
     if room_id in game_rooms:
         return None
     room = GameRoom(room_id, host_id, host_name)
     game_rooms[room_id] = room
+    _touch_room(room)
     # Lưu vào database
     save_room_to_db(room_id)
     return room
@@ -333,35 +590,27 @@ def get_room(room_id):
 
 def remove_player_from_room(player_id):
     """Tìm và xóa người chơi khỏi bất kỳ phòng nào họ đang ở"""
-    room_to_remove_from = None
+    room_to_remove_from = get_room_of_player(player_id)
     player_name = ""
-    
-    for room in game_rooms.values():
-        if player_id in room.players:
-            player_name = room.players[player_id]["name"]
-            room.remove_player(player_id)
-            room_to_remove_from = room
-            break
-
-    if room_to_remove_from:
+
+    if room_to_remove_from and player_id in room_to_remove_from.players:
+        player_name = room_to_remove_from.players[player_id].name
+        room_to_remove_from.remove_player(player_id)
         # Nếu phòng trống, xóa ngay
         if len(room_to_remove_from.players) == 0:
             room_id = room_to_remove_from.room_id
             # Xóa từ database
             delete_room_from_db(room_id)
             # Xóa từ memory
-            del game_rooms[room_id]
-            print(f"[ROOM_CLEANUP] Phòng '{room_id}' đã xóa vì không còn người chơi")
+            _drop_room(room_id)
+            log.info("[ROOM_CLEANUP] Phòng '%s' đã xóa vì không còn người chơi", room_id)
             # Trả về danh sách players rỗng
             return (room_id, [], player_name)
         
         # Nếu chủ phòng rời đi, chỉ định chủ phòng mới
         if player_id == room_to_remove_from.host_id:
-            new_host_id = next(iter(room_to_remove_from.players))
-            room_to_remove_from.host_id = new_host_id
-            new_host_name = room_to_remove_from.players[new_host_id]['name']
-            room_to_remove_from.host_name = new_host_name  # Cập nhật host_name
-            print(f"[HOST_CHANGE] Chủ phòng '{room_to_remove_from.room_id}' đổi thành: {new_host_name}")
+            room_to_remove_from.assign_next_host()
+            log.info("[HOST_CHANGE] Chủ phòng '%s' đổi thành: %s", room_to_remove_from.room_id, room_to_remove_from.host_name)
         
         # Update database với player list mới và host mới
         save_room_to_db(room_to_remove_from.room_id)
@@ -370,65 +619,50 @@ def remove_player_from_room(player_id):
     
     return (None, None, None)
 
+@metrics.timed('save_room_to_db')
 def save_room_to_db(room_id):
-    """Lưu thông tin phòng vào database"""
-    from source.server.models import GameRoom as GameRoomModel
-    from source.server.extensions import db
+    """Lưu thông tin phòng vào database (write-behind: ghi vào bộ đệm, flush theo lô)"""
+    from source.server.persistence import room_store
     from datetime import datetime
     
     room = game_rooms.get(room_id)
     if not room:
         return
     
-    # Kiểm tra xem phòng đã có trong DB chưa
-    db_room = GameRoomModel.query.filter_by(room_id=room_id).first()
-    if db_room:
-        # Update
-        db_room.player_count = len(room.players)
-        db_room.game_started = room.game_started
-        db_room.last_activity = datetime.utcnow()
-    else:
-        # Insert - lấy host_name từ room.host_name (được set khi create) hoặc từ players
-        host_name = room.host_name
-        if not host_name and room.host_id in room.players:
-            host_name = room.players[room.host_id].get('name', 'Unknown')
-        if not host_name:
-            host_name = 'Unknown'
-            
-        db_room = GameRoomModel(
-            room_id=room_id,
-            host_name=host_name,
-            player_count=len(room.players),
-            game_started=room.game_started
-        )
-        db.session.add(db_room)
-    
-    db.session.commit()
-
+    # host_name chỉ dùng khi insert - lấy từ room.host_name (được set khi create) hoặc từ players
+    host_name = room.host_name
+    if not host_name and room.host_id in room.players:
+        host_name = room.players[room.host_id].name
+    if not host_name:
+        host_name = 'Unknown'
+
+    room_store.save(room_id, {
+        'host_name': host_name,
+        'player_count': len(room.players),
+        'game_started': room.game_started,
+        'last_activity': datetime.utcnow()
+    })
+
+@metrics.timed('delete_room_from_db')
 def delete_room_from_db(room_id):
-    """Xóa phòng khỏi database"""
-    from source.server.models import GameRoom as GameRoomModel
-    from source.server.extensions import db
-    
-    db_room = GameRoomModel.query.filter_by(room_id=room_id).first()
-    if db_room:
-        db.session.delete(db_room)
-        db.session.commit()
+    """Xóa phòng khỏi database (write-behind: ghi vào bộ đệm, flush theo lô)"""
+    from source.server.persistence import room_store
+
+    room_store.delete(room_id)
 
-def load_rooms_from_db():
-    """Tải phòng từ database vào memory (khi server start)"""
+@metrics.timed('purge_stale_rooms_from_db')
+def purge_stale_rooms_from_db():
+    """Xóa (một câu DELETE) các phòng trống quá STALE_ROOM_SECONDS giây trong database"""
     from source.server.models import GameRoom as GameRoomModel
+    from source.server.extensions import db
     from datetime import datetime, timedelta
-    
-    db_rooms = GameRoomModel.query.all()
-    for db_room in db_rooms:
-        # Xóa phòng nếu trống > 5 phút
-        time_elapsed = (datetime.utcnow() - db_room.last_activity).total_seconds()
-        if db_room.player_count == 0 and time_elapsed > 300:
-            delete_room_from_db(db_room.room_id)
-            continue
-        
-        # Tải phòng vào memory (chỉ nếu chưa start game)
-        if not db_room.game_started and db_room.room_id not in game_rooms:
-            room = GameRoom(db_room.room_id, host_id=None, host_name=db_room.host_name)
-            game_rooms[db_room.room_id] = room
\ No newline at end of file
+
+    cutoff = datetime.utcnow() - timedelta(seconds=STALE_ROOM_SECONDS)
+    deleted = GameRoomModel.query.filter(
+        GameRoomModel.player_count == 0,
+        GameRoomModel.last_activity < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    if deleted:
+        log.info("[PURGE_ROOMS] Đã xóa %d phòng trống quá hạn trong database", deleted)
+    return deleted
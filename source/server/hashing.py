@@ -0,0 +1,63 @@
+import os
+
+from eventlet.semaphore import Semaphore
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from source.server.extensions import on_hub, run_off_hub
+
+
+class PasswordHasherBusy(Exception):
+    """Hàng đợi hash mật khẩu đã đầy (backpressure), client nên thử lại sau"""
+
+
+class PasswordHasher:
+    """Chạy hash/kiểm tra mật khẩu trong thread pool của eventlet (tpool).
+
+    PBKDF2/scrypt tốn hàng chục ms CPU; chạy trực tiếp sẽ chặn toàn bộ event loop
+    (mọi phòng game) trong worker eventlet duy nhất. Số thao tác đang chờ bị giới
+    hạn bởi MAX_PENDING: khi đầy, yêu cầu mới chờ tối đa QUEUE_TIMEOUT giây rồi
+    báo PasswordHasherBusy.
+
+    Cấu hình (app.config hoặc biến môi trường):
+      PASSWORD_HASH_METHOD   : method của werkzeug, ví dụ 'scrypt' hoặc 'pbkdf2:sha256:600000'
+      PASSWORD_HASH_OFFLOAD  : '0' để hash trực tiếp trên event loop (chỉ dùng để so sánh)
+      PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_QUEUE_TIMEOUT
+    """
+
+    def __init__(self):
+        self.method = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+        self.offload = os.environ.get('PASSWORD_HASH_OFFLOAD', '1') != '0'
+        self.max_pending = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32))
+        self.queue_timeout = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', 5))
+        self._slots = Semaphore(self.max_pending)
+
+    def init_app(self, app):
+        """Đọc cấu hình từ app.config (nếu có)"""
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.offload = app.config.get('PASSWORD_HASH_OFFLOAD', self.offload)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self.queue_timeout = app.config.get('PASSWORD_HASH_QUEUE_TIMEOUT', self.queue_timeout)
+        self._slots = Semaphore(self.max_pending)
+
+    def hash(self, password):
+        """Tạo hash cho mật khẩu"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Kiểm tra mật khẩu với hash đã lưu"""
+        return self._run(check_password_hash, password_hash, password)
+
+    def _run(self, fn, *args):
+        # Chỉ cần offload khi đang ở OS thread chạy event loop eventlet;
+        # từ thread khác (ví dụ benchmark dùng threading) thì hash trực tiếp
+        if not self.offload or not on_hub():
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise PasswordHasherBusy()
+        try:
+            return run_off_hub(fn, *args)
+        finally:
+            self._slots.release()
+
+
+password_hasher = PasswordHasher()
@@ -174,6 +174,18 @@ document.addEventListener('DOMContentLoaded', () => {
         addChatMessage('Hệ thống', `--- Vòng ${data.round} bắt đầu! ---`, 'system-msg');
     });
 
+    // 3b. Tải trước media của vòng sau (server chỉ gửi URL theo hash, không có đáp án)
+    const prefetchedUrls = new Set();
+    socket.on('prefetch_media', (data) => {
+        if (!data.media_url || prefetchedUrls.has(data.media_url)) return;
+        prefetchedUrls.add(data.media_url);
+        const link = document.createElement('link');
+        link.rel = 'prefetch';
+        link.href = data.media_url;
+        link.as = data.media_type === 'video' ? 'video' : 'image';
+        document.head.appendChild(link);
+    });
+
     // 4. Form trả lời câu hỏi (chỉ khi game đang chạy)
     answerForm.addEventListener('submit', (e) => {
         e.preventDefault();
@@ -9,13 +9,13 @@ document.addEventListener('DOMContentLoaded', () => {
     const chatInput = document.getElementById('chat-input');
     const chatMessages = document.getElementById('lobby-chat-messages');
 
-    // 1. Yêu cầu danh sách phòng khi vừa vào sảnh
-    socket.emit('request_room_list');
+    // Danh sách phòng cục bộ (id -> room) và version đang giữ theo từng worker (origin)
+    const rooms = new Map();
+    let roomListVersions = null;
 
-    // 2. Lắng nghe sự kiện cập nhật danh sách phòng
-    socket.on('room_list_updated', (rooms) => {
+    function renderRoomList() {
         roomListEl.innerHTML = ''; // Xóa danh sách cũ
-        if (rooms.length === 0) {
+        if (rooms.size === 0) {
             roomListEl.innerHTML = '<p>Chưa có phòng nào. Hãy tạo một phòng!</p>';
             return;
         }
@@ -30,6 +30,34 @@ document.addEventListener('DOMContentLoaded', () => {
             `;
             roomListEl.appendChild(roomEl);
         });
+    }
+
+    // 1. Yêu cầu danh sách phòng khi vừa vào sảnh
+    socket.emit('request_room_list');
+
+    // 2a. Snapshot đầy đủ (khi vừa vào sảnh hoặc khi bị lệch version)
+    socket.on('room_list_updated', (data) => {
+        rooms.clear();
+        data.rooms.forEach(room => rooms.set(room.id, room));
+        roomListVersions = Object.assign({}, data.versions);
+        renderRoomList();
+    });
+
+    // 2b. Diff danh sách phòng: áp dụng nếu khớp version của worker gửi, ngược lại xin lại snapshot
+    socket.on('room_list_delta', (delta) => {
+        if (roomListVersions === null) return; // Đang chờ snapshot
+        const known = roomListVersions[delta.origin] || 0;
+        if (delta.version <= known) return; // Đã có trong snapshot
+        if (delta.base_version !== known) {
+            roomListVersions = null;
+            socket.emit('request_room_list');
+            return;
+        }
+        delta.removed.forEach(id => rooms.delete(id));
+        delta.added.forEach(room => rooms.set(room.id, room));
+        delta.changed.forEach(room => rooms.set(room.id, room));
+        roomListVersions[delta.origin] = delta.version;
+        renderRoomList();
     });
 
     // 3. Xử lý khi bấm nút "Tham gia"
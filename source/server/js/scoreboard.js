@@ -18,4 +18,33 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Xóa dữ liệu cũ
     localStorage.removeItem('scoreboard');
+
+    // Bảng xếp hạng lưu trên server (toàn thời gian / tháng / tuần)
+    const periodSelect = document.getElementById('leaderboard-period');
+    const leaderboardBody = document.querySelector('#leaderboard-table tbody');
+    const meLine = document.getElementById('leaderboard-me');
+
+    function loadLeaderboard() {
+        fetch(`/leaderboard?period=${periodSelect.value}&limit=10`)
+            .then(res => res.json())
+            .then(data => {
+                leaderboardBody.innerHTML = '';
+                if (!data.success || data.top.length === 0) {
+                    leaderboardBody.innerHTML = '<tr><td colspan="3">Chưa có dữ liệu xếp hạng.</td></tr>';
+                }
+                (data.top || []).forEach(player => {
+                    const row = leaderboardBody.insertRow();
+                    row.insertCell().textContent = player.rank;
+                    row.insertCell().textContent = player.name;
+                    row.insertCell().textContent = player.score;
+                });
+                meLine.textContent = data.me ? `Hạng của bạn: ${data.me.rank} (${data.me.score} điểm)` : '';
+            })
+            .catch(err => console.error('Lỗi tải bảng xếp hạng:', err));
+    }
+
+    if (periodSelect && leaderboardBody) {
+        periodSelect.addEventListener('change', loadLeaderboard);
+        loadLeaderboard();
+    }
 });
\ No newline at end of file
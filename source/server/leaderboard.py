@@ -0,0 +1,201 @@
+import bisect
+import logging
+import os
+import time
+from datetime import datetime
+
+from source.server.extensions import db
+from source.server.metrics import metrics
+from source.server.persistence import WriteBehind
+
+log = logging.getLogger(__name__)
+
+# Các kỳ xếp hạng: toàn thời gian, theo tháng, theo tuần (ISO, giờ UTC)
+PERIOD_KINDS = ('all', 'month', 'week')
+
+
+def period_key(kind, when=None):
+    """Khóa kỳ trong bảng LeaderboardScore: 'all', '2026-10' hoặc '2026-W42'"""
+    if kind == 'all':
+        return 'all'
+    when = when or datetime.utcnow()
+    if kind == 'month':
+        return when.strftime('%Y-%m')
+    if kind == 'week':
+        year, week, _ = when.isocalendar()
+        return f"{year}-W{week:02d}"
+    raise ValueError(f"Kỳ xếp hạng không hợp lệ: {kind}")
+
+
+class _Board:
+    """Bảng xếp hạng của một kỳ: list khóa (-điểm, tên) luôn được sắp xếp.
+
+    Cập nhật một người chơi là O(log n) tìm + dịch mảng, top N là cắt list,
+    hạng là một lần bisect; không cần sắp xếp lại toàn bộ.
+    """
+
+    __slots__ = ('_keys', '_scores')
+
+    def __init__(self, scores):
+        self._scores = dict(scores)
+        self._keys = sorted((-score, name) for name, score in self._scores.items())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def set_score(self, name, score):
+        old = self._scores.get(name)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-old, name))]
+        self._scores[name] = score
+        bisect.insort(self._keys, (-score, name))
+
+    def top(self, limit):
+        result = []
+        rank = 0
+        for i, (neg_score, name) in enumerate(self._keys[:limit]):
+            # Cùng điểm thì cùng hạng (1, 2, 2, 4...)
+            if i == 0 or neg_score != self._keys[i - 1][0]:
+                rank = i + 1
+            result.append({"rank": rank, "name": name, "score": -neg_score})
+        return result
+
+    def rank_of(self, name):
+        score = self._scores.get(name)
+        if score is None:
+            return None
+        return {"rank": bisect.bisect_left(self._keys, (-score,)) + 1, "name": name, "score": score}
+
+
+class Leaderboard(WriteBehind):
+    """Bảng xếp hạng toàn cục và theo kỳ, lưu trong bảng LeaderboardScore.
+
+    Mỗi kỳ được nạp vào memory (truy vấn theo index period) khi có người hỏi
+    tới và nạp lại sau CACHE_TTL giây, để thấy cả các ván kết thúc ở worker
+    khác khi chạy nhiều worker. record_game() chỉ xếp kết quả vào hàng chờ;
+    các ván được ghi theo lô (một transaction, trong thread pool, xem
+    persistence.WriteBehind) rồi cập nhật tăng dần bảng trong memory.
+
+    Cấu hình (app.config hoặc biến môi trường):
+      LEADERBOARD_CACHE_TTL : số giây giữ một kỳ trong memory trước khi nạp lại (mặc định 30)
+    """
+
+    # Số kỳ giữ trong memory (kỳ cũ ít được hỏi tới sẽ bị bỏ, nạp lại khi cần)
+    MAX_CACHED_PERIODS = 8
+    FLUSH_INTERVAL = 1.0
+    FLUSH_THRESHOLD = 50
+    LOG_TAG = 'LEADERBOARD'
+
+    def __init__(self):
+        super().__init__()
+        self.cache_ttl = float(os.environ.get('LEADERBOARD_CACHE_TTL', 30))
+        self._boards = {}  # period -> (_Board, thời điểm nạp theo time.monotonic)
+
+    def init_app(self, app):
+        """Đọc cấu hình, chạy vòng ghi kết quả theo lô"""
+        self.cache_ttl = float(app.config.get('LEADERBOARD_CACHE_TTL', self.cache_ttl))
+        super().init_app(app)
+
+    def _board(self, period):
+        from source.server.models import LeaderboardScore, User
+
+        # Kết quả còn chờ ghi được ghi trước để bảng xếp hạng đã gồm các ván vừa xong
+        if self._pending:
+            self.flush()
+        cached = self._boards.get(period)
+        if cached is not None and time.monotonic() - cached[1] < self.cache_ttl:
+            return cached[0]
+        rows = db.session.query(User.username, LeaderboardScore.score) \
+            .join(User, User.id == LeaderboardScore.user_id) \
+            .filter(LeaderboardScore.period == period).all()
+        board = _Board(rows)
+        if cached is None and len(self._boards) >= self.MAX_CACHED_PERIODS:
+            self._boards.pop(next(k for k in self._boards if k != 'all'))
+        self._boards[period] = (board, time.monotonic())
+        return board
+
+    def top(self, kind='all', limit=10):
+        """Top limit người chơi của kỳ hiện tại: [{"rank", "name", "score"}]"""
+        return self._board(period_key(kind)).top(limit)
+
+    def rank_of(self, username, kind='all'):
+        """Hạng của username trong kỳ hiện tại, None nếu chưa có điểm"""
+        return self._board(period_key(kind)).rank_of(username)
+
+    def record_game(self, room_id, scoreboard):
+        """Xếp kết quả một ván vào hàng chờ ghi (scoreboard đã sắp xếp giảm dần từ GameRoom.end_game)"""
+        if scoreboard:
+            self._pending.append((room_id, scoreboard, datetime.utcnow()))
+            self._maybe_flush_soon()
+
+    @metrics.timed('leaderboard_record_game')
+    def flush(self, offload=True):
+        return super().flush(offload)
+
+    def _new_buffer(self):
+        return []  # (room_id, scoreboard, thời điểm kết thúc)
+
+    def _merge_back(self, batch):
+        self._pending[:0] = batch
+
+    def _write(self, batch):
+        """Một transaction cho cả lô: lưu GameResult cho từng người chơi và cộng điểm
+        vào LeaderboardScore của mọi kỳ. Người chơi không có tài khoản bị bỏ qua.
+        Trả về list (period, username, điểm mới) theo thứ tự cập nhật.
+        """
+        updated = []
+        for room_id, scoreboard, finished_at in batch:
+            self._write_game(room_id, scoreboard, finished_at, updated)
+        db.session.commit()
+        return updated
+
+    def _write_game(self, room_id, scoreboard, finished_at, updated):
+        from source.server.models import GameResult, LeaderboardScore, User
+
+        periods = [period_key(kind, finished_at) for kind in PERIOD_KINDS]
+        top_score = scoreboard[0]['score']
+
+        names = [p['name'] for p in scoreboard]
+        user_ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(names)).all())
+        if not user_ids:
+            return
+
+        # autoflush: dòng LeaderboardScore vừa thêm bởi ván trước trong cùng lô cũng được tìm thấy
+        existing = {
+            (row.period, row.user_id): row
+            for row in LeaderboardScore.query.filter(
+                LeaderboardScore.period.in_(periods),
+                LeaderboardScore.user_id.in_(list(user_ids.values()))
+            )
+        }
+
+        rank = 0
+        for i, player in enumerate(scoreboard):
+            if i == 0 or player['score'] != scoreboard[i - 1]['score']:
+                rank = i + 1
+            user_id = user_ids.get(player['name'])
+            if user_id is None:
+                continue
+            won = top_score > 0 and player['score'] == top_score
+            db.session.add(GameResult(user_id=user_id, room_id=room_id, score=player['score'],
+                                      rank=rank, played_at=finished_at))
+            for period in periods:
+                row = existing.get((period, user_id))
+                if row is None:
+                    row = existing[(period, user_id)] = LeaderboardScore(
+                        period=period, user_id=user_id, score=0, games_played=0, wins=0)
+                    db.session.add(row)
+                row.score += player['score']
+                row.games_played += 1
+                row.wins += int(won)
+                updated.append((period, player['name'], row.score))
+
+    def _on_written(self, batch, updated):
+        # Chỉ cập nhật các kỳ đang có trong memory; kỳ khác sẽ nạp từ DB khi cần
+        for period, name, score in updated:
+            cached = self._boards.get(period)
+            if cached is not None:
+                cached[0].set_score(name, score)
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,100 @@
+import logging
+
+from source.server.extensions import socketio
+import source.server.game_logic as game_logic
+from source.server.room_directory import room_directory
+
+log = logging.getLogger(__name__)
+
+# Tên room Socket.IO cho các client đang ở trang sảnh chờ
+LOBBY_ROOM = 'lobby'
+
+
+class LobbyBroadcaster:
+    """Gom các thay đổi danh sách phòng và gửi diff có version cho sảnh chờ.
+
+    Handler chỉ cần gọi mark_dirty(); mọi thay đổi trong cửa sổ WINDOW giây
+    được gộp thành một sự kiện 'room_list_delta'. Snapshot đầy đủ
+    ('room_list_updated') chỉ gửi cho client yêu cầu qua request_room_list
+    (lần đầu vào sảnh hoặc khi bị lệch version). Diff chỉ gửi tới room
+    LOBBY_ROOM nên người đang chơi trong phòng game không nhận.
+    """
+
+    # Cửa sổ gom thay đổi (giây)
+    WINDOW = 0.2
+
+    def __init__(self):
+        self.version = 0
+        self._known = set()  # room id mà client ở version hiện tại đang có
+        self._pending = False
+
+    def mark_dirty(self):
+        """Đánh dấu danh sách phòng đã đổi; flush sẽ chạy sau WINDOW giây"""
+        if self._pending:
+            return
+        self._pending = True
+        socketio.start_background_task(self._flush_later)
+
+    def snapshot(self):
+        """Danh sách phòng đầy đủ kèm version (cho request_room_list)
+
+        Flush trước để snapshot khớp đúng version: các delta sau đó luôn
+        có base_version bằng version của snapshot này. 'versions' là version
+        theo từng worker (origin của delta); khi chạy nhiều worker, snapshot
+        gồm phòng của mọi worker, đọc từ room_directory.
+        """
+        if room_directory.shared:
+            # Phòng của worker khác từ danh bạ (đọc trước: có thể nhường event loop),
+            # phòng của worker này từ memory ngay sau flush nên khớp đúng self.version
+            # kể cả khi danh bạ chưa sync xong
+            versions, rooms = room_directory.snapshot()
+            self.flush()
+            versions[room_directory.worker_id] = self.version
+            rooms = sorted(rooms + game_logic.get_room_list(), key=lambda entry: entry['id'])
+        else:
+            self.flush()
+            versions, rooms = {room_directory.worker_id: self.version}, game_logic.get_room_list()
+        return {'version': self.version, 'versions': versions, 'rooms': rooms}
+
+    def _flush_later(self):
+        socketio.sleep(self.WINDOW)
+        self._pending = False
+        try:
+            self.flush()
+        except Exception as e:
+            log.exception("[LOBBY] Lỗi broadcast: %s: %s", type(e).__name__, e)
+
+    def flush(self):
+        """Tính diff so với version trước và broadcast nếu có thay đổi"""
+        added, changed, removed = [], [], []
+        for room_id in game_logic.drain_room_list_changes():
+            entry = game_logic.get_room_list_entry(room_id)
+            if entry is None:
+                if room_id in self._known:
+                    self._known.discard(room_id)
+                    removed.append(room_id)
+            elif room_id in self._known:
+                changed.append(entry)
+            else:
+                self._known.add(room_id)
+                added.append(entry)
+        if not (added or changed or removed):
+            return None
+
+        self.version += 1
+        entries = {entry['id']: entry for entry in added + changed}
+        entries.update(dict.fromkeys(removed))
+        room_directory.publish(self.version, entries)
+        delta = {
+            'origin': room_directory.worker_id,
+            'version': self.version,
+            'base_version': self.version - 1,
+            'added': added,
+            'changed': changed,
+            'removed': removed
+        }
+        socketio.emit('room_list_delta', delta, to=LOBBY_ROOM)
+        return delta
+
+
+lobby_broadcaster = LobbyBroadcaster()
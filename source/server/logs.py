@@ -0,0 +1,124 @@
+"""Log có cấp độ, ghi bất đồng bộ và lấy mẫu cho server.
+
+Các module ghi log qua logging.getLogger(__name__) (logger con của 'source').
+Handler gắn vào logger gốc 'source' chỉ đẩy record vào hàng đợi (không chặn
+event loop); một OS thread thật (không phải greenlet, xem hashing.py) lấy
+record ra, định dạng và ghi ra stderr. Hàng đợi đầy thì record bị bỏ và đếm
+lại thay vì làm handler phải chờ.
+
+Log dưới WARNING (các dòng theo từng event) được lấy mẫu theo LOG_SAMPLE_RATE;
+WARNING trở lên luôn được ghi.
+
+Cấu hình (app.config hoặc biến môi trường):
+  LOG_LEVEL        : DEBUG, INFO (mặc định), WARNING, ERROR
+  LOG_SAMPLE_RATE  : tỉ lệ giữ lại log dưới WARNING, 0..1 (mặc định 1)
+  LOG_QUEUE_SIZE   : số record tối đa chờ ghi (mặc định 10000)
+"""
+import atexit
+import logging
+import os
+import random
+import sys
+
+from eventlet import patcher
+
+# queue/threading gốc: thread ghi log chạy song song với event loop kể cả khi
+# eventlet đã monkey patch (gunicorn worker eventlet)
+_real_queue = patcher.original('queue')
+_real_threading = patcher.original('threading')
+
+ROOT_LOGGER = 'source'
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+class SamplingFilter(logging.Filter):
+    """Giữ ngẫu nhiên tỉ lệ rate các record dưới WARNING"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        if random.random() < self.rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class AsyncHandler(logging.Handler):
+    """Đẩy record vào hàng đợi; thread riêng ghi ra stream bằng handler đích"""
+
+    def __init__(self, target, capacity):
+        super().__init__()
+        self.target = target
+        self.dropped = 0
+        self._queue = _real_queue.Queue(capacity)
+        self._thread = _real_threading.Thread(target=self._drain, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        # Như handler của stdlib: lỗi định dạng (sai format/args) được báo qua
+        # handleError, không ném ra handler Socket.IO đang gọi log
+        try:
+            # Định dạng message ngay (args có thể đổi sau khi handler trả về)
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = self.target.formatter.formatException(record.exc_info)
+                record.exc_info = None
+            self._queue.put_nowait(record)
+        except _real_queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _drain(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self.target.handle(record)
+
+    def close(self):
+        """Ghi nốt các record còn trong hàng đợi rồi dừng thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=2)
+        self.target.flush()
+        super().close()
+
+
+class LogConfig:
+    """Cấu hình logger 'source' một lần cho process (gọi lại init_app chỉ đổi cấp độ/tỉ lệ)"""
+
+    def __init__(self):
+        self.handler = None
+        self.sampler = SamplingFilter()
+
+    def init_app(self, app):
+        level = app.config.get('LOG_LEVEL', os.environ.get('LOG_LEVEL', 'INFO'))
+        self.sampler.rate = float(app.config.get('LOG_SAMPLE_RATE', os.environ.get('LOG_SAMPLE_RATE', 1.0)))
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.setLevel(level.upper() if isinstance(level, str) else level)
+        logger.propagate = False
+        if self.handler is None:
+            target = logging.StreamHandler(sys.stderr)
+            target.setFormatter(logging.Formatter(LOG_FORMAT))
+            capacity = int(app.config.get('LOG_QUEUE_SIZE', os.environ.get('LOG_QUEUE_SIZE', 10000)))
+            self.handler = AsyncHandler(target, capacity)
+            self.handler.addFilter(self.sampler)
+            logger.addHandler(self.handler)
+            atexit.register(self.handler.close)
+
+    def stats(self):
+        """Số record bị bỏ do lấy mẫu / do hàng đợi đầy"""
+        return {
+            'sampled_out': self.sampler.sampled_out,
+            'dropped': self.handler.dropped if self.handler else 0
+        }
+
+
+log_config = LogConfig()
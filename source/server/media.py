@@ -0,0 +1,158 @@
+import hashlib
+import logging
+import os
+
+from flask import abort, request, send_from_directory
+from werkzeug.security import safe_join
+
+from source.server.extensions import run_off_hub
+
+log = logging.getLogger(__name__)
+
+# Thư mục statics ở gốc repo (chứa images/, videos/, ...)
+STATICS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'statics'))
+
+# URL /m/<hash nội dung> hoặc có ?v=<hash nội dung> được cache 1 năm và đánh dấu immutable
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Cache hash nội dung: đường dẫn -> (mtime_ns, size, hash)
+_content_hashes = {}
+# Hash nội dung -> đường dẫn file (cho URL /m/<hash>)
+_paths_by_hash = {}
+# Đường dẫn đang được hash trong background (warm_hashes)
+_warming = set()
+
+
+def cached_hash(path, st=None):
+    """Hash nội dung đã tính và còn khớp mtime/size của file, None nếu chưa có"""
+    st = st or os.stat(path)
+    cached = _content_hashes.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    return None
+
+
+def content_hash(path):
+    """Hash nội dung file (16 ký tự hex), chỉ tính lại khi mtime/size thay đổi
+
+    Đọc và hash file (~110ms cho 50MB) chạy trong thread pool khi gọi từ event
+    loop, để không làm đứng mọi phòng của worker.
+    """
+    st = os.stat(path)
+    digest = cached_hash(path, st)
+    if digest is not None:
+        return digest
+    digest = run_off_hub(_hash_file, path)
+    _content_hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def _hash_file(path):
+    h = hashlib.blake2b(digest_size=8)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def warm_hashes(paths):
+    """Tính trước hash nội dung của các file trong background (upload, khởi động)"""
+    from source.server.extensions import socketio
+
+    paths = [p for p in paths if p not in _warming]
+    if not paths:
+        return
+    _warming.update(paths)
+
+    def _job():
+        for path in paths:
+            try:
+                content_hash(path)
+            except OSError:
+                pass  # file bị xóa/đổi tên trong lúc chờ
+            finally:
+                _warming.discard(path)
+
+    socketio.start_background_task(_job)
+
+
+def warm_library():
+    """Tính trước hash nội dung của toàn bộ media trong statics (khi khởi động)"""
+    paths = []
+    for root, _dirs, files in os.walk(STATICS_DIR):
+        paths.extend(os.path.join(root, name) for name in files if name != 'manifest.json')
+    warm_hashes(paths)
+    log.debug("[MEDIA] Tính trước hash của %d file media", len(paths))
+
+
+def describe_media(media_type, filename):
+    """Thông tin media của câu hỏi: {"media_url", "media_type", "size"}
+
+    URL dạng /m/<hash nội dung><đuôi file> để không lộ tên file (tên file thường
+    chính là đáp án) và để client cache vĩnh viễn. Dùng bản derivative nhẹ nhất
+    nếu đã được tạo (xem derivatives.py). Trả về None nếu không có file.
+    """
+    from source.server.derivatives import lightest_path
+
+    if not filename:
+        return None
+    folder = 'videos' if media_type == 'video' else 'images'
+    path = safe_join(STATICS_DIR, folder, filename)
+    if not path or not os.path.isfile(path):
+        # File không tồn tại: giữ URL cũ để client nhận 404 như trước
+        return {"media_url": f"/statics/{folder}/{filename}", "media_type": media_type, "size": None}
+
+    path = lightest_path(folder, filename)
+    digest = content_hash(path)
+    ext = os.path.splitext(path)[1].lower()
+    _paths_by_hash[digest] = path
+    return {"media_url": f"/m/{digest}{ext}", "media_type": media_type, "size": os.path.getsize(path)}
+
+
+def send_hashed_media(token):
+    """Gửi file theo URL /m/<hash><đuôi> do describe_media() tạo ra"""
+    digest = os.path.splitext(token)[0]
+    path = _paths_by_hash.get(digest)
+    if path is None or not os.path.isfile(path) or content_hash(path) != digest:
+        abort(404)
+    return _send(os.path.dirname(path), os.path.basename(path), digest, immutable=True)
+
+
+def send_media(directory, filename):
+    """Gửi file media hỗ trợ Range, ETag mạnh theo nội dung và Cache-Control.
+
+    - Range/If-Range/If-None-Match do werkzeug xử lý (conditional=True)
+    - ETag = hash nội dung, nên 304 vẫn đúng khi file bị ghi đè cùng tên; khi
+      hash chưa có trong cache thì tạm dùng ETag theo mtime/size và hash file
+      trong background (không hash trên event loop trong lúc xử lý request)
+    - Có ?v=<hash> khớp nội dung: cache 1 năm + immutable; không có: no-cache
+      (trình duyệt luôn hỏi lại bằng ETag và nhận 304 nếu không đổi)
+    - File được gửi qua wsgi.file_wrapper của server (sendfile khi server hỗ trợ),
+      hoặc X-Sendfile nếu bật USE_X_SENDFILE khi chạy sau nginx/apache
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        # Để send_from_directory trả 404 như cũ
+        return send_from_directory(directory, filename)
+
+    st = os.stat(path)
+    etag = cached_hash(path, st)
+    if etag is None:
+        warm_hashes([path])
+        return _send(directory, filename, f"{st.st_mtime_ns:x}-{st.st_size:x}", immutable=False)
+    return _send(directory, filename, etag, immutable=request.args.get('v') == etag)
+
+
+def _send(directory, filename, etag, immutable):
+    response = send_from_directory(
+        directory, filename,
+        conditional=True,
+        etag=etag,
+        max_age=IMMUTABLE_MAX_AGE if immutable else None
+    )
+    if immutable:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,234 @@
+"""Số liệu vận hành của server, xuất dạng text Prometheus tại /metrics.
+
+Thu thập trong memory của worker (không cần thư viện ngoài):
+  - độ trễ, số lần gọi, số lỗi của từng handler Socket.IO (decorator handler())
+  - độ trễ, số lỗi của các thao tác DB trong game_logic (decorator timed())
+  - số client nhận mỗi lần emit (fan-out) theo tên event
+  - số phòng, người chơi, ván đang chơi, bộ đệm ghi sau... đọc lúc scrape
+
+Mỗi lần ghi chỉ là vài phép cộng trên dict/list nên chạy thẳng trên event loop.
+Khi chạy nhiều worker, mỗi worker xuất số liệu riêng (Prometheus scrape từng
+WORKER_URL và gộp lại). METRICS_ENABLED='0' để tắt.
+"""
+import bisect
+import os
+import time
+from collections import Counter
+from functools import wraps
+
+from source.server.extensions import socketio
+
+# Biên trên các bucket độ trễ (giây)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Biên trên các bucket số client nhận một emit
+FANOUT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 1024)
+
+# name -> (kiểu, mô tả, tên label)
+FAMILIES = {
+    'quiz_socketio_handler_seconds': ('histogram', 'Thời gian xử lý handler Socket.IO', 'event'),
+    'quiz_socketio_handler_errors_total': ('counter', 'Số lần handler Socket.IO ném exception', 'event'),
+    'quiz_db_seconds': ('histogram', 'Thời gian các thao tác DB của game_logic', 'op'),
+    'quiz_db_errors_total': ('counter', 'Số lần thao tác DB của game_logic ném exception', 'op'),
+    'quiz_emit_recipients': ('histogram', 'Số client nhận mỗi lần emit (fan-out)', 'event'),
+    'quiz_hub_block_seconds': ('histogram', 'Thời gian hub bị chặn (khi bật profiler) theo handler', 'handler'),
+}
+_BUCKETS = {
+    'quiz_socketio_handler_seconds': LATENCY_BUCKETS,
+    'quiz_db_seconds': LATENCY_BUCKETS,
+    'quiz_emit_recipients': FANOUT_BUCKETS,
+    'quiz_hub_block_seconds': LATENCY_BUCKETS,
+}
+
+
+class Histogram:
+    """Histogram bucket cố định kiểu Prometheus (đếm không cộng dồn, cộng dồn khi xuất)"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # phần tử cuối: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_value(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """Registry số liệu của worker: histogram/counter theo một label và gauge đọc lúc scrape"""
+
+    def __init__(self):
+        self.enabled = os.environ.get('METRICS_ENABLED', '1') != '0'
+        self._histograms = {}  # (name, label) -> Histogram
+        self._counters = Counter()  # (name, label) -> số
+        self._gauges = {}  # name -> (kiểu, mô tả, hàm trả về số hoặc dict label -> số, tên label)
+        self.started = time.time()
+
+    def init_app(self, app):
+        """Đọc cấu hình, đăng ký gauge và đo fan-out của mọi emit"""
+        self.enabled = app.config.get('METRICS_ENABLED', self.enabled)
+        self._register_gauges()
+        if self.enabled and socketio.server is not None:
+            self._wrap_emit(socketio.server.manager)
+
+    # --- Ghi số liệu ---
+
+    def observe(self, name, label, value):
+        hist = self._histograms.get((name, label))
+        if hist is None:
+            hist = self._histograms[(name, label)] = Histogram(_BUCKETS[name])
+        hist.observe(value)
+
+    def inc(self, name, label, amount=1):
+        self._counters[(name, label)] += amount
+
+    def gauge(self, name, help_text, fn, kind='gauge', label=None):
+        """Đăng ký số liệu đọc lúc scrape: fn() trả về số, hoặc dict label -> số nếu có label"""
+        self._gauges[name] = (kind, help_text, fn, label)
+
+    def _timed(self, fn, hist_name, error_name, label):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                self.inc(error_name, label)
+                raise
+            finally:
+                self.observe(hist_name, label, time.perf_counter() - start)
+        return wrapper
+
+    def handler(self, event):
+        """Decorator cho handler Socket.IO: đo độ trễ, đếm lần gọi và lỗi
+
+        Đặt ngay dưới @socketio.on(...) (trên @rate_limiter.limit) để event bị
+        chặn vì rate limit cũng được đếm.
+        """
+        def decorator(fn):
+            return self._timed(fn, 'quiz_socketio_handler_seconds', 'quiz_socketio_handler_errors_total', event)
+        return decorator
+
+    def timed(self, op):
+        """Decorator cho thao tác DB: đo độ trễ và đếm lỗi theo tên op"""
+        def decorator(fn):
+            return self._timed(fn, 'quiz_db_seconds', 'quiz_db_errors_total', op)
+        return decorator
+
+    def _wrap_emit(self, manager):
+        """Bọc manager.emit để ghi số client (trong worker này) nhận từng event"""
+        if getattr(manager, '_metrics_wrapped', False):
+            return
+        original = manager.emit
+
+        @wraps(original)
+        def emit(event, data, namespace, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+            if self.enabled:
+                self.observe('quiz_emit_recipients', event, _recipients(manager, namespace, to or room, skip_sid))
+            return original(event, data, namespace, room=room, skip_sid=skip_sid, callback=callback, to=to,
+                            **kwargs)
+
+        manager.emit = emit
+        manager._metrics_wrapped = True
+
+    # --- Gauge của các module khác ---
+
+    def _register_gauges(self):
+        import source.server.game_logic as game_logic
+        from source.server.answer_log import answer_spill
+        from source.server.lobby import lobby_broadcaster
+        from source.server.logs import log_config
+        from source.server.persistence import room_store
+        from source.server.rate_limit import rate_limiter
+        from source.server.scheduler import round_scheduler
+
+        self.gauge('quiz_rooms', 'Số phòng trong memory của worker', lambda: len(game_logic.game_rooms))
+        self.gauge('quiz_players', 'Số người chơi trong các phòng', lambda: len(game_logic.player_room_index))
+        self.gauge('quiz_games_in_progress', 'Số phòng đang chơi',
+                   lambda: sum(1 for room in game_logic.game_rooms.values() if room.game_started))
+        self.gauge('quiz_round_timers', 'Số hẹn giờ chuyển vòng đang chờ', lambda: len(round_scheduler._jobs))
+        self.gauge('quiz_lobby_version', 'Version diff danh sách phòng của sảnh chờ',
+                   lambda: lobby_broadcaster.version)
+        self.gauge('quiz_persist_pending', 'Số phòng chờ ghi metadata xuống DB', lambda: len(room_store._pending))
+        self.gauge('quiz_answer_spill_pending', 'Số câu trả lời cũ chờ ghi xuống DB',
+                   lambda: len(answer_spill._pending))
+        self.gauge('quiz_rate_limited_total', 'Số event bị chặn vì vượt rate limit',
+                   lambda: dict(rate_limiter.rejected), kind='counter', label='event')
+        self.gauge('quiz_log_dropped_total', 'Số dòng log bị bỏ (lấy mẫu hoặc hàng đợi đầy)',
+                   lambda: log_config.stats(), kind='counter', label='reason')
+        self.gauge('quiz_uptime_seconds', 'Số giây từ khi worker khởi động', lambda: time.time() - self.started)
+
+    # --- Xuất text Prometheus ---
+
+    def render(self):
+        """Toàn bộ số liệu theo định dạng text exposition 0.0.4 của Prometheus"""
+        lines = []
+        for name, (kind, help_text, label) in FAMILIES.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for (hist_name, value), hist in sorted(self._histograms.items()):
+                    if hist_name != name:
+                        continue
+                    lines.extend(_render_histogram(name, label, value, hist))
+            else:
+                for (counter_name, value), count in sorted(self._counters.items()):
+                    if counter_name == name:
+                        lines.append(f'{name}{{{label}="{_escape(value)}"}} {_format_value(count)}')
+
+        for name, (kind, help_text, fn, label) in self._gauges.items():
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if label is None:
+                lines.append(f"{name} {_format_value(value)}")
+            else:
+                for key, v in sorted(value.items()):
+                    lines.append(f'{name}{{{label}="{_escape(key)}"}} {_format_value(v)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _render_histogram(name, label, value, hist):
+    labels = f'{label}="{_escape(value)}"'
+    lines = []
+    cumulative = 0
+    for bound, count in zip(hist.bounds, hist.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+    lines.append(f'{name}_sum{{{labels}}} {_format_value(hist.sum)}')
+    lines.append(f'{name}_count{{{labels}}} {hist.count}')
+    return lines
+
+
+def _recipients(manager, namespace, room, skip_sid):
+    """Số client trong worker này sẽ nhận một emit (room None = cả namespace)"""
+    ns = manager.rooms.get(namespace or '/', {})
+    if room is None or isinstance(room, str):
+        count = len(ns.get(room, ()))
+    else:
+        count = len(set().union(*(ns.get(r, ()) for r in room)))
+    if skip_sid:
+        count -= 1 if isinstance(skip_sid, str) else len(skip_sid)
+    return max(count, 0)
+
+
+metrics = Metrics()
@@ -1,5 +1,5 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from source.server.extensions import db
+from source.server.hashing import password_hasher
 from datetime import datetime
 
 # Model cho bảng User
@@ -9,25 +9,92 @@ class User(db.Model):
     password_hash = db.Column(db.String(128))
 
     def set_password(self, password):
-        """Tạo hash cho mật khẩu"""
-        self.password_hash = generate_password_hash(password)
+        """Tạo hash cho mật khẩu (chạy trong thread pool, không chặn event loop)"""
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        """Kiểm tra hash mật khẩu"""
-        return check_password_hash(self.password_hash, password)
+        """Kiểm tra hash mật khẩu (chạy trong thread pool, không chặn event loop)"""
+        return password_hasher.verify(self.password_hash, password)
 
     def __repr__(self):
         return f'<User {self.username}>'
 
 # Model cho bảng GameRoom
 class GameRoom(db.Model):
+    __table_args__ = (
+        # Phục vụ purge phòng trống quá hạn: WHERE player_count = 0 AND last_activity < ?
+        db.Index('ix_game_room_player_count_last_activity', 'player_count', 'last_activity'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     room_id = db.Column(db.String(100), unique=True, nullable=False)  # Tên phòng
     host_name = db.Column(db.String(80), nullable=False)  # Tên host
     player_count = db.Column(db.Integer, default=1)  # Số lượng người chơi
-    game_started = db.Column(db.Boolean, default=False)  # Game đã bắt đầu?
+    game_started = db.Column(db.Boolean, default=False, index=True)  # Game đã bắt đầu?
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Thời gian tạo
-    last_activity = db.Column(db.DateTime, default=datetime.utcnow)  # Lần cuối cùng có hoạt động
+    last_activity = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Lần cuối cùng có hoạt động
     
     def __repr__(self):
-        return f'<GameRoom {self.room_id} - {self.player_count} players>'
\ No newline at end of file
+        return f'<GameRoom {self.room_id} - {self.player_count} players>'
+
+
+# Model cho bảng AnswerRecord: câu trả lời cũ bị đẩy ra khỏi bộ đệm vòng trong memory (xem answer_log.py)
+class AnswerRecord(db.Model):
+    __table_args__ = (
+        # Truy vấn theo vòng: WHERE room_id = ? AND game = ? AND round = ?
+        db.Index('ix_answer_record_room_game_round', 'room_id', 'game', 'round'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    room_id = db.Column(db.String(100), nullable=False)
+    room_created = db.Column(db.Float, nullable=False)  # Thời điểm tạo phòng (room_id có thể được dùng lại)
+    game = db.Column(db.Integer, nullable=False)  # Ván thứ mấy trong phòng
+    round = db.Column(db.Integer, nullable=False)
+    player_id = db.Column(db.String(64))  # SID lúc trả lời
+    player_name = db.Column(db.String(80))
+    answer = db.Column(db.String(200))
+    timestamp = db.Column(db.Float, nullable=False)
+    correct = db.Column(db.Boolean, default=False)
+    note = db.Column(db.String(32))
+
+    def __repr__(self):
+        return f'<AnswerRecord {self.room_id} #{self.game} r{self.round} {self.player_name}>'
+
+
+# Model cho bảng GameResult: kết quả của từng người chơi trong mỗi ván
+class GameResult(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    room_id = db.Column(db.String(100), nullable=False)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    rank = db.Column(db.Integer, nullable=False)  # Hạng trong ván
+    played_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<GameResult user={self.user_id} {self.room_id} {self.score}>'
+
+# Model cho bảng LeaderboardScore: điểm cộng dồn theo kỳ ('all', 'YYYY-MM', 'YYYY-Www')
+class LeaderboardScore(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('period', 'user_id', name='uq_leaderboard_score_period_user'),
+        # Nạp bảng xếp hạng của một kỳ theo thứ tự điểm: WHERE period = ? ORDER BY score DESC
+        db.Index('ix_leaderboard_score_period_score', 'period', 'score'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(10), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    score = db.Column(db.Integer, nullable=False, default=0)
+    games_played = db.Column(db.Integer, nullable=False, default=0)
+    wins = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<LeaderboardScore {self.period} user={self.user_id} {self.score}>'
+
+
+def ensure_indexes():
+    """Tạo các index còn thiếu cho bảng đã tồn tại (db.create_all không thêm index vào bảng cũ)"""
+    for table in (User.__table__, GameRoom.__table__, AnswerRecord.__table__,
+                  GameResult.__table__, LeaderboardScore.__table__):
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
@@ -0,0 +1,159 @@
+import atexit
+import logging
+
+from eventlet.semaphore import Semaphore
+
+from source.server.extensions import db, socketio, run_off_hub
+from source.server.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehind:
+    """Khung chung cho bộ đệm ghi sau (write-behind) xuống database.
+
+    Lớp con thêm thay đổi vào self._pending (O(1), không chạm DB) rồi gọi
+    _maybe_flush_soon(). Bộ đệm được ghi theo lô mỗi FLUSH_INTERVAL giây, khi
+    đạt FLUSH_THRESHOLD mục, hoặc khi tắt server. _write() (transaction + commit,
+    kể cả fsync của WAL) chạy trong thread pool với app context và session riêng,
+    nên handler và các phòng khác không phải chờ DB.
+
+    Lớp con định nghĩa: _new_buffer(), _write(batch), _merge_back(batch) và LOG_TAG;
+    _on_written(batch, result) (tùy chọn) chạy lại trên event loop sau khi ghi xong.
+    """
+
+    # Chu kỳ flush định kỳ (giây)
+    FLUSH_INTERVAL = 1.0
+    # Số mục trong bộ đệm để kích hoạt flush sớm
+    FLUSH_THRESHOLD = 200
+    LOG_TAG = 'WRITE_BEHIND'
+
+    def __init__(self):
+        self.app = None
+        self._pending = self._new_buffer()
+        self._flush_scheduled = False
+        self._flush_lock = Semaphore(1)  # một lô đang ghi tại một thời điểm
+
+    def init_app(self, app):
+        """Gắn app, chạy vòng flush định kỳ và flush lần cuối khi tắt server"""
+        self.app = app
+        socketio.start_background_task(self._loop)
+        # Lúc tắt server thread pool có thể đã dừng: ghi trực tiếp
+        atexit.register(self.flush, offload=False)
+
+    def _maybe_flush_soon(self):
+        if len(self._pending) >= self.FLUSH_THRESHOLD and not self._flush_scheduled:
+            self._flush_scheduled = True
+            socketio.start_background_task(self.flush)
+
+    def _loop(self):
+        while True:
+            socketio.sleep(self.FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self, offload=True):
+        """Ghi toàn bộ bộ đệm xuống DB trong một transaction, trả về số mục đã ghi"""
+        self._flush_scheduled = False
+        with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch = self._pending
+            self._pending = self._new_buffer()
+            try:
+                if offload:
+                    result = run_off_hub(self._write_in_context, batch)
+                else:
+                    result = self._write_in_context(batch)
+            except Exception as e:
+                # Trả lại các thay đổi chưa ghi được để thử ở lần flush sau
+                self._merge_back(batch)
+                log.error("[%s] Lỗi ghi %d mục: %s: %s", self.LOG_TAG, len(batch), type(e).__name__, e)
+                return 0
+            self._on_written(batch, result)
+            return len(batch)
+
+    def _write_in_context(self, batch):
+        # Chạy trong thread pool: app context riêng nên có session (và connection) riêng,
+        # được trả về pool khi context kết thúc
+        if self.app is None:
+            return self._write_rollback_on_error(batch)
+        with self.app.app_context():
+            return self._write_rollback_on_error(batch)
+
+    def _write_rollback_on_error(self, batch):
+        try:
+            return self._write(batch)
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _new_buffer(self):
+        raise NotImplementedError
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+    def _merge_back(self, batch):
+        raise NotImplementedError
+
+    def _on_written(self, batch, result):
+        pass
+
+
+class RoomWriteBehind(WriteBehind):
+    """Bộ đệm ghi sau cho metadata phòng trong bảng GameRoom.
+
+    save()/delete() chỉ ghi vào bộ đệm trong memory. Mỗi phòng chỉ giữ thao tác
+    mới nhất, nên nhiều lần lưu liên tiếp gộp thành một.
+    """
+
+    FLUSH_INTERVAL = 1.0
+    FLUSH_THRESHOLD = 200
+    LOG_TAG = 'PERSIST'
+
+    def save(self, room_id, data):
+        """Đánh dấu phòng cần lưu với metadata data"""
+        self._pending[room_id] = data
+        self._maybe_flush_soon()
+
+    def delete(self, room_id):
+        """Đánh dấu phòng cần xóa khỏi DB"""
+        self._pending[room_id] = None
+        self._maybe_flush_soon()
+
+    @metrics.timed('room_store_flush')
+    def flush(self, offload=True):
+        return super().flush(offload)
+
+    def _new_buffer(self):
+        return {}  # room_id -> dict metadata (lưu) hoặc None (xóa)
+
+    def _merge_back(self, batch):
+        # Không đè lên thay đổi mới hơn
+        for room_id, data in batch.items():
+            self._pending.setdefault(room_id, data)
+
+    def _write(self, batch):
+        from source.server.models import GameRoom as GameRoomModel
+
+        to_delete = [room_id for room_id, data in batch.items() if data is None]
+        to_save = {room_id: data for room_id, data in batch.items() if data is not None}
+
+        if to_delete:
+            GameRoomModel.query.filter(GameRoomModel.room_id.in_(to_delete)) \
+                .delete(synchronize_session=False)
+
+        if to_save:
+            existing = GameRoomModel.query.filter(GameRoomModel.room_id.in_(list(to_save))).all()
+            for db_room in existing:
+                data = to_save.pop(db_room.room_id)
+                db_room.player_count = data['player_count']
+                db_room.game_started = data['game_started']
+                db_room.last_activity = data['last_activity']
+            for room_id, data in to_save.items():
+                db.session.add(GameRoomModel(room_id=room_id, **data))
+
+        db.session.commit()
+
+
+room_store = RoomWriteBehind()
@@ -0,0 +1,317 @@
+"""Profiling event loop eventlet khi đang chạy (bật/tắt không cần restart).
+
+Mọi greenlet (handler Socket.IO, request HTTP, background task) chạy lần
+lượt trên một OS thread (hub). Một greenlet chạy lâu không nhường
+(time.sleep thay cho socketio.sleep, commit SQLite, hash PBKDF2 không
+offload...) sẽ làm đứng mọi phòng của worker. Profiler dùng một OS thread
+thật (không phải greenlet, giống logs.py) nên vẫn chạy khi hub bị chặn:
+
+  - lấy mẫu stack của greenlet đang chạy trên hub mỗi PROFILE_INTERVAL giây
+    (sys._current_frames), gộp thành stack dạng "collapsed" của flamegraph
+    (flamegraph.pl, speedscope, inferno...); mẫu hub đang rảnh bị bỏ qua
+  - watchdog: một greenlet tick đều đặn; tick trễ quá PROFILE_BLOCK_THRESHOLD
+    giây nghĩa là hub đang bị chặn, stack của greenlet đang chặn được chụp
+    ngay lúc đó, gắn với handler trong events.py (nếu có) và ghi log WARNING
+
+Bật bằng PROFILE_ENABLED=1 khi khởi động hoặc POST /admin/profile lúc chạy;
+dump()/stop() ghi file .folded vào PROFILE_DIR.
+
+Cấu hình (app.config hoặc biến môi trường):
+  PROFILE_ENABLED          : '1' để bật ngay khi khởi động
+  PROFILE_INTERVAL         : chu kỳ lấy mẫu (giây, mặc định 0.005)
+  PROFILE_BLOCK_THRESHOLD  : hub bị chặn quá số giây này thì báo (mặc định 0.1)
+  PROFILE_DIR              : thư mục ghi file (mặc định <tmp>/quiz-profiles)
+"""
+import atexit
+import gc
+import logging
+import os
+import sys
+import tempfile
+from collections import Counter
+
+import greenlet
+from eventlet import patcher
+
+from source.server.extensions import socketio
+from source.server.metrics import metrics
+
+log = logging.getLogger(__name__)
+
+_real_thread = patcher.original('_thread')
+_real_threading = patcher.original('threading')
+_real_time = patcher.original('time')
+
+# Stack của hub lúc rảnh (đang chờ I/O/timer) nằm trong các module này
+_IDLE_MODULES = ('eventlet/hubs/', 'eventlet\\hubs\\')
+# Module chứa handler Socket.IO / view HTTP (để gắn lần chặn hub với handler)
+_HANDLER_MODULES = ('source.server.events:', 'source.server.routes:')
+# Số mẫu chặn hub giữ lại để xem qua /admin/profile
+MAX_BLOCK_EVENTS = 100
+# Số frame tối đa của một stack
+MAX_DEPTH = 64
+# Giới hạn chu kỳ lấy mẫu (giây): nhỏ hơn thì thread lấy mẫu và tick của hub quay liên tục
+MIN_INTERVAL = 0.001
+MAX_INTERVAL = 1.0
+# Ngưỡng chặn hub tối đa (giây)
+MAX_THRESHOLD = 60.0
+
+
+class BlockEvent:
+    """Một lần hub bị chặn: handler gây ra, thời lượng (khi đã kết thúc) và stack"""
+
+    __slots__ = ('started', 'duration', 'handler', 'stack')
+
+    def __init__(self, started, handler, stack):
+        self.started = started
+        self.duration = None
+        self.handler = handler
+        self.stack = stack
+
+    def to_dict(self):
+        return {
+            'started': self.started,
+            'duration': self.duration,
+            'handler': self.handler,
+            'stack': self.stack.split(';')
+        }
+
+
+class HubProfiler:
+    """Lấy mẫu stack trên hub và phát hiện greenlet chặn hub quá ngưỡng"""
+
+    def __init__(self):
+        self.interval = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+        self.threshold = float(os.environ.get('PROFILE_BLOCK_THRESHOLD', 0.1))
+        self.directory = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'quiz-profiles'))
+        self.worker_id = str(os.getpid())
+        self.running = False
+        self.started = None
+        self.error = None  # lỗi làm thread lấy mẫu dừng giữa chừng
+        self.samples = Counter()  # stack collapsed -> số mẫu
+        self.idle_samples = 0
+        self.blocks = []  # BlockEvent, tối đa MAX_BLOCK_EVENTS gần nhất
+        self._labels = {}  # code object -> "module:hàm"
+        self._lock = _real_threading.Lock()
+        self._hub_ident = None
+        self._last_tick = 0.0
+        self._pending_block = None
+        self._generation = 0
+
+    def init_app(self, app):
+        """Đọc cấu hình và bật profiler nếu PROFILE_ENABLED (gọi trên thread chạy event loop)"""
+        from source.server.room_directory import room_directory
+
+        self.interval = float(app.config.get('PROFILE_INTERVAL', self.interval))
+        self.threshold = float(app.config.get('PROFILE_BLOCK_THRESHOLD', self.threshold))
+        self.directory = app.config.get('PROFILE_DIR', self.directory)
+        self.worker_id = room_directory.worker_id
+        self._hub_ident = _real_thread.get_ident()
+        atexit.register(self.stop)
+        enabled = app.config.get('PROFILE_ENABLED', os.environ.get('PROFILE_ENABLED', '0'))
+        if enabled not in (False, '0', 0, None):
+            self.start()
+
+    # --- Bật / tắt ---
+
+    def start(self, interval=None, threshold=None):
+        """Bắt đầu lấy mẫu (xóa mẫu cũ); gọi lại khi đang chạy chỉ đổi interval/threshold
+
+        ValueError nếu interval/threshold ngoài khoảng cho phép (xem check_settings).
+        """
+        self.interval, self.threshold = check_settings(interval if interval is not None else self.interval,
+                                                       threshold if threshold is not None else self.threshold)
+        if self.running:
+            return
+        if self._hub_ident is None:
+            self._hub_ident = _real_thread.get_ident()
+        with self._lock:
+            self.samples.clear()
+            self.idle_samples = 0
+            self.blocks = []
+        self._pending_block = None
+        self._last_tick = _real_time.monotonic()
+        self.started = _real_time.time()
+        self.error = None
+        self.running = True
+        self._generation += 1
+        generation = self._generation
+        socketio.start_background_task(self._tick_loop, generation)
+        _real_threading.Thread(target=self._sample_loop, args=(generation,),
+                               name='hub-profiler', daemon=True).start()
+        log.info("[PROFILE] Bắt đầu lấy mẫu mỗi %ss, ngưỡng chặn hub %ss", self.interval, self.threshold)
+
+    def stop(self):
+        """Dừng lấy mẫu và ghi kết quả ra file, trả về dict đường dẫn (None nếu không chạy)"""
+        if not self.running:
+            return None
+        self.running = False
+        self._generation += 1
+        paths = self.dump()
+        log.info("[PROFILE] Đã dừng, ghi %s", paths['samples'])
+        return paths
+
+    # --- Thu thập (chạy trên OS thread riêng, trừ _tick_loop) ---
+
+    def _tick_loop(self, generation):
+        """Greenlet trên hub: tick đều đặn cho watchdog; kết thúc (log, metrics) các lần chặn đã qua
+
+        Log và metrics chỉ ghi từ hub: lock của logging có thể đã bị eventlet
+        monkey patch thành lock của greenlet, không dùng được từ OS thread khác.
+        """
+        while self.running and generation == self._generation:
+            now = _real_time.monotonic()
+            pending = self._pending_block
+            if pending is not None:
+                self._pending_block = None
+                pending.duration = round(now - pending.started - self.interval, 4)
+                metrics.observe('quiz_hub_block_seconds', pending.handler, pending.duration)
+                log.warning("[PROFILE] Hub bị chặn %.3fs bởi %s: %s", pending.duration, pending.handler,
+                            ' <- '.join(reversed(pending.stack.split(';')[-4:])))
+            self._last_tick = now
+            socketio.sleep(self.interval)
+        if self.error is not None and generation == self._generation:
+            log.error("[PROFILE] Thread lấy mẫu đã dừng vì lỗi: %s", self.error)
+
+    def _sample_loop(self, generation):
+        try:
+            while self.running and generation == self._generation:
+                _real_time.sleep(self.interval)
+                frame = sys._current_frames().get(self._hub_ident)
+                if frame is None:
+                    continue
+                labels = self._stack(frame)
+                idle = _is_idle(frame)
+                with self._lock:
+                    if idle:
+                        self.idle_samples += 1
+                    else:
+                        self.samples[';'.join(labels)] += 1
+                self._watch(labels, idle)
+        except Exception as e:
+            # Không log từ thread này (xem _tick_loop): ghi lại lỗi, _tick_loop báo trên hub
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            if generation == self._generation:
+                self.running = False
+
+    def _watch(self, labels, idle):
+        """Tick của hub trễ quá ngưỡng: chụp stack greenlet đang chặn (một lần cho mỗi lần chặn)"""
+        if self._pending_block is not None or idle:
+            return
+        last_tick = self._last_tick
+        if _real_time.monotonic() - last_tick > self.threshold + self.interval:
+            block = BlockEvent(last_tick, _handler_of(labels), ';'.join(labels))
+            with self._lock:
+                self.blocks.append(block)
+                del self.blocks[:-MAX_BLOCK_EVENTS]
+            self._pending_block = block
+
+    def _stack(self, frame):
+        """Các nhãn "module:hàm" từ ngoài vào trong (gốc trước) của stack frame"""
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                module = frame.f_globals.get('__name__', '?')
+                label = self._labels[code] = f"{module}:{code.co_name}"
+            labels.append(label)
+            frame = frame.f_back
+        labels.reverse()
+        return labels
+
+    # --- Kết quả ---
+
+    def greenlet_stacks(self):
+        """Stack hiện tại của mọi greenlet đang chờ (quét gc, chỉ dùng khi chẩn đoán)"""
+        stacks = []
+        for obj in gc.get_objects():
+            if isinstance(obj, greenlet.greenlet) and obj.gr_frame is not None:
+                stacks.append(self._stack(obj.gr_frame))
+        return stacks
+
+    def dump(self):
+        """Ghi mẫu và các lần chặn hub ra PROFILE_DIR dạng collapsed stack, trả về đường dẫn
+
+        <worker>-<thời điểm>.folded          : "frame;frame;frame số_mẫu" mỗi dòng
+        <worker>-<thời điểm>-blocking.folded : stack các lần chặn hub, trọng số là ms bị chặn
+        """
+        with self._lock:
+            samples = dict(self.samples)
+            blocks = list(self.blocks)
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = _real_time.strftime('%Y%m%d-%H%M%S')
+        base = os.path.join(self.directory, f"{_safe_name(self.worker_id)}-{stamp}")
+        paths = {'samples': base + '.folded', 'blocking': base + '-blocking.folded'}
+
+        _write_folded(paths['samples'], samples)
+        blocking = Counter()
+        for block in blocks:
+            blocking[block.stack] += max(1, int((block.duration or self.threshold) * 1000))
+        _write_folded(paths['blocking'], blocking)
+        return paths
+
+    def status(self):
+        with self._lock:
+            sampled = sum(self.samples.values())
+            blocks = [b.to_dict() for b in self.blocks[-20:]]
+        return {
+            'running': self.running,
+            'started': self.started,
+            'error': self.error,
+            'interval': self.interval,
+            'threshold': self.threshold,
+            'directory': self.directory,
+            'samples': sampled,
+            'idle_samples': self.idle_samples,
+            'blocks': blocks
+        }
+
+
+def check_settings(interval, threshold):
+    """Chuyển interval/threshold sang float và kiểm tra khoảng hợp lệ, trả về (interval, threshold)
+
+    ValueError nếu không phải số, interval ngoài [MIN_INTERVAL, MAX_INTERVAL]
+    hoặc threshold ngoài [interval, MAX_THRESHOLD].
+    """
+    try:
+        interval = float(interval)
+        threshold = float(threshold)
+    except (TypeError, ValueError):
+        raise ValueError("interval và threshold phải là số (giây)")
+    if not MIN_INTERVAL <= interval <= MAX_INTERVAL:
+        raise ValueError(f"interval phải trong khoảng {MIN_INTERVAL}-{MAX_INTERVAL} giây")
+    if not interval <= threshold <= MAX_THRESHOLD:
+        raise ValueError(f"threshold phải trong khoảng interval-{MAX_THRESHOLD} giây")
+    return interval, threshold
+
+
+def _is_idle(frame):
+    """Hub đang rảnh nếu frame trong cùng nằm trong eventlet.hubs (chờ epoll/timer)"""
+    filename = frame.f_code.co_filename
+    return any(part in filename for part in _IDLE_MODULES)
+
+
+def _handler_of(labels):
+    """Handler Socket.IO (events.py) hoặc view HTTP (routes.py) ngoài cùng của stack,
+    hoặc hàm trong cùng nếu không có"""
+    for label in labels:
+        if label.startswith(_HANDLER_MODULES):
+            return label.split(':', 1)[1]
+    return labels[-1] if labels else '?'
+
+
+def _safe_name(name):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+
+
+def _write_folded(path, counts):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        for stack, count in sorted(counts.items()):
+            f.write(f"{stack} {count}\n")
+    os.replace(tmp, path)
+
+
+hub_profiler = HubProfiler()
@@ -0,0 +1,186 @@
+import bisect
+import csv
+import logging
+import os
+
+from source.server.answer_matching import answer_keys
+
+log = logging.getLogger(__name__)
+
+# Thứ tự cột trong file questions_output.csv
+FIELDNAMES = ['id', 'prompt', 'answer', 'media', 'type']
+# Cột tùy chọn: các đáp án thay thế cách nhau bởi '|', ví dụ "Mèo|Con mèo"
+ALIASES_FIELD = 'aliases'
+# Cột tùy chọn dùng để lọc câu hỏi khi bắt đầu ván (so sánh không phân biệt hoa/thường)
+FILTER_FIELDS = ('category', 'difficulty')
+
+
+class QuestionSnapshot:
+    """Ảnh chụp bất biến của ngân hàng câu hỏi.
+
+    Chỉ nhìn thấy `size` câu hỏi đầu tiên của list nền. Vì list nền chỉ được
+    append (reload tạo list mới), snapshot cũ không đổi khi có câu hỏi mới,
+    nên phòng đang chơi giữ snapshot của mình mà không bị ảnh hưởng.
+    """
+
+    __slots__ = ('_rows', '_index_by_id', '_filter_index', 'size', 'max_id')
+
+    def __init__(self, rows, index_by_id, filter_index, size, max_id):
+        self._rows = rows
+        self._index_by_id = index_by_id
+        self._filter_index = filter_index
+        self.size = size
+        self.max_id = max_id
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        return self._rows[index]
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self._rows[i]
+
+    def get_by_id(self, question_id):
+        """Lấy câu hỏi theo id (O(1)), None nếu không có trong snapshot này"""
+        index = self._index_by_id.get(question_id)
+        if index is None or index >= self.size:
+            return None
+        return self._rows[index]
+
+    def index_of(self, question_id):
+        """Chỉ số của câu hỏi theo id trong snapshot này, None nếu không có"""
+        index = self._index_by_id.get(question_id)
+        if index is None or index >= self.size:
+            return None
+        return index
+
+    def candidate_indices(self, category=None, difficulty=None):
+        """Chỉ số các câu hỏi khớp bộ lọc (None = không lọc)
+
+        Không lọc thì trả về range(size) (không tạo list). Có lọc thì dùng chỉ
+        mục dựng sẵn khi nạp file, cắt theo size bằng bisect vì chỉ số tăng dần.
+        """
+        candidates = None
+        for field, value in zip(FILTER_FIELDS, (category, difficulty)):
+            if value is None or value == '':
+                continue
+            indices = self._filter_index.get(field, {}).get(str(value).strip().casefold(), ())
+            indices = indices[:bisect.bisect_left(indices, self.size)]
+            if candidates is None:
+                candidates = indices
+            else:
+                wanted = set(indices)
+                candidates = [i for i in candidates if i in wanted]
+        return range(self.size) if candidates is None else candidates
+
+
+class QuestionBank:
+    """Ngân hàng câu hỏi trong memory, nạp từ file CSV.
+
+    - add(): append vào CSV và vào bộ nhớ trong O(1) (không parse lại file)
+    - reload(): parse lại toàn bộ file, chỉ gọi khi cần (ví dụ file bị sửa tay);
+      snapshot mới được thay vào một lần, lỗi parse thì giữ nguyên snapshot cũ
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self._rows = []
+        self._index_by_id = {}
+        self._filter_index = {}
+        self._max_id = 0
+        self.snapshot = QuestionSnapshot(self._rows, self._index_by_id, self._filter_index, 0, 0)
+
+    def reload(self):
+        """Đọc lại toàn bộ file CSV và thay snapshot hiện tại, trả về snapshot mới"""
+        rows = []
+        index_by_id = {}
+        filter_index = {}  # field -> giá trị (casefold) -> list chỉ số tăng dần
+        max_id = 0
+        try:
+            if os.path.exists(self.csv_path):
+                # Mở file với encoding utf-8-sig để loại bỏ BOM nếu có
+                with open(self.csv_path, 'r', encoding='utf-8-sig') as f:
+                    for row in csv.DictReader(f):
+                        # Strip whitespace từ keys và values
+                        cleaned_row = {k.strip(): v.strip() if isinstance(v, str) else v for k, v in row.items()}
+                        # Chuyển đổi id sang số nguyên
+                        cleaned_row['id'] = int(cleaned_row['id'])
+                        # Tính sẵn các dạng chuẩn hóa của đáp án để check_answer chỉ cần tra set
+                        cleaned_row['answer_keys'] = answer_keys(cleaned_row.get('answer', ''),
+                                                                 cleaned_row.get(ALIASES_FIELD))
+                        index_by_id[cleaned_row['id']] = len(rows)
+                        for field in FILTER_FIELDS:
+                            value = cleaned_row.get(field)
+                            if value:
+                                filter_index.setdefault(field, {}).setdefault(value.casefold(), []).append(len(rows))
+                        max_id = max(max_id, cleaned_row['id'])
+                        rows.append(cleaned_row)
+        except Exception as e:
+            log.exception("Error loading questions: %s", e)
+            return self.snapshot
+
+        self._rows = rows
+        self._index_by_id = index_by_id
+        self._filter_index = filter_index
+        self._max_id = max_id
+        self.snapshot = QuestionSnapshot(rows, index_by_id, filter_index, len(rows), max_id)
+        return self.snapshot
+
+    def add(self, media_filename, answer, prompt, media_type='image', category=None, difficulty=None):
+        """Append một câu hỏi mới vào CSV và vào bộ nhớ, trả về dict câu hỏi
+
+        category/difficulty chỉ được ghi (và đưa vào chỉ mục lọc) khi file CSV
+        có sẵn cột tương ứng, để bộ nhớ luôn khớp với lần reload() sau.
+        """
+        new_question = {
+            "id": self._max_id + 1,
+            "prompt": prompt,
+            "answer": answer,
+            "media": media_filename if media_filename else "",
+            "type": media_type
+        }
+
+        # Ghi thêm vào file CSV (append mode), theo đúng thứ tự cột của header hiện có
+        os.makedirs(os.path.dirname(self.csv_path), exist_ok=True)
+        fieldnames = self._read_header() or FIELDNAMES
+        for field, value in zip(FILTER_FIELDS, (category, difficulty)):
+            value = (value or '').strip()
+            if not value:
+                continue
+            if field in fieldnames:
+                new_question[field] = value
+            else:
+                log.warning("[QUESTION_ADD] File CSV không có cột '%s', bỏ qua giá trị '%s'", field, value)
+        with open(self.csv_path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, restval='', extrasaction='ignore')
+            # Nếu file mới tạo, viết header
+            if fieldnames is FIELDNAMES:
+                writer.writeheader()
+            writer.writerow(new_question)
+        new_question['answer_keys'] = answer_keys(answer)
+
+        # Cập nhật bộ nhớ: append vào list nền, snapshot cũ vẫn chỉ thấy phần cũ.
+        # Chỉ số mới lớn nhất nên append giữ các list chỉ mục lọc tăng dần
+        index = len(self._rows)
+        self._index_by_id[new_question['id']] = index
+        for field in FILTER_FIELDS:
+            value = new_question.get(field)
+            if value:
+                self._filter_index.setdefault(field, {}).setdefault(value.casefold(), []).append(index)
+        self._rows.append(new_question)
+        self._max_id = new_question['id']
+        self.snapshot = QuestionSnapshot(self._rows, self._index_by_id, self._filter_index,
+                                         len(self._rows), self._max_id)
+        return new_question
+
+    def _read_header(self):
+        """Danh sách cột trong header của file CSV, None nếu file chưa có"""
+        if not os.path.exists(self.csv_path) or os.path.getsize(self.csv_path) == 0:
+            return None
+        with open(self.csv_path, 'r', newline='', encoding='utf-8-sig') as f:
+            header = next(csv.reader(f), None)
+        return [name.strip() for name in header] if header else None
@@ -0,0 +1,133 @@
+import os
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import request, session
+from flask_socketio import emit
+
+# Ngân sách mặc định cho mỗi loại event: (số event/giây, burst tối đa)
+DEFAULT_BUDGETS = {
+    'submit_answer': (3.0, 6),
+    'send_chat_message': (1.0, 5),
+}
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated', 'warned')
+
+    def __init__(self, burst, now):
+        self.tokens = float(burst)
+        self.updated = now
+        self.warned = False
+
+
+class RateLimiter:
+    """Giới hạn tần suất event Socket.IO bằng token bucket theo SID và theo user.
+
+    Mỗi event có một bucket cho SID và một bucket cho username (để mở nhiều
+    tab/kết nối lại không né được giới hạn); event chỉ được xử lý khi cả hai
+    bucket còn token. Event vượt ngân sách bị bỏ ngay trong decorator, trước
+    khi chạy logic game; client chỉ nhận một thông báo lỗi cho mỗi đợt bị chặn.
+
+    Cấu hình (app.config hoặc biến môi trường):
+      RATE_LIMIT_ENABLED : '0' để tắt
+      RATE_LIMITS        : dict {event: (rate, burst)} ghi đè DEFAULT_BUDGETS
+    """
+
+    # Số lần kiểm tra giữa hai lần dọn bucket không còn dùng
+    PRUNE_EVERY = 10000
+
+    def __init__(self):
+        self.enabled = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+        self.budgets = dict(DEFAULT_BUDGETS)
+        self._buckets = {}  # (event, 'sid'|'user', key) -> _Bucket
+        self._checks = 0
+        self.allowed = Counter()
+        self.rejected = Counter()
+
+    def init_app(self, app):
+        """Đọc cấu hình từ app.config (nếu có)"""
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', self.enabled)
+        self.budgets.update(app.config.get('RATE_LIMITS', {}))
+
+    def _take(self, key, rate, burst, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(burst, now)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.warned = False
+            return None
+        return bucket
+
+    def check(self, event, sid, username=None):
+        """Trừ một token cho event; trả về None nếu được phép, bucket bị chặn nếu vượt ngân sách"""
+        budget = self.budgets.get(event)
+        if not self.enabled or budget is None:
+            return None
+        rate, burst = budget
+        now = time.monotonic()
+
+        self._checks += 1
+        if self._checks % self.PRUNE_EVERY == 0:
+            self.prune(now)
+
+        blocked = self._take((event, 'sid', sid), rate, burst, now)
+        if blocked is None and username:
+            blocked = self._take((event, 'user', username), rate, burst, now)
+        if blocked is None:
+            self.allowed[event] += 1
+        else:
+            self.rejected[event] += 1
+        return blocked
+
+    def forget_sid(self, sid):
+        """Xóa bucket của SID khi ngắt kết nối"""
+        for event in self.budgets:
+            self._buckets.pop((event, 'sid', sid), None)
+
+    def prune(self, now=None):
+        """Bỏ các bucket đã hồi đầy token (không khác gì bucket mới tạo)"""
+        now = time.monotonic() if now is None else now
+        stale = []
+        for key, bucket in self._buckets.items():
+            rate, burst = self.budgets.get(key[0], (1.0, 1))
+            if bucket.tokens + (now - bucket.updated) * rate >= burst:
+                stale.append(key)
+        for key in stale:
+            del self._buckets[key]
+        return len(stale)
+
+    def stats(self):
+        """Bộ đếm event được xử lý / bị chặn theo loại event"""
+        return {
+            'allowed': dict(self.allowed),
+            'rejected': dict(self.rejected),
+            'buckets': len(self._buckets)
+        }
+
+    def limit(self, event):
+        """Decorator cho handler Socket.IO: bỏ event nếu vượt ngân sách
+
+        Đặt dưới @socketio.on(...) để kiểm tra chạy trước thân handler.
+        """
+        def decorator(handler):
+            @wraps(handler)
+            def wrapper(*args, **kwargs):
+                blocked = self.check(event, request.sid, session.get('username'))
+                if blocked is not None:
+                    # Chỉ báo một lần cho mỗi đợt bị chặn, các event sau bị bỏ im lặng
+                    if not blocked.warned:
+                        blocked.warned = True
+                        emit('error', {'message': 'Bạn thao tác quá nhanh, vui lòng chậm lại.'})
+                    return None
+                return handler(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+rate_limiter = RateLimiter()
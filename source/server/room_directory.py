@@ -0,0 +1,359 @@
+"""Danh bạ phòng dùng chung giữa nhiều worker (scale-out theo chiều ngang).
+
+Trạng thái một phòng (GameRoom, hẹn giờ vòng, lịch sử...) chỉ nằm trong
+memory của worker sở hữu phòng. Các worker chỉ chia sẻ:
+  - quyền sở hữu phòng (room_id -> worker), để room_id không bị tạo trùng
+    và /game/<room_id> được chuyển (redirect) tới đúng worker (sticky theo phòng)
+  - mục danh sách phòng của sảnh chờ và version diff của từng worker
+  - heartbeat: worker ngừng gửi quá WORKER_TTL giây bị coi là đã chết,
+    phòng của nó bị ẩn và có thể được worker khác tạo lại
+
+Backend chọn bằng ROOM_STATE_URL:
+  memory://                 (mặc định) một worker, chỉ dùng game_rooms trong process
+  sqlite:////tmp/rooms.db   nhiều worker trên cùng một máy, không cần dịch vụ ngoài
+  redis://localhost:6379/0  nhiều máy (cần cài gói redis)
+
+Diff danh sách phòng được gửi qua message queue của Socket.IO
+(SOCKETIO_MESSAGE_QUEUE, ví dụ redis://...) để tới được client ở mọi worker.
+Mỗi worker cần WORKER_URL (địa chỉ truy cập trực tiếp worker đó) để redirect.
+
+Lệnh SQLite chặn trong C (kể cả chờ busy timeout) nên backend SQLite chạy
+trong thread pool (tpool), lần lượt từng lệnh vì dùng chung một connection.
+Chỉ claim() cần kết quả ngay; release()/publish() được gom lại và ghi theo lô
+trong một greenlet nền, không chặn handler hay vòng flush của sảnh chờ.
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+
+from eventlet.semaphore import Semaphore
+
+from source.server.extensions import socketio, on_hub, run_off_hub
+
+log = logging.getLogger(__name__)
+
+# Chu kỳ gửi heartbeat (giây)
+HEARTBEAT_INTERVAL = 5
+# Worker không gửi heartbeat quá số giây này bị coi là đã chết
+WORKER_TTL = 15
+
+
+class SqliteRoomBackend:
+    """Danh bạ phòng trong một file SQLite dùng chung (WAL) giữa các process trên cùng máy"""
+
+    # Lệnh chặn OS thread (không phải socket được eventlet patch): chạy trong tpool
+    blocking = True
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                url TEXT,
+                version INTEGER NOT NULL DEFAULT 0,
+                heartbeat REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS rooms (
+                room_id TEXT PRIMARY KEY,
+                worker_id TEXT NOT NULL,
+                entry TEXT
+            );
+            CREATE INDEX IF NOT EXISTS ix_rooms_worker ON rooms (worker_id);
+        """)
+
+    def _transaction(self, mode=''):
+        conn = self.conn
+
+        class _Tx:
+            def __enter__(self):
+                conn.execute(f"BEGIN {mode}")
+                return conn
+
+            def __exit__(self, exc_type, exc, tb):
+                conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+        return _Tx()
+
+    def heartbeat(self, worker_id, url, now):
+        self.conn.execute(
+            "INSERT INTO workers (worker_id, url, heartbeat) VALUES (?, ?, ?) "
+            "ON CONFLICT (worker_id) DO UPDATE SET url = excluded.url, heartbeat = excluded.heartbeat",
+            (worker_id, url, now))
+
+    def claim(self, room_id, worker_id, alive_after):
+        with self._transaction('IMMEDIATE') as conn:
+            row = conn.execute(
+                "SELECT r.worker_id, w.heartbeat FROM rooms r LEFT JOIN workers w ON w.worker_id = r.worker_id "
+                "WHERE r.room_id = ?", (room_id,)).fetchone()
+            if row and row[0] != worker_id and (row[1] or 0) >= alive_after:
+                return False
+            conn.execute("INSERT OR REPLACE INTO rooms (room_id, worker_id, entry) VALUES (?, ?, NULL)",
+                         (room_id, worker_id))
+            return True
+
+    def sync(self, worker_id, released, version, entries):
+        """Một transaction: bỏ các phòng đã giải phóng, ghi mục danh sách phòng và version"""
+        with self._transaction('IMMEDIATE') as conn:
+            conn.executemany("DELETE FROM rooms WHERE room_id = ? AND worker_id = ?",
+                             [(room_id, worker_id) for room_id in released])
+            if version is None:
+                return
+            conn.executemany(
+                "UPDATE rooms SET entry = ? WHERE room_id = ? AND worker_id = ?",
+                [(json.dumps(entry) if entry is not None else None, room_id, worker_id)
+                 for room_id, entry in entries.items()])
+            conn.execute("UPDATE workers SET version = ? WHERE worker_id = ?", (version, worker_id))
+
+    def snapshot(self, alive_after, exclude_worker):
+        with self._transaction() as conn:
+            versions = dict(conn.execute(
+                "SELECT worker_id, version FROM workers WHERE heartbeat >= ?", (alive_after,)))
+            entries = conn.execute(
+                "SELECT r.entry FROM rooms r JOIN workers w ON w.worker_id = r.worker_id "
+                "WHERE w.heartbeat >= ? AND r.worker_id != ? AND r.entry IS NOT NULL ORDER BY r.room_id",
+                (alive_after, exclude_worker)).fetchall()
+        return versions, [json.loads(e[0]) for e in entries]
+
+    def owner_url(self, room_id, alive_after):
+        row = self.conn.execute(
+            "SELECT w.url FROM rooms r JOIN workers w ON w.worker_id = r.worker_id "
+            "WHERE r.room_id = ? AND w.heartbeat >= ?", (room_id, alive_after)).fetchone()
+        return row[0] if row else None
+
+    def drop_worker(self, worker_id):
+        with self._transaction('IMMEDIATE') as conn:
+            conn.execute("DELETE FROM rooms WHERE worker_id = ?", (worker_id,))
+            conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+
+class RedisRoomBackend:
+    """Danh bạ phòng trong Redis (các hash {prefix}:workers, :versions, :owners, :entries)"""
+
+    # Socket tới Redis được eventlet patch (nhường event loop khi chờ): gọi trực tiếp
+    blocking = False
+
+    def __init__(self, url, prefix='quiz'):
+        import redis  # gói tùy chọn, chỉ cần khi dùng backend Redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.k_workers = f"{prefix}:workers"
+        self.k_versions = f"{prefix}:versions"
+        self.k_owners = f"{prefix}:owners"
+        self.k_entries = f"{prefix}:entries"
+
+    def _alive_workers(self, workers, alive_after):
+        return {w: json.loads(info) for w, info in workers.items() if json.loads(info)['heartbeat'] >= alive_after}
+
+    def heartbeat(self, worker_id, url, now):
+        self.redis.hset(self.k_workers, worker_id, json.dumps({'url': url, 'heartbeat': now}))
+
+    def claim(self, room_id, worker_id, alive_after):
+        if self.redis.hsetnx(self.k_owners, room_id, worker_id):
+            return True
+        owner = self.redis.hget(self.k_owners, room_id)
+        if owner == worker_id:
+            return True
+        info = self.redis.hget(self.k_workers, owner) if owner else None
+        if info and json.loads(info)['heartbeat'] >= alive_after:
+            return False
+        # Chủ cũ đã chết: lấy lại phòng
+        pipe = self.redis.pipeline()
+        pipe.hset(self.k_owners, room_id, worker_id)
+        pipe.hdel(self.k_entries, room_id)
+        pipe.execute()
+        return True
+
+    def sync(self, worker_id, released, version, entries):
+        pipe = self.redis.pipeline()
+        if released:
+            released = list(released)
+            owners = self.redis.hmget(self.k_owners, released)
+            owned = [room_id for room_id, owner in zip(released, owners) if owner == worker_id]
+            if owned:
+                pipe.hdel(self.k_owners, *owned)
+                pipe.hdel(self.k_entries, *owned)
+        if version is not None:
+            for room_id, entry in entries.items():
+                if entry is None:
+                    pipe.hdel(self.k_entries, room_id)
+                else:
+                    pipe.hset(self.k_entries, room_id, json.dumps(entry))
+            pipe.hset(self.k_versions, worker_id, version)
+        pipe.execute()
+
+    def snapshot(self, alive_after, exclude_worker):
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self.k_workers)
+        pipe.hgetall(self.k_versions)
+        pipe.hgetall(self.k_owners)
+        pipe.hgetall(self.k_entries)
+        workers, versions, owners, entries = pipe.execute()
+        alive = self._alive_workers(workers, alive_after)
+        rooms = [json.loads(entries[room_id]) for room_id in sorted(entries)
+                 if owners.get(room_id) in alive and owners.get(room_id) != exclude_worker]
+        return {w: int(versions.get(w, 0)) for w in alive}, rooms
+
+    def owner_url(self, room_id, alive_after):
+        owner = self.redis.hget(self.k_owners, room_id)
+        info = self.redis.hget(self.k_workers, owner) if owner else None
+        if not info:
+            return None
+        info = json.loads(info)
+        return info['url'] if info['heartbeat'] >= alive_after else None
+
+    def drop_worker(self, worker_id):
+        owned = [room_id for room_id, owner in self.redis.hgetall(self.k_owners).items() if owner == worker_id]
+        pipe = self.redis.pipeline()
+        if owned:
+            pipe.hdel(self.k_owners, *owned)
+            pipe.hdel(self.k_entries, *owned)
+        pipe.hdel(self.k_workers, worker_id)
+        pipe.hdel(self.k_versions, worker_id)
+        pipe.execute()
+
+
+def create_backend(url):
+    """Tạo backend theo ROOM_STATE_URL, None cho memory:// (một worker)"""
+    if not url or url.startswith('memory://'):
+        return None
+    if url.startswith('sqlite:///'):
+        return SqliteRoomBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisRoomBackend(url)
+    raise ValueError(f"ROOM_STATE_URL không hỗ trợ: {url}")
+
+
+class RoomDirectory:
+    """Danh bạ phòng của worker hiện tại; không làm gì khi chạy một worker (memory://)"""
+
+    def __init__(self):
+        self.backend = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.worker_url = None
+        self._lock = Semaphore(1)  # một lệnh backend SQLite tại một thời điểm
+        self._sync_lock = Semaphore(1)  # một lô sync tại một thời điểm (lô lỗi được gộp lại trước lô sau)
+        self._released = set()  # room_id chờ giải phóng
+        self._entries = {}  # room_id -> entry chờ ghi (None = ẩn)
+        self._version = None  # version diff chờ ghi, None nếu không có
+        self._syncing = False
+
+    @property
+    def shared(self):
+        return self.backend is not None
+
+    def init_app(self, app):
+        """Chọn backend theo cấu hình, đăng ký worker và chạy vòng heartbeat"""
+        url = app.config.get('ROOM_STATE_URL', os.environ.get('ROOM_STATE_URL', 'memory://'))
+        self.worker_id = app.config.get('WORKER_ID', os.environ.get('WORKER_ID', self.worker_id))
+        self.worker_url = app.config.get('WORKER_URL', os.environ.get('WORKER_URL'))
+        self.backend = create_backend(url)
+        if not self.shared:
+            return
+        self._call(self.backend.heartbeat, self.worker_id, self.worker_url, time.time())
+        socketio.start_background_task(self._heartbeat_loop)
+        atexit.register(self.backend.drop_worker, self.worker_id)
+        log.info("[ROOM_DIRECTORY] Worker %s (%s) dùng %s", self.worker_id, self.worker_url, url.split('://')[0])
+
+    def _heartbeat_loop(self):
+        while True:
+            socketio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                self._call(self.backend.heartbeat, self.worker_id, self.worker_url, time.time())
+            except Exception as e:
+                log.warning("[ROOM_DIRECTORY] Lỗi heartbeat: %s: %s", type(e).__name__, e)
+            # Ghi lại các phòng giải phóng bị lỗi ở lần sync trước
+            self._schedule_sync()
+
+    def _call(self, fn, *args):
+        """Gọi backend: backend chặn (SQLite) chạy trong tpool khi ở event loop, lần lượt từng lệnh"""
+        if not self.backend.blocking or not on_hub():
+            return fn(*args)
+        with self._lock:
+            return run_off_hub(fn, *args)
+
+    def claim(self, room_id):
+        """Giữ quyền sở hữu room_id cho worker này, False nếu worker khác (còn sống) đang giữ
+
+        Có thể nhường event loop (backend SQLite): caller cần kiểm tra lại trạng thái sau khi gọi.
+        """
+        if not self.shared:
+            return True
+        # Phòng vừa giải phóng rồi tạo lại: bỏ lệnh giải phóng còn chờ (cả khi nó được
+        # thêm lại vì lần sync đang chạy bị lỗi)
+        self._released.discard(room_id)
+        claimed = self._call(self.backend.claim, room_id, self.worker_id, time.time() - WORKER_TTL)
+        if claimed:
+            self._released.discard(room_id)
+        return claimed
+
+    def release(self, room_id):
+        """Giải phóng room_id (ghi theo lô trong nền)"""
+        if self.shared:
+            self._released.add(room_id)
+            self._schedule_sync()
+
+    def publish(self, version, entries):
+        """Ghi các mục danh sách phòng đã đổi (room_id -> entry, None = ẩn) cùng version diff (theo lô, trong nền)"""
+        if self.shared:
+            self._entries.update(entries)
+            self._version = version
+            self._schedule_sync()
+
+    def _schedule_sync(self):
+        if self._syncing or not (self._released or self._version is not None):
+            return
+        self._syncing = True
+        socketio.start_background_task(self._sync_loop)
+
+    def _sync_loop(self):
+        try:
+            while self._released or self._version is not None:
+                if not self._sync():
+                    break  # thử lại ở heartbeat sau
+        finally:
+            self._syncing = False
+
+    def _sync(self):
+        """Ghi các thay đổi đang chờ trong một lệnh backend, False nếu lỗi"""
+        with self._sync_lock:
+            released, self._released = self._released, set()
+            version, entries = self._version, self._entries
+            self._version, self._entries = None, {}
+            if not (released or version is not None):
+                return True
+            try:
+                self._call(self.backend.sync, self.worker_id, released, version, entries)
+                return True
+            except Exception as e:
+                # Gộp lô lỗi lại vào hàng chờ để thử lại ở heartbeat sau; thay đổi
+                # đến sau (đang chờ) mới hơn nên được ưu tiên
+                self._released |= released
+                for room_id, entry in entries.items():
+                    self._entries.setdefault(room_id, entry)
+                if self._version is None:
+                    self._version = version
+                log.warning("[ROOM_DIRECTORY] Lỗi ghi danh bạ phòng: %s: %s", type(e).__name__, e)
+                return False
+
+    def snapshot(self):
+        """(version theo worker, danh sách phòng của các worker khác còn sống)
+
+        Phòng của worker này không đọc từ backend (có thể chưa sync xong):
+        caller dùng trạng thái trong memory.
+        """
+        return self._call(self.backend.snapshot, time.time() - WORKER_TTL, self.worker_id)
+
+    def owner_url(self, room_id):
+        """URL worker đang sở hữu room_id (khác worker này), None nếu không có"""
+        if not self.shared:
+            return None
+        url = self._call(self.backend.owner_url, room_id, time.time() - WORKER_TTL)
+        return url if url and url != self.worker_url else None
+
+
+room_directory = RoomDirectory()
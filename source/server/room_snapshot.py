@@ -0,0 +1,268 @@
+"""Snapshot trạng thái phòng xuống đĩa để restart (deploy) không làm mất ván đang chơi.
+
+Trạng thái đầy đủ của phòng (người chơi, điểm, vòng và câu hỏi hiện tại, pool
+câu hỏi còn lại...) chỉ nằm trong memory; bảng GameRoom chỉ có metadata cho
+sảnh chờ. RoomSnapshots ghi hai file trong ROOM_SNAPSHOT_DIR:
+
+  <tên>.snap     toàn bộ phòng (GameRoom.to_state), ghi ra file tạm, fsync rồi
+                 os.replace nên luôn là bản cũ hoặc bản mới nguyên vẹn
+  <tên>.journal  thay đổi từ sau snapshot: mỗi JOURNAL_INTERVAL giây, trạng thái
+                 mới của các phòng đã đổi (game_logic.drain_dirty_rooms) hoặc bản
+                 ghi xóa được nối vào cuối file; mỗi bản ghi có độ dài và CRC32
+                 nên bản ghi ghi dở lúc crash bị bỏ qua khi đọc
+
+Journal lớn quá JOURNAL_MAX_BYTES hoặc cũ quá SNAPSHOT_INTERVAL giây thì ghi
+snapshot mới và bắt đầu journal mới cùng epoch (journal khác epoch với snapshot
+bị bỏ qua). Tắt server bình thường ghi snapshot lần cuối. Ghi file và fsync
+chạy trong thread pool (tpool), không chặn event loop.
+
+Khi khởi động: đọc snapshot, áp dụng journal rồi game_logic.restore_rooms();
+events.resume_restored_rooms() hẹn lại giờ vòng cho các ván đang chơi.
+
+Cấu hình (app.config hoặc biến môi trường):
+  ROOM_SNAPSHOT_DIR      : thư mục ghi (mặc định <file SQLite>.rooms cạnh DB), '' để tắt
+  ROOM_SNAPSHOT_INTERVAL : chu kỳ tối đa giữa hai snapshot đầy đủ (giây, mặc định 60)
+  ROOM_JOURNAL_INTERVAL  : chu kỳ ghi journal (giây, mặc định 1)
+"""
+import atexit
+import logging
+import os
+import pickle
+import struct
+import time
+import zlib
+
+from eventlet import tpool
+
+from source.server.extensions import socketio
+
+log = logging.getLogger(__name__)
+
+# Tăng khi đổi bố cục GameRoom.to_state(); file khác version bị bỏ qua
+FORMAT_VERSION = 1
+SNAPSHOT_MAGIC = b'QRSNAP'
+JOURNAL_MAGIC = b'QRJRNL'
+_HEADER = struct.Struct('<6sHQ')  # magic, version, epoch
+_RECORD = struct.Struct('<II')  # độ dài, CRC32 của payload pickle
+
+
+class RoomSnapshots:
+    """Ghi snapshot + journal trạng thái phòng và khôi phục khi khởi động"""
+
+    # Journal lớn hơn chừng này byte thì gộp thành snapshot mới
+    JOURNAL_MAX_BYTES = 8 * 1024 * 1024
+
+    def __init__(self):
+        self.directory = None
+        self.name = 'rooms'
+        self.snapshot_interval = float(os.environ.get('ROOM_SNAPSHOT_INTERVAL', 60))
+        self.journal_interval = float(os.environ.get('ROOM_JOURNAL_INTERVAL', 1))
+        self.epoch = 0
+        self._journal = None  # file journal mở ở chế độ append
+        self._journal_bytes = 0
+        self._last_snapshot = 0.0
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, f"{self.name}.snap")
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.directory, f"{self.name}.journal")
+
+    def init_app(self, app):
+        """Khôi phục phòng của lần chạy trước, chạy vòng ghi journal/snapshot; trả về list phòng đã khôi phục"""
+        import source.server.game_logic as game_logic
+        from source.server.room_directory import room_directory
+
+        self.directory = _snapshot_dir(app)
+        if not self.enabled:
+            return []
+        self.snapshot_interval = float(app.config.get('ROOM_SNAPSHOT_INTERVAL', self.snapshot_interval))
+        self.journal_interval = float(app.config.get('ROOM_JOURNAL_INTERVAL', self.journal_interval))
+        # Nhiều worker: mỗi worker một cặp file (cần WORKER_ID cố định qua các lần restart)
+        if room_directory.shared:
+            self.name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in room_directory.worker_id)
+        os.makedirs(self.directory, exist_ok=True)
+
+        start = time.perf_counter()
+        states = self.load()
+        restored = game_logic.restore_rooms(states.values())
+        elapsed = time.perf_counter() - start
+        game_logic.track_dirty_rooms = True
+        # Gộp snapshot + journal cũ thành snapshot mới trước khi nhận thay đổi
+        self.snapshot()
+        log.info("[SNAPSHOT] Khôi phục %d/%d phòng trong %.3fs từ %s", len(restored), len(states), elapsed,
+                 self.directory)
+
+        socketio.start_background_task(self._loop)
+        atexit.register(self._final_snapshot)
+        return restored
+
+    # --- Đọc ---
+
+    def load(self):
+        """Đọc snapshot rồi áp dụng journal cùng epoch: dict room_id -> state"""
+        states = {}
+        self.epoch = 0
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = None
+        if data is not None:
+            epoch = _check_header(data, SNAPSHOT_MAGIC)
+            payloads = list(_read_records(data, _HEADER.size)) if epoch is not None else []
+            if not payloads:
+                log.warning("[SNAPSHOT] Bỏ qua %s: không đúng định dạng/version hoặc bị hỏng", self.snapshot_path)
+                return states
+            self.epoch = epoch
+            for state in pickle.loads(payloads[0]):
+                states[state[0]] = state
+
+        try:
+            with open(self.journal_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return states
+        if _check_header(data, JOURNAL_MAGIC) != self.epoch:
+            return states
+        for payload in _read_records(data, _HEADER.size):
+            for room_id, state in pickle.loads(payload):
+                if state is None:
+                    states.pop(room_id, None)
+                else:
+                    states[room_id] = state
+        return states
+
+    # --- Ghi ---
+
+    def _loop(self):
+        while True:
+            socketio.sleep(self.journal_interval)
+            try:
+                self.write_journal(offload=True)
+                if self._journal_bytes > self.JOURNAL_MAX_BYTES or \
+                        (self._journal_bytes and time.time() - self._last_snapshot > self.snapshot_interval):
+                    self.snapshot(offload=True)
+            except Exception as e:
+                log.exception("[SNAPSHOT] Lỗi ghi: %s: %s", type(e).__name__, e)
+
+    def _final_snapshot(self):
+        try:
+            count = self.snapshot()
+            log.info("[SNAPSHOT] Đã ghi %d phòng trước khi tắt", count)
+        except Exception as e:
+            log.error("[SNAPSHOT] Lỗi ghi snapshot khi tắt: %s: %s", type(e).__name__, e)
+
+    def write_journal(self, offload=False):
+        """Nối trạng thái các phòng đã đổi vào journal (một bản ghi), trả về số phòng đã ghi"""
+        import source.server.game_logic as game_logic
+
+        dirty = game_logic.drain_dirty_rooms()
+        if not dirty or self._journal is None:
+            return 0
+        rooms = game_logic.game_rooms
+        changes = []
+        for room_id in dirty:
+            room = rooms.get(room_id)
+            changes.append((room_id, room.to_state() if room is not None else None))
+        record = _encode_record(pickle.dumps(changes, protocol=pickle.HIGHEST_PROTOCOL))
+        _run(offload, _append, self._journal, record)
+        self._journal_bytes += len(record)
+        return len(changes)
+
+    def snapshot(self, offload=False):
+        """Ghi toàn bộ phòng thành snapshot mới (epoch + 1) và bắt đầu journal mới, trả về số phòng"""
+        import source.server.game_logic as game_logic
+
+        if not self.enabled:
+            return 0
+        game_logic.drain_dirty_rooms()
+        states = [room.to_state() for room in game_logic.game_rooms.values()]
+        epoch = self.epoch + 1
+        snapshot = _HEADER.pack(SNAPSHOT_MAGIC, FORMAT_VERSION, epoch) + \
+            _encode_record(pickle.dumps(states, protocol=pickle.HIGHEST_PROTOCOL))
+        journal_header = _HEADER.pack(JOURNAL_MAGIC, FORMAT_VERSION, epoch)
+
+        old_journal = self._journal
+        self._journal = None
+        if old_journal is not None:
+            old_journal.close()
+        # Snapshot trước, journal sau: crash ở giữa thì journal cũ (epoch cũ) bị bỏ qua khi đọc
+        _run(offload, _write_atomic, self.snapshot_path, snapshot)
+        _run(offload, _write_atomic, self.journal_path, journal_header)
+        self._journal = open(self.journal_path, 'ab')
+        self._journal_bytes = 0
+        self._last_snapshot = time.time()
+        self.epoch = epoch
+        return len(states)
+
+
+def _snapshot_dir(app):
+    """ROOM_SNAPSHOT_DIR, mặc định thư mục <file SQLite>.rooms; None nếu tắt"""
+    directory = app.config.get('ROOM_SNAPSHOT_DIR', os.environ.get('ROOM_SNAPSHOT_DIR'))
+    if directory is not None:
+        return directory or None
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
+    if uri.startswith('sqlite:///') and ':memory:' not in uri:
+        return os.path.abspath(uri[len('sqlite:///'):]) + '.rooms'
+    return None
+
+
+def _check_header(data, magic):
+    """Epoch của file nếu header đúng magic và FORMAT_VERSION, ngược lại None"""
+    if len(data) < _HEADER.size:
+        return None
+    file_magic, version, epoch = _HEADER.unpack_from(data)
+    if file_magic != magic or version != FORMAT_VERSION:
+        return None
+    return epoch
+
+
+def _encode_record(payload):
+    return _RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_records(data, offset):
+    """Các payload hợp lệ từ offset; dừng ở bản ghi cụt hoặc sai CRC (ghi dở khi crash)"""
+    while offset + _RECORD.size <= len(data):
+        length, crc = _RECORD.unpack_from(data, offset)
+        start = offset + _RECORD.size
+        payload = data[start:start + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            return
+        yield payload
+        offset = start + length
+
+
+def _run(offload, fn, *args):
+    return tpool.execute(fn, *args) if offload else fn(*args)
+
+
+def _append(f, record):
+    f.write(record)
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _write_atomic(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    # fsync thư mục để việc đổi tên cũng được ghi bền
+    fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+room_snapshots = RoomSnapshots()
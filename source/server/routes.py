@@ -1,7 +1,8 @@
+import logging
 import os
 from flask import (
     Blueprint, render_template, request, redirect, url_for, 
-    session, jsonify, send_from_directory
+    session, jsonify, Response
 )
 from werkzeug.utils import secure_filename
 import pathlib
@@ -9,8 +10,17 @@ import pathlib
 # Import các module logic và models
 from source.server.models import User
 from source.server.auth import register_user, login_user
+from source.server.hashing import PasswordHasherBusy
 import source.server.game_logic as game_logic
-from source.server.extensions import socketio # Import socketio cho hàm create_room
+from source.server.lobby import lobby_broadcaster
+from source.server.room_directory import room_directory
+from source.server.media import STATICS_DIR, send_media, send_hashed_media
+from source.server.derivatives import process_upload_async
+from source.server.leaderboard import leaderboard, PERIOD_KINDS
+from source.server.metrics import metrics
+from source.server.profiler import hub_profiler, check_settings as check_profile_settings
+
+log = logging.getLogger(__name__)
 
 # Tạo một "Blueprint" cho các route HTTP
 http_bp = Blueprint('http_bp', __name__)
@@ -39,6 +49,8 @@ def handle_login():
             session['user_id'] = user.id
             return jsonify({"success": True, "message": "Đăng nhập thành công!"})
         return jsonify({"success": False, "message": "Sai tên đăng nhập hoặc mật khẩu."})
+    except PasswordHasherBusy:
+        return jsonify({"success": False, "message": "Máy chủ đang bận, vui lòng thử lại sau."}), 503
     except Exception as e:
         return jsonify({"success": False, "message": f"Lỗi: {str(e)}"}), 500
 
@@ -76,8 +88,8 @@ def create_room_http():
         return jsonify({'success': False, 'message': 'Chưa đăng nhập.'}), 401
 
     data = request.get_json() or request.form
-    room_id = (data.get('room_id') or '').strip()
-    if not room_id:
+    room_id = game_logic.normalize_room_id(data.get('room_id'))
+    if room_id is None:
         return jsonify({'success': False, 'message': 'room_id không hợp lệ.'}), 400
 
     username = session['username']
@@ -86,20 +98,10 @@ def create_room_http():
     if room is None:
         return jsonify({'success': False, 'message': 'Phòng đã tồn tại.'}), 409
 
-    print(f"[CREATE_ROOM_HTTP] Phòng '{room_id}' được tạo bởi {username}")
+    log.info("[CREATE_ROOM_HTTP] Phòng '%s' được tạo bởi %s", room_id, username)
     
-    # Broadcast danh sách phòng cập nhật tới TẤT CẢ client trong lobby
-    try:
-        from flask import current_app
-        # Dùng app context để emit
-        with current_app.app_context():
-            room_list = game_logic.get_room_list()
-            print(f"[CREATE_ROOM_HTTP] Broadcasting room_list_updated với {len(room_list)} phòng")
-            # Emit tới tất cả socket clients (không có to parameter = broadcast)
-            socketio.emit('room_list_updated', room_list)
-            print(f"[CREATE_ROOM_HTTP] Broadcast thành công!")
-    except Exception as e:
-        print(f"[CREATE_ROOM_HTTP] Lỗi broadcast: {type(e).__name__}: {str(e)}")
+    # Báo sảnh chờ danh sách phòng đã đổi (gộp và gửi diff tới client trong lobby)
+    lobby_broadcaster.mark_dirty()
 
     return jsonify({'success': True, 'room_id': room_id})
 
@@ -111,6 +113,10 @@ def game_room(room_id):
     
     room = game_logic.get_room(room_id)
     if not room:
+        # Phòng thuộc worker khác: chuyển sang worker đó (sticky theo phòng)
+        owner_url = room_directory.owner_url(room_id)
+        if owner_url:
+            return redirect(f"{owner_url}/game/{room_id}")
         return redirect(url_for('http_bp.lobby')) # Sửa url_for
         
     return render_template('game.html', room_id=room_id, username=session['username'])
@@ -120,18 +126,45 @@ def scoreboard():
     """Trang bảng điểm"""
     return render_template('scoreboard.html')
 
+@http_bp.route('/leaderboard')
+def leaderboard_view():
+    """Bảng xếp hạng: ?period=all|month|week&limit=N, kèm hạng của người đang đăng nhập"""
+    period = request.args.get('period', 'all')
+    if period not in PERIOD_KINDS:
+        return jsonify({'success': False, 'message': 'Kỳ xếp hạng không hợp lệ.'}), 400
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+
+    username = session.get('username')
+    return jsonify({
+        'success': True,
+        'period': period,
+        'top': leaderboard.top(period, limit),
+        'me': leaderboard.rank_of(username, period) if username else None
+    })
+
+@http_bp.route('/metrics')
+def metrics_view():
+    """Số liệu vận hành của worker (định dạng text của Prometheus)"""
+    if not metrics.enabled:
+        return jsonify({'success': False, 'message': 'Metrics đã tắt.'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 
 @http_bp.route('/media/<path:filename>')
 def media(filename):
-    """Phục vụ ảnh/video"""
-    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__)))
+    """Phục vụ ảnh/video (Range, ETag, Cache-Control)"""
     ext = filename.split('.')[-1].lower()
     VIDEO_EXTS = (
         'mp4', 'webm', 'ogg', 'avi', 'mov', 'mkv', 'flv', 'm4v', '3gp', 'wmv', 'vob', 'mpg', 'mpeg'
     )
     media_type = 'videos' if ext in VIDEO_EXTS else 'images'
-    media_dir = os.path.abspath(os.path.join(base_dir, '..', '..', 'statics', media_type))
-    return send_from_directory(media_dir, filename)
+    return send_media(os.path.join(STATICS_DIR, media_type), filename)
+
+
+@http_bp.route('/m/<token>')
+def hashed_media(token):
+    """Phục vụ media theo URL hash nội dung (dùng cho vòng chơi và gợi ý tải trước)"""
+    return send_hashed_media(token)
 
 
 @http_bp.route('/admin/questions', methods=['GET'])
@@ -141,7 +174,7 @@ def admin_questions():
         return redirect(url_for('http_bp.index')) # Sửa url_for
     try:
         from source.server import game_logic
-        questions = game_logic.QUESTIONS
+        questions = game_logic.question_bank.snapshot
     except Exception:
         questions = []
     return render_template('admin_questions.html', questions=questions)
@@ -157,6 +190,8 @@ def upload_question():
     file = request.files.get('mediaFile')
     prompt = request.form.get('prompt', '').strip()
     answer = request.form.get('answer', '').strip()
+    category = request.form.get('category')
+    difficulty = request.form.get('difficulty')
 
     if not prompt or not answer:
         return jsonify({'success': False, 'message': 'Vui lòng nhập câu hỏi và đáp án.'})
@@ -177,12 +212,60 @@ def upload_question():
         save_path = os.path.join(media_dir, filename)
         file.save(save_path)
         media_type = detected_type
+        # Tạo bản ảnh/video tối ưu cho web ngoài request (thread pool)
+        process_upload_async(media_folder, filename)
 
     from source.server import game_logic
-    ok = game_logic.add_question_to_file(filename, answer, prompt, media_type)
+    ok = game_logic.add_question_to_file(filename, answer, prompt, media_type, category, difficulty)
 
     if ok:
-        game_logic.load_questions_from_file()
         return jsonify({'success': True, 'message': 'Upload thành công.'})
     else:
         return jsonify({'success': False, 'message': 'Lỗi khi lưu metadata.'})
+
+
+@http_bp.route('/admin/questions/reload', methods=['POST'])
+def reload_questions():
+    """Đọc lại toàn bộ file CSV câu hỏi (ví dụ sau khi sửa file bằng tay)"""
+    if 'username' not in session:
+        return jsonify({'success': False, 'message': 'Chưa đăng nhập.'}), 401
+
+    snapshot = game_logic.load_questions_from_file()
+    return jsonify({'success': True, 'count': len(snapshot)})
+
+
+@http_bp.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """Bật/tắt profiler event loop khi đang chạy
+
+    GET: trạng thái và các lần chặn hub gần nhất (?greenlets=1 kèm stack mọi greenlet)
+    POST {"action": "start"|"stop"|"dump", "interval", "threshold"}: stop/dump trả về file .folded
+    """
+    if 'username' not in session:
+        return jsonify({'success': False, 'message': 'Chưa đăng nhập.'}), 401
+
+    if request.method == 'GET':
+        status = hub_profiler.status()
+        if request.args.get('greenlets'):
+            status['greenlets'] = hub_profiler.greenlet_stacks()
+        return jsonify({'success': True, **status})
+
+    data = request.get_json(silent=True) or request.form
+    action = data.get('action')
+    if action == 'start':
+        interval = data.get('interval')
+        threshold = data.get('threshold')
+        try:
+            interval, threshold = check_profile_settings(
+                hub_profiler.interval if interval in (None, '') else interval,
+                hub_profiler.threshold if threshold in (None, '') else threshold)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        hub_profiler.start(interval=interval, threshold=threshold)
+        return jsonify({'success': True, **hub_profiler.status()})
+    if action in ('stop', 'dump'):
+        paths = hub_profiler.stop() if action == 'stop' else hub_profiler.dump()
+        if paths is None:
+            return jsonify({'success': False, 'message': 'Profiler chưa chạy.'}), 409
+        return jsonify({'success': True, 'files': paths})
+    return jsonify({'success': False, 'message': 'action phải là start, stop hoặc dump.'}), 400
@@ -0,0 +1,87 @@
+import heapq
+import itertools
+import logging
+import time
+
+from source.server.extensions import socketio
+
+log = logging.getLogger(__name__)
+
+
+class RoundScheduler:
+    """Bộ hẹn giờ chuyển vòng dùng heap, một background task cho mọi phòng.
+
+    Mỗi phòng chỉ có tối đa một job đang chờ (lên lịch lại sẽ thay job cũ),
+    nên mỗi vòng chỉ được chuyển đúng một lần dù có bao nhiêu phòng.
+    Deadline theo time.monotonic() nên đổi giờ hệ thống (NTP, chỉnh tay)
+    không làm vòng chuyển sớm hay muộn.
+    """
+
+    # Khoảng ngủ tối đa của vòng lặp khi chờ job gần nhất (giây)
+    TICK = 0.25
+
+    def __init__(self):
+        self.app = None
+        self._heap = []  # [deadline, seq, room_id, callback, args]
+        self._jobs = {}  # room_id -> entry đang còn hiệu lực trong heap
+        self._seq = itertools.count()
+        self._running = False
+
+    def init_app(self, app):
+        """Lưu app để chạy callback trong app context (cần cho truy vấn DB)"""
+        self.app = app
+
+    def schedule(self, room_id, delay, callback, *args):
+        """Hẹn gọi callback(*args) sau delay giây, thay thế job cũ của phòng"""
+        entry = [time.monotonic() + delay, next(self._seq), room_id, callback, args]
+        self._jobs[room_id] = entry
+        heapq.heappush(self._heap, entry)
+        if not self._running:
+            self._running = True
+            socketio.start_background_task(self._run)
+
+    def cancel(self, room_id):
+        """Hủy job đang chờ của phòng (nếu có)"""
+        self._jobs.pop(room_id, None)
+        # Entry bị hủy nằm lại trong heap tới khi được pop: dựng lại heap khi
+        # chúng chiếm quá nửa để heap không phình theo số lần hủy
+        if len(self._heap) > 2 * len(self._jobs) + 64:
+            self._heap = list(self._jobs.values())
+            heapq.heapify(self._heap)
+
+    def pending(self, room_id):
+        """Trả về thời điểm (theo time.monotonic()) job của phòng sẽ chạy, hoặc None"""
+        entry = self._jobs.get(room_id)
+        return entry[0] if entry else None
+
+    def _is_live(self, entry):
+        # Job chưa bị hủy hoặc bị thay thế
+        return self._jobs.get(entry[2]) is entry
+
+    def _run(self):
+        try:
+            while self._heap:
+                now = time.monotonic()
+                while self._heap and (self._heap[0][0] <= now or not self._is_live(self._heap[0])):
+                    entry = heapq.heappop(self._heap)
+                    if not self._is_live(entry):
+                        continue
+                    del self._jobs[entry[2]]
+                    self._fire(entry[3], entry[4])
+                if self._heap:
+                    socketio.sleep(min(self.TICK, max(0, self._heap[0][0] - time.monotonic())))
+        finally:
+            self._running = False
+
+    def _fire(self, callback, args):
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    callback(*args)
+            else:
+                callback(*args)
+        except Exception as e:
+            log.exception("[SCHEDULER] Lỗi khi chạy job: %s: %s", type(e).__name__, e)
+
+
+round_scheduler = RoundScheduler()